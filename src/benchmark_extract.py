@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from TexSoup import TexSoup
+
+from extract import (
+    parse_biblatex_file,
+    parse_latex_file,
+    replace_symbols,
+    tables_to_html,
+)
+
+# Reference implementation based on a full TexSoup parse, as used before the scanner
+
+URL_COUNTER = 1
+
+
+def text_to_url_texsoup(text, bib_data):
+    global URL_COUNTER
+    try:
+        entry = bib_data[text]
+    except KeyError:
+        entry = None
+    try:
+        url = entry["url"]
+    except (TypeError, KeyError):
+        try:
+            url = "https://doi.org/" + entry["doi"]
+        except (TypeError, KeyError):
+            url = None
+
+    if url:
+        tooltip = replace_symbols(entry.get("title", "Title not found"))
+        text = f'<a href="{url}" target="_blank" class="tooltip">[{URL_COUNTER}]<span class="tooltiptext">{tooltip}</span></a>'
+        URL_COUNTER += 1
+    return text
+
+
+def parse_tabular_texsoup(tabular, bib_data):
+    entries = []
+    sep = "§§"
+    text = sep.join(tabular.text)
+    rows = text.split(r"\\")
+    header = rows[0]
+    col_names = [name.replace(sep, "").strip() for name in header.split("&")]
+    col_names[0] = col_names[0].rsplit("\n")[1]
+    for row in rows[1:]:
+        record = []
+        cols = row.split("&")
+        if len(cols) > 2:
+            for col in cols:
+                items = [text.strip().replace("\n", " ") for text in col.split(sep)]
+                entry = [
+                    text_to_url_texsoup(text, bib_data) for text in items if text != ""
+                ]
+                entry = " ".join(entry)
+                record.append(entry)
+            entries.append(record)
+    return col_names, entries
+
+
+def parse_latex_file_texsoup(filepath, bib_data):
+    global URL_COUNTER
+    URL_COUNTER = 1
+    with open(filepath) as f:
+        soup = TexSoup(f)
+    tables = soup.find_all("xltabular")
+    parsed_tables = [parse_tabular_texsoup(t, bib_data) for t in tables]
+    return parsed_tables
+
+
+# Functions for benchmarking
+
+
+def scale_tables(text, factor):
+    # Repeats the rows of every xltabular environment to mimic a larger survey
+    parts = text.split(r"\end{xltabular}")
+    scaled = []
+    for part in parts[:-1]:
+        begin = part.index(r"\begin{xltabular}")
+        first = part.index(r"\\", begin) + 2
+        last = part.rindex(r"\\") + 2
+        scaled.append(part[:last] + part[first:last] * (factor - 1) + part[last:])
+    scaled.append(parts[-1])
+    return r"\end{xltabular}".join(scaled)
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the xltabular scanner of extract.py with a full TexSoup parse."
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement")
+    parser.add_argument(
+        "--scale",
+        type=int,
+        nargs="+",
+        default=[1, 10],
+        help="factors by which the rows of every table are repeated",
+    )
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        bib_data = parse_biblatex_file("bmkg.bib")
+    with open("bmkg.tex") as f:
+        text = f.read()
+
+    print(
+        f"{'scale':<8}{'rows':<10}{'TexSoup [s]':<14}{'scanner [s]':<14}{'speedup':<10}"
+    )
+    print("=" * 56)
+    with tempfile.TemporaryDirectory() as dirpath:
+        for factor in args.scale:
+            filepath = os.path.join(dirpath, f"bmkg_x{factor}.tex")
+            with open(filepath, "w") as f:
+                f.write(scale_tables(text, factor))
+            time_texsoup, tables_texsoup = measure(
+                lambda: parse_latex_file_texsoup(filepath, bib_data), args.repeat
+            )
+            time_scanner, tables_scanner = measure(
+                lambda: parse_latex_file(filepath, bib_data), args.repeat
+            )
+            if tables_to_html(tables_texsoup) != tables_to_html(tables_scanner):
+                raise ValueError(f"HTML output differs at scale {factor}.")
+            num_rows = sum(len(entries) for _, entries in tables_scanner)
+            speedup = time_texsoup / time_scanner
+            print(
+                f"{factor:<8}{num_rows:<10}{time_texsoup:<14.3f}{time_scanner:<14.4f}{speedup:<10.1f}"
+            )
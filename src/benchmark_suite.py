@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "notebooks")
+)
+
+import shared_bmkg as sb
+from benchmark_extract import scale_tables
+from extract import parse_biblatex_file, parse_latex_file, tables_to_html
+
+# Synthetic knowledge graphs
+# - Node and edge types follow a Zipf-like distribution, as in PrimeKG or Monarch where a few
+#   types (genes, phenotypes) dominate
+# - Edge endpoints are drawn with a power-law skew, so a small number of nodes become hubs
+# - Properties are sparse: most nodes have a name, fewer a description or synonyms
+
+NODE_TYPES = [
+    ("gene/protein", "NCBIGene"),
+    ("phenotype", "HP"),
+    ("disease", "MONDO"),
+    ("biological_process", "GO"),
+    ("anatomy", "UBERON"),
+    ("drug", "DrugBank"),
+    ("molecular_function", "GO"),
+    ("cellular_component", "GO"),
+    ("pathway", "REACT"),
+    ("exposure", "CTD"),
+]
+
+EDGE_TYPES = [
+    "interacts_with",
+    "has_phenotype",
+    "expressed_in",
+    "participates_in",
+    "associated_with",
+    "subclass_of",
+    "enables",
+    "located_in",
+    "treats",
+    "contraindicated_for",
+    "side_effect_of",
+    "target_of",
+    "part_of",
+    "causes",
+    "correlated_with",
+]
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ri", "sa", "to", "vu", "zen", "phos", "gly"]
+
+
+def zipf_weights(num_values, exponent=1.2):
+    weights = 1.0 / np.arange(1, num_values + 1) ** exponent
+    return weights / weights.sum()
+
+
+def generate_synthetic_kg(num_edges, seed=0, edges_per_node=8):
+    rng = np.random.default_rng(seed)
+    num_nodes = max(num_edges // edges_per_node, 10)
+
+    # Nodes
+    node_type_codes = rng.choice(
+        len(NODE_TYPES), num_nodes, p=zipf_weights(len(NODE_TYPES))
+    )
+    has_name = rng.random(num_nodes) < 0.9
+    has_description = rng.random(num_nodes) < 0.3
+    has_synonyms = rng.random(num_nodes) < 0.1
+    words = rng.choice(SYLLABLES, (num_nodes, 3))
+    nodes = []
+    for i in range(num_nodes):
+        node_type, prefix = NODE_TYPES[node_type_codes[i]]
+        properties = {}
+        if has_name[i]:
+            properties["name"] = "".join(words[i]) + f" {i}"
+        if has_description[i]:
+            properties["description"] = f"A {node_type} described in source {i % 97}"
+        if has_synonyms[i]:
+            properties["synonyms"] = ["".join(words[i][:2]), "".join(words[i][1:])]
+        nodes.append((f"{prefix}:{i:07d}", node_type, properties))
+
+    # Edges, hubs are spread over all node types by a random permutation
+    permutation = rng.permutation(num_nodes)
+    sources = permutation[(num_nodes * rng.random(num_edges) ** 3).astype(np.int64)]
+    targets = permutation[(num_nodes * rng.random(num_edges) ** 1.5).astype(np.int64)]
+    edge_type_codes = rng.choice(
+        len(EDGE_TYPES), num_edges, p=zipf_weights(len(EDGE_TYPES))
+    )
+    has_source = rng.random(num_edges) < 0.2
+    has_score = rng.random(num_edges) < 0.05
+    scores = rng.random(num_edges).round(3)
+    edges = []
+    for i in range(num_edges):
+        properties = {}
+        if has_source[i]:
+            properties["source"] = "synthetic_db"
+        if has_score[i]:
+            properties["score"] = float(scores[i])
+        edges.append(
+            (
+                nodes[sources[i]][0],
+                nodes[targets[i]][0],
+                EDGE_TYPES[edge_type_codes[i]],
+                properties,
+            )
+        )
+    return nodes, edges
+
+
+def kg_to_dataframes(nodes, edges):
+    df_nodes = pd.DataFrame(
+        [
+            {"id": node_id, "type": node_type, **props}
+            for node_id, node_type, props in nodes
+        ]
+    )
+    df_edges = pd.DataFrame(
+        [
+            {"source_id": source_id, "target_id": target_id, "type": edge_type, **props}
+            for source_id, target_id, edge_type, props in edges
+        ]
+    )
+    return df_nodes, df_edges
+
+
+# Benchmarks
+# - Each benchmark is a function of a shared context that returns the number of processed rows
+# - Contexts are created once per scale, every benchmark runs in a forked child process so that
+#   its peak memory is not inflated by the benchmarks before it
+
+
+def create_context(num_edges, seed, workdir):
+    nodes, edges = generate_synthetic_kg(num_edges, seed)
+    graph = sb.create_graph(nodes, edges)
+    degrees = np.asarray(graph.degree())
+    rng = np.random.default_rng(seed)
+    seeds = [
+        graph.vs[int(i)]["name"] for i in rng.choice(graph.vcount(), 20, replace=False)
+    ]
+    hub = graph.vs[int(degrees.argmax())]["name"]
+    subgraph = sb.get_egocentric_subgraph(graph, hub)
+    context = {
+        "nodes": nodes,
+        "edges": edges,
+        "graph": graph,
+        "seeds": seeds,
+        "hub": hub,
+        "subgraph": subgraph,
+        "workdir": workdir,
+    }
+    return context
+
+
+def bench_create_graph_from_tuples(context):
+    sb.create_graph(context["nodes"], context["edges"])
+    return len(context["edges"])
+
+
+def bench_create_graph_from_dataframes(context):
+    df_nodes, df_edges = kg_to_dataframes(context["nodes"], context["edges"])
+    sb.create_graph(df_nodes, df_edges)
+    return len(context["edges"])
+
+
+def bench_export_nodes_as_csv(context):
+    sb.export_nodes_as_csv(context["nodes"], context["workdir"], "bench")
+    return len(context["nodes"])
+
+
+def bench_export_edges_as_csv(context):
+    sb.export_edges_as_csv(context["edges"], context["workdir"], "bench")
+    return len(context["edges"])
+
+
+def bench_export_graph_as_graphml(context):
+    sb.export_graph_as_graphml(context["graph"], context["workdir"], "bench")
+    return context["graph"].ecount()
+
+
+def bench_filter_nodes_by_subgraph(context):
+    return len(list(sb.filter_nodes_by_subgraph(context["nodes"], context["subgraph"])))
+
+
+def bench_filter_edges_by_subgraph(context):
+    return len(list(sb.filter_edges_by_subgraph(context["edges"], context["subgraph"])))
+
+
+def bench_list_nodes_matching_substring(context):
+    # Ids are searched by default, the name property is stored as "_name" on the graph
+    queries = [
+        ("MONDO:00001", None),
+        ("GO:", None),
+        ("kalo", "_name"),
+        ("zen 1", "_name"),
+    ]
+    num_rows = 0
+    for query, target in queries:
+        num_rows += len(
+            sb.list_nodes_matching_substring(
+                context["graph"], query, target=target, verbose=False
+            )
+        )
+    return num_rows
+
+
+def bench_create_search_index(context):
+    return len(sb.create_search_index(context["graph"])["offsets"]) - 1
+
+
+def bench_create_adjacency_index(context):
+    return len(sb.create_adjacency_index(context["graph"])["edge_type_codes"])
+
+
+def bench_get_egocentric_subgraph(context):
+    num_rows = 0
+    for seed in context["seeds"]:
+        num_rows += sb.get_egocentric_subgraph(context["graph"], seed, order=2).ecount()
+    return num_rows
+
+
+def bench_get_paths_subgraph(context):
+    num_rows = 0
+    for source, target in zip(context["seeds"][::2], context["seeds"][1::2]):
+        num_rows += sb.get_paths_subgraph(context["graph"], source, target).ecount()
+    return num_rows
+
+
+def bench_extract_table_pipeline(context):
+    srcdir = os.path.dirname(os.path.abspath(__file__))
+    filepath = os.path.join(context["workdir"], "bmkg_scaled.tex")
+    with open(os.path.join(srcdir, "bmkg.tex")) as f:
+        text = f.read()
+    with open(filepath, "w") as f:
+        f.write(scale_tables(text, context["table_scale"]))
+    bib_data = parse_biblatex_file(os.path.join(srcdir, "bmkg.bib"))
+    tex_data = parse_latex_file(filepath, bib_data)
+    tables_to_html(tex_data)
+    return sum(len(entries) for _, entries in tex_data)
+
+
+BENCHMARKS = {
+    "create_graph_from_tuples": bench_create_graph_from_tuples,
+    "create_graph_from_dataframes": bench_create_graph_from_dataframes,
+    "export_nodes_as_csv": bench_export_nodes_as_csv,
+    "export_edges_as_csv": bench_export_edges_as_csv,
+    "export_graph_as_graphml": bench_export_graph_as_graphml,
+    "filter_nodes_by_subgraph": bench_filter_nodes_by_subgraph,
+    "filter_edges_by_subgraph": bench_filter_edges_by_subgraph,
+    "list_nodes_matching_substring": bench_list_nodes_matching_substring,
+    "create_search_index": bench_create_search_index,
+    "create_adjacency_index": bench_create_adjacency_index,
+    "get_egocentric_subgraph": bench_get_egocentric_subgraph,
+    "get_paths_subgraph": bench_get_paths_subgraph,
+    "extract_table_pipeline": bench_extract_table_pipeline,
+}
+
+
+# Measurement
+
+
+def get_peak_rss_mib():
+    # ru_maxrss is reported in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def clear_graph_indexes(context):
+    # Search and adjacency indexes are built lazily and kept on the graph, so without this
+    # only the first run of a query benchmark would include building them
+    for key in ("graph", "subgraph"):
+        context[key].__dict__.pop("_search_indexes", None)
+        context[key].__dict__.pop("_adjacency_indexes", None)
+
+
+def measure_benchmark(name, context, repeat):
+    function = BENCHMARKS[name]
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Warm-up run under tracemalloc, which slows Python allocations down
+        clear_graph_indexes(context)
+        tracemalloc.start()
+        num_rows = function(context)
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for _ in range(repeat):
+            clear_graph_indexes(context)
+            start = time.perf_counter()
+            function(context)
+            timings.append(time.perf_counter() - start)
+    result = {
+        "time": min(timings),
+        "traced_peak_mib": traced_peak / (1024 * 1024),
+        "peak_rss_mib": get_peak_rss_mib(),
+        "rows": num_rows,
+    }
+    return result
+
+
+def run_in_child(connection, name, context, repeat):
+    try:
+        connection.send(measure_benchmark(name, context, repeat))
+    except Exception as exc:
+        connection.send({"error": f"{type(exc).__name__}: {exc}"})
+    finally:
+        connection.close()
+
+
+def run_benchmark(name, context, repeat):
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return measure_benchmark(name, context, repeat)
+    mp_context = multiprocessing.get_context("fork")
+    receiver, sender = mp_context.Pipe(duplex=False)
+    process = mp_context.Process(
+        target=run_in_child, args=(sender, name, context, repeat)
+    )
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {"error": f"child process exited with code {process.exitcode}"}
+    process.join()
+    return result
+
+
+# Result tracking
+
+
+def get_git_commit():
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def read_results(filepath):
+    if not os.path.isfile(filepath):
+        return []
+    with open(filepath) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(results, num_edges, name):
+    # Most recent earlier measurement of the same benchmark at the same scale
+    for record in reversed(results):
+        if record["num_edges"] == num_edges and name in record["benchmarks"]:
+            measurement = record["benchmarks"][name]
+            if "error" not in measurement:
+                return measurement
+    return None
+
+
+def check_regression(measurement, baseline, time_threshold, memory_threshold, min_time):
+    problems = []
+    if baseline is None or "error" in measurement:
+        return problems
+    if (
+        measurement["time"] > baseline["time"] * time_threshold
+        and measurement["time"] - baseline["time"] > min_time
+    ):
+        problems.append(f"time {baseline['time']:.3f}s -> {measurement['time']:.3f}s")
+    if (
+        measurement["traced_peak_mib"] > baseline["traced_peak_mib"] * memory_threshold
+        and measurement["traced_peak_mib"] - baseline["traced_peak_mib"] > 1
+    ):
+        problems.append(
+            f"traced peak {baseline['traced_peak_mib']:.1f} MiB -> {measurement['traced_peak_mib']:.1f} MiB"
+        )
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks of shared_bmkg and extract.py on synthetic knowledge graphs."
+    )
+    parser.add_argument(
+        "--edges",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000],
+        help="numbers of edges of the generated graphs, e.g. 10000 up to 10000000",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="timed runs per benchmark"
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run"
+    )
+    parser.add_argument(
+        "--table-scale",
+        type=int,
+        default=10,
+        help="factor by which the rows of the report's tables are repeated",
+    )
+    parser.add_argument(
+        "--results",
+        default="benchmark_results.jsonl",
+        help="JSON-lines file that collects the results of all runs",
+    )
+    parser.add_argument(
+        "--baseline",
+        help="JSON-lines file to compare against, by default the earlier runs in --results",
+    )
+    parser.add_argument("--time-threshold", type=float, default=1.25)
+    parser.add_argument("--memory-threshold", type=float, default=1.25)
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.05,
+        help="time differences below this many seconds are never reported",
+    )
+    parser.add_argument(
+        "--no-save", action="store_true", help="do not append this run to --results"
+    )
+    args = parser.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    baseline_results = read_results(args.baseline or args.results)
+    info = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": get_git_commit(),
+        "python": platform.python_version(),
+        "igraph": sb.ig.__version__,
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+    }
+    regressions = []
+    for num_edges in args.edges:
+        with tempfile.TemporaryDirectory() as workdir:
+            start = time.perf_counter()
+            context = create_context(num_edges, args.seed, workdir)
+            context["table_scale"] = args.table_scale
+            print(
+                f"Generated a graph with {context['graph'].vcount()} nodes and "
+                f"{context['graph'].ecount()} edges in {time.perf_counter() - start:.1f}s."
+            )
+            print(
+                f"{'benchmark':<32}{'time [s]':<12}{'traced [MiB]':<14}{'RSS [MiB]':<12}{'rows':<12}"
+            )
+            print("=" * 82)
+            measurements = {}
+            for name in names:
+                measurement = run_benchmark(name, context, args.repeat)
+                measurements[name] = measurement
+                if "error" in measurement:
+                    print(f"{name:<32}{measurement['error']}")
+                    continue
+                print(
+                    f"{name:<32}{measurement['time']:<12.3f}{measurement['traced_peak_mib']:<14.1f}"
+                    f"{measurement['peak_rss_mib']:<12.1f}{measurement['rows']:<12}"
+                )
+                baseline = find_baseline(baseline_results, num_edges, name)
+                for problem in check_regression(
+                    measurement,
+                    baseline,
+                    args.time_threshold,
+                    args.memory_threshold,
+                    args.min_time,
+                ):
+                    regressions.append(f"{name} at {num_edges} edges: {problem}")
+            print()
+        if not args.no_save:
+            record = dict(info, num_edges=num_edges, benchmarks=measurements)
+            with open(args.results, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    if regressions:
+        print("Regressions compared to the baseline:")
+        for regression in regressions:
+            print(f"- {regression}")
+        sys.exit(1)
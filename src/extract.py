@@ -1,11 +1,16 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import argparse
+import hashlib
+import html
+import json
 import os
+import pickle
+import re
 
 import bibtexparser
 import pandas as pd
-from TexSoup import TexSoup
 
 
 # Functions for parsing the BibLaTeX bibliography
@@ -25,8 +30,25 @@ def parse_biblatex_file(filepath):
 
 
 # Functions for parsing the LaTeX report
+# - xltabular environments are located and tokenized with precompiled patterns instead of a full TexSoup parse
+# - Text is split into items at commands and braces, the same way TexSoup's text property splits it
+# - Citation numbers are explicit state: functions take the next free number and return the updated one
 
-URL_COUNTER = 1
+ENVIRONMENT_PATTERN = re.compile(r"(?<!\\)%[^\n]*|\\(begin|end)\{([^}]*)\}")
+
+TABULAR_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<comment>(?<!\\)%[^\n]*)
+    |(?P<row>\\\\)
+    |(?P<cell>&)
+    |(?P<text>(?:[^\\&{}$%]|\\[^a-zA-Z\\])+)
+    |(?P<boundary>\\[a-zA-Z]+\*?|[{}$])
+    """,
+    re.VERBOSE,
+)
+
+TABULAR_BEGIN = r"\begin{xltabular}"
+TABULAR_END = r"\end{xltabular}"
 
 
 def replace_symbols(text):
@@ -42,58 +64,121 @@ def replace_symbols(text):
     return text
 
 
-def text_to_url(text, bib_data):
-    global URL_COUNTER
-    try:
-        entry = bib_data[text]
-    except KeyError:
-        entry = None
-    try:
-        url = entry["url"]
-    except (TypeError, KeyError):
-        try:
+def find_reference(text, bib_data):
+    entry = bib_data.get(text)
+    url = None
+    if entry is not None:
+        if "url" in entry:
+            url = entry["url"]
+        elif "doi" in entry:
             url = "https://doi.org/" + entry["doi"]
-        except (TypeError, KeyError):
-            url = None
+    if not url:
+        return None
+    tooltip = replace_symbols(entry.get("title", "Title not found"))
+    return url, tooltip
 
-    if url:
-        tooltip = replace_symbols(entry.get("title", "Title not found"))
-        text = f'<a href="{url}" target="_blank" class="tooltip">[{URL_COUNTER}]<span class="tooltiptext">{tooltip}</span></a>'
-        URL_COUNTER += 1
-    return text
 
+def text_to_url(text, bib_data, url_counter):
+    reference = find_reference(text, bib_data)
+    if reference:
+        url, tooltip = reference
+        text = f'<a href="{url}" target="_blank" class="tooltip">[{url_counter}]<span class="tooltiptext">{tooltip}</span></a>'
+        url_counter += 1
+    return text, url_counter
 
-def parse_tabular(tabular, bib_data):
-    entries = []
-    sep = "§§"
-    text = sep.join(tabular.text)
-    rows = text.split(r"\\")
-    header = rows[0]
-    col_names = [name.replace(sep, "").strip() for name in header.split("&")]
+
+def find_xltabular_sources(text):
+    # Same order as TexSoup's find_all: shallower environments first, then by position
+    found = []
+    depth = 0
+    start = None
+    for match in ENVIRONMENT_PATTERN.finditer(text):
+        command, environment = match.groups()
+        if command == "begin":
+            if environment == "xltabular":
+                start = (depth, match.start())
+            depth += 1
+        elif command == "end":
+            depth -= 1
+            if environment == "xltabular" and start is not None:
+                found.append((start[0], start[1], text[start[1] : match.end()]))
+                start = None
+    return [source for _, _, source in sorted(found)]
+
+
+def scan_tabular(source):
+    # Returns the rows of a table, each a list of cells, each a list of raw text items
+    body = source[len(TABULAR_BEGIN) : len(source) - len(TABULAR_END)]
+    rows = []
+    cells = []
+    items = []
+    parts = []
+    for match in TABULAR_TOKEN_PATTERN.finditer(body):
+        kind = match.lastgroup
+        if kind == "text":
+            parts.append(match.group())
+            continue
+        if kind == "comment":
+            continue
+        if parts:
+            items.append("".join(parts))
+            parts = []
+        if kind == "cell":
+            cells.append(items)
+            items = []
+        elif kind == "row":
+            cells.append(items)
+            rows.append(cells)
+            cells = []
+            items = []
+    if parts:
+        items.append("".join(parts))
+    cells.append(items)
+    rows.append(cells)
+    return rows
+
+
+def scan_records(source):
+    # Column names and records of a table, each record a list of cells, each cell a list of text items
+    rows = scan_tabular(source)
+    col_names = ["".join(items).strip() for items in rows[0]]
     col_names[0] = col_names[0].rsplit("\n")[1]
-    for row in rows[1:]:
-        record = []
-        cols = row.split("&")
-        if len(cols) > 2:
-            for col in cols:
-                items = [text.strip().replace("\n", " ") for text in col.split(sep)]
-                entry = [text_to_url(text, bib_data) for text in items if text != ""]
-                entry = " ".join(entry)
-                record.append(entry)
-            entries.append(record)
+    records = []
+    for cells in rows[1:]:
+        if len(cells) > 2:
+            record = []
+            for items in cells:
+                items = [text.strip().replace("\n", " ") for text in items]
+                record.append([text for text in items if text != ""])
+            records.append(record)
+    return col_names, records
+
+
+def parse_tabular(source, bib_data, url_counter=1):
+    col_names, records = scan_records(source)
+    entries = []
+    for record in records:
+        entry = []
+        for items in record:
+            cell = []
+            for text in items:
+                text, url_counter = text_to_url(text, bib_data, url_counter)
+                cell.append(text)
+            entry.append(" ".join(cell))
+        entries.append(entry)
     print(f"Found {len(entries)} records in a table.")
-    return col_names, entries
+    return col_names, entries, url_counter
 
 
 def parse_latex_file(filepath, bib_data):
     with open(filepath) as f:
-        soup = TexSoup(f)
-    tables = soup.find_all("xltabular")
-    print(f"Found {len(tables)} tables in the LaTeX file.")
-    # for i, table in enumerate(tables, 1):
-    #    print(i, str(table)[:150])
-    #    print()
-    parsed_tables = [parse_tabular(t, bib_data) for t in tables]
+        sources = find_xltabular_sources(f.read())
+    print(f"Found {len(sources)} tables in the LaTeX file.")
+    parsed_tables = []
+    url_counter = 1
+    for source in sources:
+        col_names, entries, url_counter = parse_tabular(source, bib_data, url_counter)
+        parsed_tables.append((col_names, entries))
     return parsed_tables
 
 
@@ -131,14 +216,17 @@ def table_to_html(data):
 
 def tables_to_html(tex_data):
     html_tables = [table_to_html(table) for table in tex_data]
+    return html_tables_to_page(html_tables)
 
+
+def html_tables_to_page(html_tables, head='<script src="sorttable.js"></script>'):
     html_template = """<!DOCTYPE html>
 <html lang="en-US">
 <head>
 <meta charset="UTF-8">
 <meta name="viewport" content="width=device-width, initial-scale=1">
 <title>Biomedical knowledge graphs</title>
-<script src="sorttable.js"></script>
+{head}
 <style>
 body {{
     margin: 2vh 4vw;
@@ -272,6 +360,7 @@ Other content of the report is not included here, in particular a section about
 """
 
     html_text = html_template.format(
+        head=head,
         table_databases=html_tables[3],
         table_ontologies=html_tables[0],
         table_bkgs=html_tables[1],
@@ -281,17 +370,292 @@ Other content of the report is not included here, in particular a section about
     return html_text
 
 
-# Read the LaTeX report and the BibLaTeX bibliography
-name = "bmkg"
-source_filepath_tex = f"{name}.tex"
-source_filepath_bib = f"{name}.bib"
-target_filepath = os.path.join("..", "target", f"{name}.html")
+# Functions for creating the lazy-loading HTML file
+# - Each table is embedded as a JSON payload and rendered by lazytable.js, which only keeps visible rows in the DOM
+# - Cells are lists of text segments and citation numbers, citations share one list of (url, tooltip) pairs
+# - Sort orders for every column are precomputed with the same keys sorttable.js derives from the static table
+
+SORT_NUMERIC_PATTERN = re.compile(r"^-?[£$€]?[\d,.]+%?$")
+SORT_DATE_PATTERN = re.compile(r"^(\d\d?)[\/\.-](\d\d?)[\/\.-]((\d\d)?\d\d)$")
+FLOAT_PREFIX_PATTERN = re.compile(r"^-?(\d+\.?\d*|\.\d+)")
+TAG_PATTERN = re.compile(r"<[^>]*>")
+
+
+def html_to_text(fragment):
+    return html.unescape(TAG_PATTERN.sub("", fragment))
+
+
+def guess_sort_type(texts):
+    # Decided by the first non-empty cell, as in sorttable.guessType
+    sort_type = "alpha"
+    for text in texts:
+        if text != "":
+            if SORT_NUMERIC_PATTERN.match(text):
+                return "numeric"
+            match = SORT_DATE_PATTERN.match(text)
+            if match:
+                if int(match.group(1)) > 12:
+                    return "ddmm"
+                elif int(match.group(2)) > 12:
+                    return "mmdd"
+                sort_type = "ddmm"
+    return sort_type
+
+
+def sort_key(text, sort_type):
+    if sort_type == "numeric":
+        match = FLOAT_PREFIX_PATTERN.match(re.sub(r"[^0-9.-]", "", text))
+        return float(match.group()) if match else 0.0
+    if sort_type in ("ddmm", "mmdd"):
+        match = SORT_DATE_PATTERN.match(text)
+        if not match:
+            return ""
+        first, second, year = match.group(1), match.group(2), match.group(3)
+        day, month = (first, second) if sort_type == "ddmm" else (second, first)
+        return year + month.zfill(2) + day.zfill(2)
+    return text
+
+
+def sort_orders(columns):
+    orders = []
+    for texts in columns:
+        sort_type = guess_sort_type(texts)
+        keys = [sort_key(text, sort_type) for text in texts]
+        orders.append(sorted(range(len(keys)), key=keys.__getitem__))
+    return orders
+
+
+def parse_tabular_as_payload(source, bib_data, references):
+    col_names, records = scan_records(source)
+    rows = []
+    columns = [[str(i) for i in range(1, len(records) + 1)]]
+    columns.extend([] for _ in col_names)
+    for record in records:
+        row = []
+        for items, texts in zip(record, columns[1:]):
+            cell = []
+            sort_texts = []
+            for text in items:
+                reference = find_reference(text, bib_data)
+                if reference:
+                    references.append(reference)
+                    cell.append(len(references))
+                    sort_texts.append(
+                        f"[{len(references)}]{html_to_text(reference[1])}"
+                    )
+                else:
+                    cell.append(text)
+                    sort_texts.append(html_to_text(text))
+            row.append(cell)
+            texts.append(" ".join(sort_texts).strip())
+        rows.append(row)
+    print(f"Found {len(rows)} records in a table.")
+    payload = {"columns": col_names, "rows": rows, "orders": sort_orders(columns)}
+    return payload
+
+
+def to_script_json(data):
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return text.replace("</", "<\\/")
+
+
+def payload_to_html(payload, number):
+    out = []
+    out.append(f'<div class="cont" data-lazy-table="{number}">')
+    out.append('<table class="lazy">')
+    out.append("<thead>")
+    out.append("<tr>")
+    out.append("<th>#</th>")
+    out.append("\n".join(f"<th>{name}</th>" for name in payload["columns"]))
+    out.append("</tr>")
+    out.append("</thead>")
+    out.append("<tbody></tbody>")
+    out.append("</table>")
+    out.append(
+        '<noscript><p>This table needs JavaScript. A <a href="bmkg_static.html">static version</a> of this page is available.</p></noscript>'
+    )
+    out.append("</div>")
+    out.append(
+        f'<script type="application/json" id="lazy-table-{number}">{to_script_json(payload)}</script>'
+    )
+    html_table = "\n".join(out)
+    return html_table
+
+
+def create_lazy_html(filepath_tex, bib_data):
+    with open(filepath_tex) as f:
+        sources = find_xltabular_sources(f.read())
+    print(f"Found {len(sources)} tables in the LaTeX file.")
+    references = []
+    html_tables = [
+        payload_to_html(parse_tabular_as_payload(source, bib_data, references), i)
+        for i, source in enumerate(sources, 1)
+    ]
+    head = f"""<script src="lazytable.js" defer></script>
+<script type="application/json" id="lazy-references">{to_script_json(references)}</script>
+<style>
+table.lazy th {{
+    cursor: pointer;
+}}
+table.lazy tbody tr.odd {{
+    background-color: #f1f1f1;
+}}
+table.lazy tbody tr.even {{
+    background-color: #f8f8f8;
+}}
+table.lazy tbody tr.spacer td {{
+    padding: 0;
+    border: 0;
+}}
+.lazy-tooltip {{
+    display: none;
+    z-index: 1000;
+    position: fixed;
+    width: 30em;
+    padding: 5px;
+    border-radius: 3px;
+    background-color: #333;
+    color: white;
+    font-size: 0.8em;
+    font-family: sans-serif;
+}}
+</style>"""
+    return html_tables_to_page(html_tables, head)
+
+
+# Functions for incremental builds
+# - Cached results are only reused if this script, the bibliography and the table source are unchanged
+# - A table's rendered HTML also depends on the citation number it starts with, so that is part of its key
+
+CACHE_DIRPATH = ".extract_cache"
+
+
+def hash_file(filepath):
+    with open(filepath, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load_cache(filepath):
+    try:
+        with open(filepath, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return {}
+
+
+def save_cache(filepath, data):
+    temp_filepath = f"{filepath}.tmp{os.getpid()}"
+    with open(temp_filepath, "wb") as f:
+        pickle.dump(data, f)
+    os.replace(temp_filepath, filepath)
+
+
+def parse_biblatex_file_cached(filepath, cache_dirpath, version):
+    key = hash_text(f"{version}\n{hash_file(filepath)}")
+    cache_filepath = os.path.join(cache_dirpath, "bib.pickle")
+    cache = load_cache(cache_filepath)
+    if cache.get("key") == key:
+        bib_data = cache["bib_data"]
+        print(f"Reusing {len(bib_data)} cached entries of the BibLaTeX file.")
+        return bib_data
+    bib_data = parse_biblatex_file(filepath)
+    save_cache(cache_filepath, {"key": key, "bib_data": bib_data})
+    return bib_data
+
+
+def create_html_incrementally(filepath_tex, filepath_bib, cache_dirpath):
+    os.makedirs(cache_dirpath, exist_ok=True)
+    version = hash_file(os.path.abspath(__file__))
+    bib_hash = hash_file(filepath_bib)
+    bib_data = None
+    with open(filepath_tex) as f:
+        sources = find_xltabular_sources(f.read())
+    print(f"Found {len(sources)} tables in the LaTeX file.")
+
+    cache_filepath = os.path.join(cache_dirpath, "tables.pickle")
+    cache = load_cache(cache_filepath)
+    used_cache = {}
+    html_tables = []
+    url_counter = 1
+    for i, source in enumerate(sources, 1):
+        key = hash_text(f"{version}\n{bib_hash}\n{url_counter}\n{source}")
+        if key in cache:
+            html_table, num_urls = cache[key]
+            print(f"Reusing the cached HTML of table {i}.")
+        else:
+            # The bibliography is only needed when at least one table has to be rendered again
+            if bib_data is None:
+                bib_data = parse_biblatex_file_cached(
+                    filepath_bib, cache_dirpath, version
+                )
+            col_names, entries, next_counter = parse_tabular(
+                source, bib_data, url_counter
+            )
+            html_table = table_to_html((col_names, entries))
+            num_urls = next_counter - url_counter
+        url_counter += num_urls
+        used_cache[key] = (html_table, num_urls)
+        html_tables.append(html_table)
+    save_cache(cache_filepath, used_cache)
+    return html_tables_to_page(html_tables)
+
+
+def write_if_changed(filepath, text):
+    # Keeps the modification time of the target stable if the content did not change
+    try:
+        with open(filepath) as f:
+            if f.read() == text:
+                print(f"{filepath} is up to date.")
+                return False
+    except OSError:
+        pass
+    with open(filepath, "w") as f:
+        f.write(text)
+    return True
+
+
+if __name__ == "__main__":
+    # Read the LaTeX report and the BibLaTeX bibliography
+    parser = argparse.ArgumentParser(
+        description="Create the HTML version of the report's tables."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore cached results and parse everything again",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="create a lazy-loading page, with the static page as bmkg_static.html",
+    )
+    args = parser.parse_args()
 
-bib_data = parse_biblatex_file(source_filepath_bib)
-tex_data = parse_latex_file(source_filepath_tex, bib_data)
+    name = "bmkg"
+    source_filepath_tex = f"{name}.tex"
+    source_filepath_bib = f"{name}.bib"
+    target_filepath = os.path.join("..", "target", f"{name}.html")
+    static_filepath = os.path.join("..", "target", f"{name}_static.html")
 
+    if args.full:
+        bib_data = parse_biblatex_file(source_filepath_bib)
+        tex_data = parse_latex_file(source_filepath_tex, bib_data)
+        html_text = tables_to_html(tex_data)
+    else:
+        html_text = create_html_incrementally(
+            source_filepath_tex, source_filepath_bib, CACHE_DIRPATH
+        )
 
-# Create the HTML file
-html_text = tables_to_html(tex_data)
-with open(target_filepath, "w") as f:
-    f.write(html_text)
+    # Create the HTML file
+    if args.lazy:
+        write_if_changed(static_filepath, html_text)
+        if not args.full:
+            bib_data = parse_biblatex_file_cached(
+                source_filepath_bib, CACHE_DIRPATH, hash_file(os.path.abspath(__file__))
+            )
+        html_text = create_lazy_html(source_filepath_tex, bib_data)
+    write_if_changed(target_filepath, html_text)
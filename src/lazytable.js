@@ -0,0 +1,263 @@
+/*
+  Lazy rendering of the tables created by "python extract.py --lazy"
+
+  - Table data is read from JSON payloads embedded in the page, a table is only set up
+    once its container comes close to the viewport
+  - Only the rows near the visible part of a scrolled container are in the DOM, the
+    remaining rows are represented by two spacer rows whose heights are derived from
+    measured (or estimated) row heights
+  - Sorting applies the permutations precomputed for every column, clicking the same
+    column again reverses the order like sorttable.js does
+  - Citation tooltips are created on demand in a single shared element
+*/
+
+var lazytable = {
+  OVERSCAN: 800, // pixels rendered above and below the visible part of a container
+  ESTIMATED_ROW_HEIGHT: 40,
+  references: [],
+  tooltip: null,
+
+  init: function() {
+    var element = document.getElementById("lazy-references");
+    lazytable.references = element ? JSON.parse(element.textContent) : [];
+    lazytable.initTooltip();
+
+    var containers = document.querySelectorAll("div[data-lazy-table]");
+    if (!("IntersectionObserver" in window)) {
+      for (var i = 0; i < containers.length; i++) {
+        lazytable.setup(containers[i]);
+      }
+      return;
+    }
+    var observer = new IntersectionObserver(function(entries) {
+      for (var i = 0; i < entries.length; i++) {
+        if (entries[i].isIntersecting) {
+          observer.unobserve(entries[i].target);
+          lazytable.setup(entries[i].target);
+        }
+      }
+    }, {rootMargin: "100% 0px"});
+    for (var i = 0; i < containers.length; i++) {
+      observer.observe(containers[i]);
+    }
+  },
+
+  setup: function(container) {
+    var number = container.getAttribute("data-lazy-table");
+    var data = JSON.parse(document.getElementById("lazy-table-" + number).textContent);
+    var numRows = data.rows.length;
+    var state = {
+      container: container,
+      tbody: container.querySelector("tbody"),
+      data: data,
+      numColumns: data.columns.length + 1,
+      order: data.orders[0].slice(),
+      sortedColumn: null,
+      reversed: false,
+      heights: new Float64Array(numRows),
+      measured: new Uint8Array(numRows),
+      estimate: lazytable.ESTIMATED_ROW_HEIGHT,
+      first: -1,
+      last: -1,
+      scheduled: false,
+    };
+    state.heights.fill(state.estimate);
+
+    var headers = container.querySelectorAll("thead th");
+    for (var i = 0; i < headers.length; i++) {
+      headers[i].addEventListener("click", lazytable.sortHandler(state, headers, i));
+    }
+    var schedule = function() {
+      if (!state.scheduled) {
+        state.scheduled = true;
+        window.requestAnimationFrame(function() {
+          state.scheduled = false;
+          lazytable.render(state, false);
+        });
+      }
+    };
+    container.addEventListener("scroll", schedule);
+    window.addEventListener("resize", schedule);
+    lazytable.render(state, true);
+  },
+
+  sortHandler: function(state, headers, column) {
+    return function() {
+      state.reversed = state.sortedColumn === column ? !state.reversed : false;
+      state.sortedColumn = column;
+      state.order = state.data.orders[column].slice();
+      if (state.reversed) {
+        state.order.reverse();
+      }
+      for (var i = 0; i < headers.length; i++) {
+        var indicator = headers[i].querySelector(".lazy-indicator");
+        if (indicator) {
+          headers[i].removeChild(indicator);
+        }
+      }
+      var indicator = document.createElement("span");
+      indicator.className = "lazy-indicator";
+      indicator.innerHTML = state.reversed ? "&nbsp;&#x25B4;" : "&nbsp;&#x25BE;";
+      headers[column].appendChild(indicator);
+      lazytable.render(state, true);
+    };
+  },
+
+  offsets: function(state) {
+    // offsets[k] is the distance from the top of the table body to the k-th row of the current order
+    var offsets = new Float64Array(state.order.length + 1);
+    for (var k = 0; k < state.order.length; k++) {
+      offsets[k + 1] = offsets[k] + state.heights[state.order[k]];
+    }
+    return offsets;
+  },
+
+  search: function(offsets, value) {
+    // Index of the first offset that is greater than value
+    var low = 0;
+    var high = offsets.length;
+    while (low < high) {
+      var middle = (low + high) >> 1;
+      if (offsets[middle] > value) {
+        high = middle;
+      } else {
+        low = middle + 1;
+      }
+    }
+    return low;
+  },
+
+  window: function(offsets, top, bottom) {
+    var numRows = offsets.length - 1;
+    var first = Math.max(lazytable.search(offsets, top) - 1, 0);
+    var last = Math.min(lazytable.search(offsets, bottom), numRows);
+    return [Math.min(first, last), last];
+  },
+
+  render: function(state, force) {
+    var container = state.container;
+    var offsets = lazytable.offsets(state);
+    var range = lazytable.window(
+      offsets,
+      container.scrollTop - lazytable.OVERSCAN,
+      container.scrollTop + container.clientHeight + lazytable.OVERSCAN
+    );
+    var first = range[0];
+    var last = range[1];
+    if (!force && first === state.first && last === state.last) {
+      return;
+    }
+    state.first = first;
+    state.last = last;
+
+    var out = [lazytable.spacer(state, offsets[first])];
+    for (var k = first; k < last; k++) {
+      var row = state.order[k];
+      var cells = state.data.rows[row];
+      out.push('<tr class="' + (k % 2 ? "even" : "odd") + '">');
+      out.push("<td>" + (row + 1) + "</td>");
+      for (var j = 0; j < cells.length; j++) {
+        out.push("<td>" + lazytable.cellToHtml(cells[j]) + "</td>");
+      }
+      out.push("</tr>");
+    }
+    out.push(lazytable.spacer(state, offsets[offsets.length - 1] - offsets[last]));
+    state.tbody.innerHTML = out.join("");
+    lazytable.measure(state, first);
+  },
+
+  spacer: function(state, height) {
+    return '<tr class="spacer"><td colspan="' + state.numColumns + '" style="height:' + height + 'px"></td></tr>';
+  },
+
+  measure: function(state, first) {
+    // Replaces estimated heights of the rendered rows by their actual heights
+    var rows = state.tbody.rows;
+    var changed = false;
+    for (var j = 1; j < rows.length - 1; j++) {
+      var row = state.order[first + j - 1];
+      var height = rows[j].getBoundingClientRect().height;
+      if (height > 0 && height !== state.heights[row]) {
+        state.heights[row] = height;
+        changed = true;
+      }
+      state.measured[row] = 1;
+    }
+    if (!changed) {
+      return;
+    }
+    var total = 0;
+    var count = 0;
+    for (var i = 0; i < state.heights.length; i++) {
+      if (state.measured[i]) {
+        total += state.heights[i];
+        count += 1;
+      }
+    }
+    state.estimate = count ? total / count : state.estimate;
+    for (var i = 0; i < state.heights.length; i++) {
+      if (!state.measured[i]) {
+        state.heights[i] = state.estimate;
+      }
+    }
+    var offsets = lazytable.offsets(state);
+    rows[0].cells[0].style.height = offsets[state.first] + "px";
+    rows[rows.length - 1].cells[0].style.height =
+      offsets[offsets.length - 1] - offsets[state.last] + "px";
+  },
+
+  cellToHtml: function(cell) {
+    var parts = [];
+    for (var i = 0; i < cell.length; i++) {
+      var segment = cell[i];
+      if (typeof segment === "number") {
+        var reference = lazytable.references[segment - 1];
+        parts.push(
+          '<a href="' + reference[0] + '" target="_blank" class="lazy-reference" data-reference="' +
+          segment + '">[' + segment + "]</a>"
+        );
+      } else {
+        parts.push(segment);
+      }
+    }
+    return parts.join(" ");
+  },
+
+  initTooltip: function() {
+    var tooltip = document.createElement("div");
+    tooltip.className = "lazy-tooltip";
+    document.body.appendChild(tooltip);
+    lazytable.tooltip = tooltip;
+    document.addEventListener("mouseover", function(event) {
+      var link = event.target.closest ? event.target.closest("a.lazy-reference") : null;
+      if (!link) {
+        return;
+      }
+      var reference = lazytable.references[parseInt(link.getAttribute("data-reference")) - 1];
+      var rect = link.getBoundingClientRect();
+      tooltip.innerHTML = reference[1];
+      tooltip.style.display = "block";
+      var width = tooltip.offsetWidth;
+      var left = Math.min(rect.left - width / 2 + rect.width / 2, window.innerWidth - width - 4);
+      tooltip.style.left = Math.max(left, 4) + "px";
+      tooltip.style.top = rect.bottom + 4 + "px";
+    });
+    document.addEventListener("mouseout", function(event) {
+      if (event.target.closest && event.target.closest("a.lazy-reference")) {
+        tooltip.style.display = "none";
+      }
+    });
+  },
+};
+
+if (typeof document !== "undefined") {
+  if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", lazytable.init);
+  } else {
+    lazytable.init();
+  }
+}
+
+if (typeof module !== "undefined") {
+  module.exports = lazytable;
+}
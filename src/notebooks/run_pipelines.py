@@ -0,0 +1,904 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+
+import pandas as pd
+
+import shared_bmkg as sb
+
+# Stages shared by all knowledge graphs
+# - Every file of a download specification gets a cached "fetch" stage that also checks the
+#   MD5 hash, reading stages require the fetch stage of their file
+# - Exports are cached, so a rerun only writes files again if something upstream changed
+# - The schema export summarizes which node types are connected by which edge types
+
+
+def fetch(url, filepath, md5):
+    # A corrupted file is deleted, so it is neither recorded as fresh nor kept by fetch_file
+    sb.create_dir(os.path.dirname(filepath))
+    sb.fetch_file(url, filepath)
+    try:
+        sb.validate_file(filepath, md5, raise_error=True)
+    except ValueError:
+        sb.delete_file(filepath)
+        sb.delete_file(sb.get_md5_cache_filepath(filepath))
+        raise
+    return filepath
+
+
+def add_download_stages(stages, project_name, download_dir, download_specification):
+    for filename, url, md5 in download_specification:
+        filepath = os.path.join(download_dir, filename)
+        stages.append(
+            sb.create_pipeline_stage(
+                f"{project_name}/fetch/{filename}",
+                fetch,
+                params={"url": url, "filepath": filepath, "md5": md5},
+                cache=True,
+                pool="network",
+            )
+        )
+
+
+def add_graph_stages(
+    stages, project_name, results_dir, basename=None, stream_graphml=False
+):
+    # Requires the stages "<project_name>/nodes" and "<project_name>/edges"
+    basename = project_name if basename is None else basename
+    nodes = f"{project_name}/nodes"
+    edges = f"{project_name}/edges"
+    graph = f"{project_name}/graph"
+    params = {"directory": results_dir, "basename": basename}
+    stages += [
+        sb.create_pipeline_stage(
+            f"{project_name}/export/nodes_csv",
+            export_nodes_as_csv,
+            [nodes],
+            params,
+            cache=True,
+        ),
+        sb.create_pipeline_stage(
+            f"{project_name}/export/edges_csv",
+            export_edges_as_csv,
+            [edges],
+            params,
+            cache=True,
+        ),
+        sb.create_pipeline_stage(
+            f"{project_name}/export/schema",
+            export_schema,
+            [nodes, edges],
+            params,
+            cache=True,
+        ),
+    ]
+    params = {"directory": results_dir, "basename": project_name}
+    if stream_graphml:
+        # Compressed GraphML written from the rows, without building the igraph object
+        stages.append(
+            sb.create_pipeline_stage(
+                f"{project_name}/export/graphml",
+                export_nodes_and_edges_as_graphml,
+                [nodes, edges],
+                params,
+                cache=True,
+            )
+        )
+        return
+    stages += [
+        sb.create_pipeline_stage(graph, sb.create_graph, [nodes, edges], pool="memory"),
+        sb.create_pipeline_stage(
+            f"{project_name}/export/graphml",
+            export_graph_as_graphml,
+            [graph],
+            params,
+            cache=True,
+        ),
+    ]
+
+
+def export_nodes_as_csv(nodes, directory, basename):
+    sb.create_dir(directory)
+    return sb.export_nodes_as_csv(nodes, directory, basename)
+
+
+def export_edges_as_csv(edges, directory, basename):
+    sb.create_dir(directory)
+    return sb.export_edges_as_csv(edges, directory, basename)
+
+
+def export_graph_as_graphml(graph, directory, basename):
+    sb.create_dir(directory)
+    return sb.export_graph_as_graphml(graph, directory, basename)
+
+
+def export_nodes_and_edges_as_graphml(nodes, edges, directory, basename):
+    sb.create_dir(directory)
+    return sb.export_nodes_and_edges_as_graphml(nodes, edges, directory, basename)
+
+
+def export_schema(nodes, edges, directory, basename):
+    # Which node types are connected by which edge types, as table and as schema graph
+    df_nodes = pd.DataFrame([node[:2] for node in nodes], columns=["id", "type"])
+    df_edges = pd.DataFrame(
+        [edge[:3] for edge in edges], columns=["source_id", "target_id", "type"]
+    )
+    schema = sb.compute_schema(df_edges, "source_id", "target_id", "type", df_nodes)
+    gs = sb.create_schema_graph(
+        schema,
+        df_nodes["type"].value_counts().to_dict(),
+        df_edges["type"].value_counts().to_dict(),
+    )
+    sb.create_dir(directory)
+    filepaths = [
+        os.path.join(directory, f"{basename}_schema.csv"),
+        os.path.join(directory, f"{basename}_schema.graphml"),
+    ]
+    schema.to_csv(filepaths[0], index=False)
+    gs.write_graphml(filepaths[1])
+    return filepaths
+
+
+def is_nan(val):
+    if isinstance(val, float):
+        return math.isnan(val)
+    return False
+
+
+# HALD
+
+
+HALD_DOWNLOADS = [
+    (
+        "Entity_Info.json",
+        "https://figshare.com/ndownloader/files/43612509",
+        "1746cde24a1bac0460f1ccf646608cc9",
+    ),
+    (
+        "Relation_Info.json",
+        "https://figshare.com/ndownloader/files/43612506",
+        "0c1fa199269adc58f64ad4d5b9fd87b9",
+    ),
+    (
+        "Entities.csv",
+        "https://figshare.com/ndownloader/files/43612494",
+        "b29f16555759edbbd05e59fa34cccdc5",
+    ),
+    (
+        "Roles.csv",
+        "https://figshare.com/ndownloader/files/43612500",
+        "65ad0206fb61bbc483065e47aa113172",
+    ),
+    (
+        "Literature_Info.json",
+        "https://figshare.com/ndownloader/files/43612512",
+        "10b78e8ec30f5b85f2a58d8fe24f056b",
+    ),
+    (
+        "Aging_Biomarkers.json",
+        "https://figshare.com/ndownloader/files/43612503",
+        "abd0eb6cb7295ae500c5d676b7797324",
+    ),
+    (
+        "Longevity_Biomarkers.json",
+        "https://figshare.com/ndownloader/files/43612497",
+        "0dbd9c3f8474dc3cd744ed38af460d75",
+    ),
+]
+
+
+def build_hald_nodes(filepath):
+    data_nodes = sb.read_json_file(filepath)
+    nodes = []
+    for entry in data_nodes.values():
+        entry = entry[0]
+        node_id = entry["entity"]
+        node_type = entry["type"]
+        node_properties = {
+            k: v for k, v in entry.items() if k not in ("entity", "type")
+        }
+        nodes.append((node_id, node_type, node_properties))
+    return nodes
+
+
+def build_hald_edges(filepath):
+    data_edges = sb.read_json_file(filepath)
+    edges = []
+    for entry in data_edges.values():
+        source_id = entry["source entity"]
+        target_id = entry["target entity"]
+        edge_type = entry["relationship"]
+        edge_properties = {
+            k: v
+            for k, v in entry.items()
+            if k not in ("source entity", "target entity", "relationship")
+        }
+        edges.append((source_id, target_id, edge_type, edge_properties))
+    return edges
+
+
+def create_hald_stages(download_dir, results_dir):
+    stages = []
+    add_download_stages(stages, "hald", download_dir, HALD_DOWNLOADS)
+    stages += [
+        sb.create_pipeline_stage(
+            "hald/nodes", build_hald_nodes, ["hald/fetch/Entity_Info.json"]
+        ),
+        sb.create_pipeline_stage(
+            "hald/edges", build_hald_edges, ["hald/fetch/Relation_Info.json"]
+        ),
+    ]
+    add_graph_stages(stages, "hald", results_dir)
+    return stages
+
+
+# OREGANO
+
+
+OREGANO_DOWNLOADS = [
+    (
+        "OREGANO_V2.1.tsv",
+        "https://figshare.com/ndownloader/files/42612700",
+        "3e534cadf7717c705cbd5e6dd8c392a6",
+    ),
+    (
+        "ACTIVITY.tsv",
+        "https://figshare.com/ndownloader/files/42612697",
+        "d1faec938bd32ec9bb45ae5bba14d7a2",
+    ),
+    (
+        "COMPOUND.tsv",
+        "https://figshare.com/ndownloader/files/42612676",
+        "d86277d0e849c3774acb3c6be1878b44",
+    ),
+    (
+        "DISEASES.tsv",
+        "https://figshare.com/ndownloader/files/42612685",
+        "747a48c9786fd50912bb8d7f33d630df",
+    ),
+    (
+        "EFFECT.tsv",
+        "https://figshare.com/ndownloader/files/42612694",
+        "9b1656a45df7d0369dc2a8e5f52b5c2b",
+    ),
+    (
+        "GENES.tsv",
+        "https://figshare.com/ndownloader/files/42612673",
+        "8fe9a917b23ab715a268feda50b4a8d7",
+    ),
+    (
+        "INDICATION.tsv",
+        "https://figshare.com/ndownloader/files/42612691",
+        "eae2cbaebc64b1387cce1755a386d1cb",
+    ),
+    (
+        "PATHWAYS.tsv",
+        "https://figshare.com/ndownloader/files/42612688",
+        "d3f0abefe355c4b9cd1eea4cc8d58021",
+    ),
+    (
+        "PHENOTYPES.tsv",
+        "https://figshare.com/ndownloader/files/42612679",
+        "cada3e9316ba4ec654dd2b9ec2afa23c",
+    ),
+    (
+        "SIDE_EFFECT.tsv",
+        "https://figshare.com/ndownloader/files/42612670",
+        "8388b5a37db250128e50571d42d96cbc",
+    ),
+    (
+        "TARGET.tsv",
+        "https://figshare.com/ndownloader/files/42612682",
+        "46e189c556b2b010952d4212b8779cef",
+    ),
+    (
+        "oreganov2.1_metadata_complete.ttl",
+        "https://figshare.com/ndownloader/files/42700234",
+        "b087300f5e597d263a03c02eaae53bc7",
+    ),
+]
+
+OREGANO_ANNOTATION_FILES = [
+    "ACTIVITY.tsv",
+    "COMPOUND.tsv",
+    "DISEASES.tsv",
+    "EFFECT.tsv",
+    "GENES.tsv",
+    "INDICATION.tsv",
+    "PATHWAYS.tsv",
+    "PHENOTYPES.tsv",
+    "SIDE_EFFECT.tsv",
+    "TARGET.tsv",
+]
+
+
+def read_oregano_triples(filepath):
+    df_kg = sb.read_tsv_file(filepath, header=None)
+    df_kg.columns = ["subject", "predicate", "object"]
+    return df_kg
+
+
+def oregano_node_name_to_type(node_name):
+    try:
+        # Most node names contain both the type and id of a node separated by a ":"
+        node_type, _ = node_name.split(":", 1)
+        node_type = node_type.lower()
+    except Exception:
+        # Node names that occur in "has_code" relations as target do not have a ":" and explicit type
+        node_type = "code"
+    return node_type
+
+
+def strip_if_str(val):
+    if isinstance(val, str):
+        val = val.strip()
+    return val
+
+
+def build_oregano_annotations(*filepaths):
+    node_name_to_annotation_map = {}
+    for filepath in filepaths:
+        df = sb.read_tsv_file(filepath)
+        data_columns = list(df.columns)[1:]
+        for row in df.itertuples():
+            # indexing: 0=id (ignored), 1=name, 2-n=annotations
+            node_name = row[1]
+            annotation = {col: row[i] for i, col in enumerate(data_columns, 2)}
+            annotation = {
+                strip_if_str(k): strip_if_str(v)
+                for k, v in annotation.items()
+                if v is not None and strip_if_str(v) != "" and not is_nan(v)
+            }
+            node_name_to_annotation_map[node_name] = annotation
+    return node_name_to_annotation_map
+
+
+def build_oregano_nodes(df_kg, node_name_to_annotation_map):
+    nodes = []
+    seen_nodes = set()
+    for subject, obj in zip(df_kg["subject"], df_kg["object"]):
+        for node_name in (subject, obj):
+            if node_name not in seen_nodes:
+                seen_nodes.add(node_name)
+                node_type = oregano_node_name_to_type(node_name)
+                node_properties = node_name_to_annotation_map.get(node_name, {})
+                nodes.append((node_name, node_type, node_properties))
+    return nodes
+
+
+def build_oregano_edges(df_kg):
+    edges = []
+    seen_triples = set()
+    for source_id, edge_type, target_id in zip(
+        df_kg["subject"], df_kg["predicate"], df_kg["object"]
+    ):
+        triple = (source_id, edge_type, target_id)
+        if triple not in seen_triples:
+            seen_triples.add(triple)
+            edges.append((source_id, target_id, edge_type, {}))
+    return edges
+
+
+def create_oregano_stages(download_dir, results_dir):
+    stages = []
+    add_download_stages(stages, "oregano", download_dir, OREGANO_DOWNLOADS)
+    stages += [
+        sb.create_pipeline_stage(
+            "oregano/read/triples",
+            read_oregano_triples,
+            ["oregano/fetch/OREGANO_V2.1.tsv"],
+        ),
+        sb.create_pipeline_stage(
+            "oregano/read/annotations",
+            build_oregano_annotations,
+            [f"oregano/fetch/{filename}" for filename in OREGANO_ANNOTATION_FILES],
+        ),
+        sb.create_pipeline_stage(
+            "oregano/nodes",
+            build_oregano_nodes,
+            ["oregano/read/triples", "oregano/read/annotations"],
+        ),
+        sb.create_pipeline_stage(
+            "oregano/edges", build_oregano_edges, ["oregano/read/triples"]
+        ),
+    ]
+    add_graph_stages(stages, "oregano", results_dir)
+    return stages
+
+
+# PrimeKG
+
+
+PRIMEKG_DOWNLOADS = [
+    (
+        "kg.csv",
+        "https://dataverse.harvard.edu/api/access/datafile/6180620",
+        "aac8191d4fbc5bf09cdf8c3c78b4e75f",
+    ),
+    (
+        "disease_features.tab",
+        "https://dataverse.harvard.edu/api/access/datafile/6180618",
+        "f8d120497eb69848dc7d971ae30e3cd6",
+    ),
+    (
+        "drug_features.tab",
+        "https://dataverse.harvard.edu/api/access/datafile/6180619",
+        "e8c67d20e815b0d26d9d91be79adfff8",
+    ),
+    (
+        "nodes.tab",
+        "https://dataverse.harvard.edu/api/access/datafile/6180617",
+        "4924de04fb3deefa1e0a8dada424538e",
+    ),
+    (
+        "edges.csv",
+        "https://dataverse.harvard.edu/api/access/datafile/6180616",
+        "5d4d211a22e88544b78fde2735e797bc",
+    ),
+    (
+        "README.txt",
+        "https://dataverse.harvard.edu/api/access/datafile/6191270",
+        "608e37d4808bb97643186a1b6dc8f307",
+    ),
+]
+
+
+def build_primekg_annotations(*filepaths):
+    node_id_to_annotation_map = {}
+    for filepath in filepaths:
+        df = sb.read_tsv_file(filepath)
+        data_columns = list(df.columns)[1:]
+        for row in df.itertuples():
+            # indexing: 0=id (ignored), 1=name, 2-n=annotations
+            node_id = row[1]
+            annotation = {col: row[i] for i, col in enumerate(data_columns, 2)}
+            annotation = {
+                k: v
+                for k, v in annotation.items()
+                if v is not None and v != "" and not is_nan(v)
+            }
+            node_id_to_annotation_map[node_id] = annotation
+    return node_id_to_annotation_map
+
+
+def build_primekg_nodes(df_kg, node_id_to_annotation_map):
+    nodes = []
+    seen_node_ids = set()
+    for side in ("x", "y"):
+        columns = [f"{side}_{key}" for key in ("index", "type", "id", "name", "source")]
+        for node_id, node_type, identifier, label, source in zip(
+            *[df_kg[column] for column in columns]
+        ):
+            if node_id not in seen_node_ids:
+                seen_node_ids.add(node_id)
+                node_properties = {
+                    "identifier": identifier,
+                    "label": label,
+                    "source": source,
+                }
+                if node_id in node_id_to_annotation_map:
+                    node_properties.update(node_id_to_annotation_map[node_id])
+                nodes.append((node_id, node_type, node_properties))
+    return nodes
+
+
+def build_primekg_edges(df_kg):
+    edges = []
+    for source_id, target_id, edge_type, display_relation in zip(
+        df_kg["x_index"], df_kg["y_index"], df_kg["relation"], df_kg["display_relation"]
+    ):
+        edge_properties = {"display_relation": display_relation}
+        edges.append((source_id, target_id, edge_type, edge_properties))
+    return edges
+
+
+def create_primekg_stages(download_dir, results_dir):
+    stages = []
+    add_download_stages(stages, "primekg", download_dir, PRIMEKG_DOWNLOADS)
+    stages += [
+        sb.create_pipeline_stage(
+            "primekg/read/kg", sb.read_csv_file, ["primekg/fetch/kg.csv"]
+        ),
+        sb.create_pipeline_stage(
+            "primekg/read/annotations",
+            build_primekg_annotations,
+            [
+                "primekg/fetch/drug_features.tab",
+                "primekg/fetch/disease_features.tab",
+            ],
+        ),
+        sb.create_pipeline_stage(
+            "primekg/nodes",
+            build_primekg_nodes,
+            ["primekg/read/kg", "primekg/read/annotations"],
+        ),
+        sb.create_pipeline_stage(
+            "primekg/edges", build_primekg_edges, ["primekg/read/kg"]
+        ),
+    ]
+    add_graph_stages(stages, "primekg", results_dir)
+    return stages
+
+
+# Monarch
+
+
+MONARCH_DOWNLOADS = [
+    (
+        "monarch-kg.tar.gz",
+        "https://data.monarchinitiative.org/monarch-kg/2024-07-12/monarch-kg.tar.gz",
+        "df24db3c3b743c5829af71b6cd41c9fb",
+    ),
+]
+
+MONARCH_NODE_PROPERTIES = {
+    # The attribute "name" is reserved in igraph as unique identifier of a node, therefore "label"
+    "label": "name",
+    "description": "description",
+    "xref": "xref",
+    "provided_by": "provided_by",
+    "synonym": "synonym",
+    "full_name": "full_name",
+    "in_taxon": "in_taxon",
+    "in_taxon_label": "in_taxon_label",
+    "symbol": "symbol",
+    "deprecated": "deprecated",
+    "iri": "iri",
+    "same_as": "same_as",
+}
+
+MONARCH_EDGE_PROPERTIES = [
+    "id",
+    "original_subject",
+    "original_object",
+    "category",
+    "agent_type",
+    "aggregator_knowledge_source",
+    "knowledge_level",
+    "primary_knowledge_source",
+    "qualifiers",
+    "provided_by",
+    "has_evidence",
+    "publications",
+    "stage_qualifier",
+    "frequency_qualifier",
+    "has_count",
+    "has_percentage",
+    "has_quotient",
+    "has_total",
+    "negated",
+    "onset_qualifier",
+    "sex_qualifier",
+]
+
+
+def extract_monarch_files(filepath):
+    members = ["monarch-kg_nodes.tsv", "monarch-kg_edges.tsv"]
+    return sb.extract_tar_gz(filepath, members)
+
+
+def build_monarch_nodes(filepaths):
+    df = pd.read_csv(filepaths[0], sep="\t", dtype=str)
+    keys = list(MONARCH_NODE_PROPERTIES)
+    columns = [df[column] for column in MONARCH_NODE_PROPERTIES.values()]
+    nodes = [
+        (node_id, node_type, dict(zip(keys, values)))
+        for node_id, node_type, *values in zip(df["id"], df["category"], *columns)
+    ]
+    return nodes
+
+
+def build_monarch_edges(filepaths):
+    df = pd.read_csv(filepaths[1], sep="\t", dtype=str)
+    columns = [df[column] for column in MONARCH_EDGE_PROPERTIES]
+    edges = [
+        (source_id, target_id, edge_type, dict(zip(MONARCH_EDGE_PROPERTIES, values)))
+        for source_id, target_id, edge_type, *values in zip(
+            df["subject"], df["object"], df["predicate"], *columns
+        )
+    ]
+    return edges
+
+
+def build_monarch_adjacency_index(filepaths, directory):
+    # Out of core: the TSV files are read in blocks and the index is memory-mapped from directory
+    import dask.dataframe as dd  # local import because it's only needed for the index
+
+    nodes = dd.read_csv(filepaths[0], sep="\t", dtype=str, usecols=["id", "category"])
+    edges = dd.read_csv(
+        filepaths[1], sep="\t", dtype=str, usecols=["subject", "object", "predicate"]
+    )
+    sb.create_adjacency_index_from_partitions(
+        nodes,
+        edges,
+        directory,
+        node_type_column="category",
+        source_column="subject",
+        target_column="object",
+        edge_type_column="predicate",
+    )
+    return os.path.join(directory, "index.json")
+
+
+def create_monarch_stages(download_dir, results_dir, adjacency_index=False):
+    stages = []
+    add_download_stages(stages, "monarch", download_dir, MONARCH_DOWNLOADS)
+    stages += [
+        sb.create_pipeline_stage(
+            "monarch/extract",
+            extract_monarch_files,
+            ["monarch/fetch/monarch-kg.tar.gz"],
+            cache=True,
+        ),
+        sb.create_pipeline_stage(
+            "monarch/nodes", build_monarch_nodes, ["monarch/extract"], pool="memory"
+        ),
+        sb.create_pipeline_stage(
+            "monarch/edges", build_monarch_edges, ["monarch/extract"], pool="memory"
+        ),
+    ]
+    if adjacency_index:
+        # Only built on request, no other stage uses it
+        stages.append(
+            sb.create_pipeline_stage(
+                "monarch/adjacency_index",
+                build_monarch_adjacency_index,
+                ["monarch/extract"],
+                {"directory": os.path.join(results_dir, "monarch_adjacency_index")},
+                cache=True,
+            )
+        )
+    add_graph_stages(stages, "monarch", results_dir, stream_graphml=True)
+    return stages
+
+
+# CKG
+# - The Neo4j dump is converted to nodes.csv and edges.csv inside a Neo4j 4.4 Docker container
+# - As in the notebook, the graph is a subset around nodes whose properties mention one of
+#   CKG_SUBSTRINGS, because the full graph does not fit into memory as Python objects
+
+
+CKG_DOWNLOADS = [
+    (
+        "ckg_latest_4.2.3.dump",
+        "https://data.mendeley.com/public-files/datasets/mrcf7f4tc2/files/ffaab45e-e15c-412d-b63b-5df681a2e303/file_downloaded",
+        "eebe895e2e9f9fc39f3663fbcea032d5",
+    ),
+    (
+        "data.zip",
+        "https://data.mendeley.com/public-files/datasets/mrcf7f4tc2/files/69de0ef6-6e71-4d8e-8fbc-b933b9fc4dce/file_downloaded",
+        "1bbd8be31efcd559244b26f474d9ad59",
+    ),
+    (
+        "apoc-4.4.0.24-all.jar",
+        "https://github.com/neo4j-contrib/neo4j-apoc-procedures/releases/download/4.4.0.24/apoc-4.4.0.24-all.jar",
+        "7c6a702322b0aaf663c25f378cd3494d",
+    ),
+]
+
+CKG_SUBSTRINGS = ["bcr", "abl1", "imatinib", "chronic myeloid leukemia"]
+
+CKG_DOCKER_COMMANDS = [
+    # Configure Neo4j for the import
+    '''sh -c "echo 'dbms.allow_upgrade=true' >> /var/lib/neo4j/conf/neo4j.conf"''',
+    '''sh -c "echo 'dbms.security.procedures.allowlist=apoc.*' >> /var/lib/neo4j/conf/neo4j.conf"''',
+    '''sh -c "echo 'dbms.security.procedures.unrestricted=apoc.*' >> /var/lib/neo4j/conf/neo4j.conf"''',
+    '''sh -c "echo 'apoc.export.file.enabled=true' >> /var/lib/neo4j/conf/neo4j.conf"''',
+    '''sh -c "neo4j-admin set-initial-password correcthorsebatterystaple"''',
+    # Make APOC extension available to Neo4j
+    '''sh -c "cp /mnt/apoc.jar /var/lib/neo4j/plugins"''',
+    # Import the .dump file
+    '''sh -c "neo4j-admin load --from=/mnt/neo4j.dump --database=neo4j --force"''',
+    # Start the database and wait so it is ready
+    '''sh -c "rm -rf /var/lib/neo4j/logs && neo4j start"''',
+    '''sh -c "sleep 60"''',
+    # Export a .csv file for nodes and one for edges
+    '''cypher-shell -u neo4j -p correcthorsebatterystaple -d neo4j "CALL apoc.export.csv.query('MATCH (n) RETURN id(n) as id, labels(n)[0] as type, properties(n) as properties', 'nodes.csv', {})"''',
+    '''cypher-shell -u neo4j -p correcthorsebatterystaple -d neo4j "CALL apoc.export.csv.query('MATCH ()-[r]->() RETURN id(startNode(r)) as source_id, id(endNode(r)) as target_id, type(r) as type, properties(r) as properties', 'edges.csv', {})"''',
+    # Move the .csv files to the mounted directory to make them available outside the container
+    '''sh -c "mv /var/lib/neo4j/import/nodes.csv /mnt"''',
+    '''sh -c "mv /var/lib/neo4j/import/edges.csv /mnt"''',
+]
+
+
+def convert_ckg_dump_to_csv_files(filepath_db, filepath_apoc, results_dir):
+    import docker  # local import because it's only needed for CKG
+
+    # The container sees a temporary directory with hard links to the downloaded files
+    dirpath = os.path.abspath(
+        os.path.join(os.path.dirname(filepath_db), "tempdir_for_docker")
+    )
+    os.makedirs(dirpath, exist_ok=True)
+    for src, dst in [(filepath_db, "neo4j.dump"), (filepath_apoc, "apoc.jar")]:
+        sb.delete_file(os.path.join(dirpath, dst))
+        os.link(src, os.path.join(dirpath, dst))
+
+    client = docker.from_env()
+    container = client.containers.run(
+        "neo4j:4.4",
+        detach=True,
+        volumes={dirpath: {"bind": "/mnt", "mode": "rw"}},
+        working_dir="/mnt",
+        entrypoint="tail -f /dev/null",
+    )
+    try:
+        for command in CKG_DOCKER_COMMANDS:
+            exit_code, output = container.exec_run(command)
+            if exit_code != 0:
+                raise RuntimeError(
+                    f"Command failed with exit code {exit_code}: {command}\n{output.decode()}"
+                )
+    finally:
+        container.stop()
+        container.remove()
+
+    sb.create_dir(results_dir)
+    filepaths = []
+    for filename in ["nodes.csv", "edges.csv"]:
+        filepath = os.path.join(results_dir, filename)
+        os.replace(os.path.join(dirpath, filename), filepath)
+        filepaths.append(filepath)
+    shutil.rmtree(dirpath)
+    return filepaths
+
+
+def build_ckg_nodes_and_edges(filepaths):
+    import dask.dataframe as dd  # local import because it's only needed for CKG
+
+    df_nodes = dd.read_csv(filepaths[0], dtype=str)
+    df_edges = dd.read_csv(filepaths[1], dtype=str)
+
+    mask = df_nodes["properties"].str.contains(CKG_SUBSTRINGS[0], case=False, na=False)
+    for substring in CKG_SUBSTRINGS[1:]:
+        mask |= df_nodes["properties"].str.contains(substring, case=False, na=False)
+    node_ids = set(df_nodes[mask].compute()["id"])
+
+    mask = df_edges["source_id"].isin(node_ids) | df_edges["target_id"].isin(node_ids)
+    edges = df_edges[mask].compute().values.tolist()
+    edges = [(sid, tid, etype, json.loads(eprops)) for sid, tid, etype, eprops in edges]
+
+    node_ids_in_edges = {sid for sid, _, _, _ in edges} | {
+        tid for _, tid, _, _ in edges
+    }
+    mask = df_nodes["id"].isin(node_ids_in_edges)
+    nodes = df_nodes[mask].compute().values.tolist()
+    nodes = [(nid, ntype, json.loads(nprops)) for nid, ntype, nprops in nodes]
+    return nodes, edges
+
+
+def select_item(data, position):
+    return data[position]
+
+
+def create_ckg_stages(download_dir, results_dir):
+    stages = []
+    add_download_stages(stages, "ckg", download_dir, CKG_DOWNLOADS)
+    stages += [
+        sb.create_pipeline_stage(
+            "ckg/convert",
+            convert_ckg_dump_to_csv_files,
+            [
+                "ckg/fetch/ckg_latest_4.2.3.dump",
+                "ckg/fetch/apoc-4.4.0.24-all.jar",
+            ],
+            {"results_dir": results_dir},
+            cache=True,
+        ),
+        sb.create_pipeline_stage(
+            "ckg/subset", build_ckg_nodes_and_edges, ["ckg/convert"], pool="memory"
+        ),
+        sb.create_pipeline_stage(
+            "ckg/nodes", select_item, ["ckg/subset"], {"position": 0}
+        ),
+        sb.create_pipeline_stage(
+            "ckg/edges", select_item, ["ckg/subset"], {"position": 1}
+        ),
+    ]
+    add_graph_stages(stages, "ckg", results_dir, basename="ckg_subset")
+    return stages
+
+
+PIPELINES = {
+    "ckg": create_ckg_stages,
+    "hald": create_hald_stages,
+    "monarch": create_monarch_stages,
+    "oregano": create_oregano_stages,
+    "primekg": create_primekg_stages,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Download the knowledge graphs, build them and export them without Jupyter."
+    )
+    parser.add_argument(
+        "projects",
+        nargs="*",
+        help=f"knowledge graphs to process, any of {', '.join(sorted(PIPELINES))}, by default all of them",
+    )
+    parser.add_argument(
+        "--base-dir",
+        default=".",
+        help="directory that contains one <project>/downloads and <project>/results per knowledge graph",
+    )
+    parser.add_argument(
+        "--state-dir",
+        help="directory for fingerprints of finished stages, by default <base-dir>/.pipeline_state",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="maximum number of concurrent stages"
+    )
+    parser.add_argument(
+        "--downloads",
+        type=int,
+        default=4,
+        help="maximum number of concurrent downloads",
+    )
+    parser.add_argument(
+        "--memory-heavy",
+        type=int,
+        default=1,
+        help="maximum number of concurrent memory-heavy stages, e.g. graph construction",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="run all stages even if they are up to date",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only report which stages would run"
+    )
+    parser.add_argument(
+        "--adjacency-index",
+        action="store_true",
+        help="also build the out-of-core adjacency index of Monarch",
+    )
+    parser.add_argument(
+        "--report",
+        help="JSON-lines file to which timings and memory use of stages are appended",
+    )
+    args = parser.parse_args()
+
+    projects = args.projects or sorted(PIPELINES)
+    unknown = set(projects) - set(PIPELINES)
+    if unknown:
+        parser.error(f"unknown knowledge graphs: {', '.join(sorted(unknown))}")
+    state_dir = args.state_dir or os.path.join(args.base_dir, ".pipeline_state")
+    options = {"monarch": {"adjacency_index": args.adjacency_index}}
+    stages = []
+    for project_name in projects:
+        download_dir = os.path.join(args.base_dir, project_name, "downloads")
+        results_dir = os.path.join(args.base_dir, project_name, "results")
+        stages += PIPELINES[project_name](
+            download_dir, results_dir, **options.get(project_name, {})
+        )
+
+    # Progress bars are written to the terminal instead of being rendered as notebook widgets
+    sb.set_progress_backend("terminal")
+
+    if args.report:
+        sb.enable_instrumentation(args.report)
+    summary = sb.run_pipeline(
+        stages,
+        state_dir,
+        max_workers=args.workers,
+        pool_sizes={"network": args.downloads, "memory": args.memory_heavy},
+        force=args.force,
+        dry_run=args.dry_run,
+    )
+    print()
+    print(f"{'stage':<60}{'status':<10}{'time [s]':<10}")
+    print("=" * 80)
+    for name, entry in summary.items():
+        duration = f"{entry['time']:.1f}" if "time" in entry else ""
+        print(f"{name:<60}{entry['status']:<10}{duration:<10}")
+    failed = [name for name, entry in summary.items() if entry["status"] == "failed"]
+    for name in failed:
+        print(f'Stage "{name}" failed: {summary[name]["error"]}')
+    sys.exit(1 if failed else 0)
@@ -1,16 +1,260 @@
+import concurrent.futures
+import contextlib
 import csv
+import functools
+import gzip
 import hashlib
+import heapq
+import inspect
 import json
+import multiprocessing
 import os
+import pickle
+import queue
+import re
+import shutil
 import subprocess
+import sys
 import tarfile
+import threading
 import time
+import tracemalloc
+import urllib.parse
 
 import gravis as gv
 import igraph as ig
+import numpy as np
 import pandas as pd
 import requests
-from tqdm.notebook import tqdm
+from tqdm import tqdm as terminal_tqdm
+from tqdm.notebook import tqdm as notebook_tqdm
+
+# Progress bars
+# - Rendered as notebook widgets by default, set_progress_backend("terminal") writes them as text
+#   when the functions are used from a script such as run_pipelines.py
+
+
+PROGRESS = {"backend": "notebook"}
+
+
+def set_progress_backend(backend):
+    if backend not in ("notebook", "terminal"):
+        raise ValueError(
+            f'Unknown progress backend "{backend}". Use "notebook" or "terminal".'
+        )
+    PROGRESS["backend"] = backend
+
+
+def progress_bar(*args, **kwargs):
+    if PROGRESS["backend"] == "terminal":
+        return terminal_tqdm(*args, **kwargs)
+    return notebook_tqdm(*args, **kwargs)
+
+
+# Instrumentation
+# - Stages are measured with `with stage("name") as s:` or by decorating a function with `@instrumented()`
+# - Each finished stage produces one record: wall and CPU time, peak RSS, tracemalloc deltas,
+#   rows and bytes counted via s.count(...), written as a JSON line and passed to callbacks
+# - While disabled, stage() returns a shared no-op object, so hooks cost a flag check
+
+
+INSTRUMENTATION = {
+    "enabled": False,
+    "run_id": None,
+    "report_filepath": None,
+    "callbacks": [],
+    "trace_memory": False,
+    "lock": threading.Lock(),
+    "local": threading.local(),
+}
+
+
+def enable_instrumentation(
+    report_filepath=None, callbacks=None, trace_memory=False, run_id=None
+):
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    INSTRUMENTATION.update(
+        enabled=True,
+        run_id=run_id or time.strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}",
+        report_filepath=report_filepath,
+        callbacks=list(callbacks or []),
+        trace_memory=trace_memory,
+    )
+    return INSTRUMENTATION["run_id"]
+
+
+def disable_instrumentation():
+    if INSTRUMENTATION["trace_memory"] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    INSTRUMENTATION.update(enabled=False, callbacks=[], trace_memory=False)
+
+
+def read_instrumentation_report(filepath):
+    with open(filepath) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_peak_rss():
+    # Peak resident set size of the process in bytes, None where the resource module is missing
+    try:
+        import resource  # local import because it's not available on Windows
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def count(self, rows=0, bytes_read=0, bytes_written=0):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    def __init__(self, name, metadata):
+        self.name = name
+        self.metadata = metadata
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.traced_peak = 0
+
+    def count(self, rows=0, bytes_read=0, bytes_written=0):
+        self.rows += rows
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+    def __enter__(self):
+        stack = INSTRUMENTATION["local"].__dict__.setdefault("stack", [])
+        self.parent = stack[-1] if stack else None
+        self.path = (
+            self.name if self.parent is None else f"{self.parent.path}/{self.name}"
+        )
+        stack.append(self)
+        self.tracing = INSTRUMENTATION["trace_memory"] and tracemalloc.is_tracing()
+        if self.tracing:
+            # The peak is reset for this stage, so the parent's peak so far is handed up first
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None:
+                self.parent.traced_peak = max(self.parent.traced_peak, peak)
+            tracemalloc.reset_peak()
+            self.traced_start = current
+        self.start_timestamp = time.time()
+        self.start_rss = get_peak_rss()
+        self.start_cpu = time.process_time()
+        self.start_wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self.start_wall
+        cpu_time = time.process_time() - self.start_cpu
+        peak_rss = get_peak_rss()
+        record = {
+            "run_id": INSTRUMENTATION["run_id"],
+            "stage": self.name,
+            "path": self.path,
+            "start": self.start_timestamp,
+            "wall_time": wall_time,
+            "cpu_time": cpu_time,
+            "peak_rss": peak_rss,
+            "peak_rss_increase": (
+                None if peak_rss is None else peak_rss - self.start_rss
+            ),
+            "rows": self.rows,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "error": None if exc_type is None else exc_type.__name__,
+        }
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            self.traced_peak = max(self.traced_peak, peak)
+            record["traced_delta"] = current - self.traced_start
+            record["traced_peak_delta"] = self.traced_peak - self.traced_start
+            if self.parent is not None:
+                self.parent.traced_peak = max(self.parent.traced_peak, self.traced_peak)
+        record.update(self.metadata)
+        INSTRUMENTATION["local"].stack.pop()
+        emit_stage_record(record)
+        return False
+
+
+def stage(name, **metadata):
+    if not INSTRUMENTATION["enabled"]:
+        return NULL_STAGE
+    return Stage(name, metadata)
+
+
+def current_stage():
+    # Innermost active stage of this thread, so that functions can count rows and bytes
+    if not INSTRUMENTATION["enabled"]:
+        return NULL_STAGE
+    stack = INSTRUMENTATION["local"].__dict__.get("stack")
+    return stack[-1] if stack else NULL_STAGE
+
+
+def instrumented(name=None, counter=None):
+    # The counter derives rows and bytes from the arguments and the result, it only runs when enabled
+    def decorator(function):
+        stage_name = function.__name__ if name is None else name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION["enabled"]:
+                return function(*args, **kwargs)
+            with Stage(stage_name, {}) as s:
+                result = function(*args, **kwargs)
+                if counter is not None:
+                    counter(s, result, *args, **kwargs)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def count_read_bytes(s, result, filepath, *args, **kwargs):
+    s.count(bytes_read=get_local_size(filepath))
+
+
+def count_read_rows(s, result, filepath, *args, **kwargs):
+    table = result[0] if isinstance(result, tuple) else result
+    s.count(rows=len(table), bytes_read=get_local_size(filepath))
+
+
+def count_written_files(s, result, *args, **kwargs):
+    filepaths = result if isinstance(result, (list, tuple)) else [result]
+    s.count(bytes_written=sum(get_local_size(filepath) for filepath in filepaths))
+
+
+def count_graph(s, result, *args, **kwargs):
+    s.count(rows=result.vcount() + result.ecount())
+
+
+def count_validated_files(s, result, *args, **kwargs):
+    s.count(bytes_read=sum(get_local_size(filepath) for filepath in result))
+
+
+def count_read_and_written_files(s, result, filepath, *args, **kwargs):
+    count_read_bytes(s, result, filepath)
+    count_written_files(s, result)
+
+
+def emit_stage_record(record):
+    with INSTRUMENTATION["lock"]:
+        if INSTRUMENTATION["report_filepath"] is not None:
+            with open(INSTRUMENTATION["report_filepath"], "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        for callback in INSTRUMENTATION["callbacks"]:
+            callback(record)
 
 
 # Web retrieval and validation
@@ -42,9 +286,11 @@ def ensure_internet_connection(retries=3, delay=10):
         )
 
 
-def get_remote_size(url):
+def get_remote_size(url, session=None, check_connection=True):
     # Make sure there is an internet connection
-    ensure_internet_connection()
+    if check_connection:
+        ensure_internet_connection()
+    http = requests if session is None else session
 
     # Try to determine the size of the remote file
     try:
@@ -52,7 +298,7 @@ def get_remote_size(url):
         headers = {
             "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:127.0) Gecko/20100101 Firefox/127.0"
         }
-        response = requests.head(url, headers=headers, allow_redirects=True, timeout=10)
+        response = http.head(url, headers=headers, allow_redirects=True, timeout=10)
         remote_size = int(response.headers.get("content-length", 0))
 
         # Attempt 2: GET request with Range header and "content-range" response attribute
@@ -61,7 +307,7 @@ def get_remote_size(url):
                 "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:127.0) Gecko/20100101 Firefox/127.0",
                 "Range": "bytes=0-1",
             }
-            response = requests.get(
+            response = http.get(
                 url, headers=headers, allow_redirects=True, timeout=10
             )
             content_range = response.headers.get("content-range")
@@ -97,60 +343,327 @@ def run_shell_command(command):
     return result.stdout
 
 
-def download_file(url, filepath, remote_size, local_size):
+def create_session(pool_size=16):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def download_file(
+    url,
+    filepath,
+    remote_size,
+    local_size,
+    session=None,
+    chunk_size=4 * 1024 * 1024,
+    semaphore=None,
+):
+    http = requests if session is None else session
     headers = {"Range": f"bytes={local_size}-"}
-    response = requests.get(url, headers=headers, stream=True)
-    with open(filepath, "ab") as f:
-        with tqdm(
+    with semaphore or contextlib.nullcontext():
+        with http.get(url, headers=headers, stream=True, timeout=60) as response:
+            if response.status_code not in (200, 206):
+                # Errors must not touch a partial download that can be resumed later
+                response.raise_for_status()
+            if local_size > 0 and response.status_code == 200:
+                # The server ignored the Range header, so the full file is sent
+                delete_file(filepath)
+                local_size = 0
+            with open(filepath, "ab", buffering=chunk_size) as f:
+                with progress_bar(
+                    total=remote_size,
+                    initial=local_size,
+                    unit="B",
+                    unit_scale=True,
+                    unit_divisor=1024,
+                ) as pbar:
+                    for data in response.iter_content(chunk_size=chunk_size):
+                        f.write(data)
+                        pbar.update(len(data))
+
+
+def download_segment(url, filepath, start, end, session, chunk_size, semaphore, pbar):
+    headers = {"Range": f"bytes={start}-{end}"}
+    with semaphore or contextlib.nullcontext():
+        with session.get(url, headers=headers, stream=True, timeout=60) as response:
+            if response.status_code != 206:
+                raise requests.exceptions.InvalidHeader(
+                    f"Server did not answer the Range request for {url} with a partial response."
+                )
+            with open(filepath, "wb", buffering=chunk_size) as f:
+                for data in response.iter_content(chunk_size=chunk_size):
+                    f.write(data)
+                    pbar.update(len(data))
+    if get_local_size(filepath) != end - start + 1:
+        raise requests.exceptions.ChunkedEncodingError(
+            f"Incomplete segment bytes={start}-{end} of {url}."
+        )
+
+
+def download_file_in_segments(
+    url,
+    filepath,
+    remote_size,
+    local_size,
+    session,
+    num_segments=4,
+    chunk_size=4 * 1024 * 1024,
+    semaphore=None,
+):
+    # The missing byte range is split into segments that are fetched in parallel and
+    # appended to the local file in order, so an interrupted download can be resumed
+    segment_size = -(-(remote_size - local_size) // num_segments)
+    ranges = [
+        (start, min(start + segment_size, remote_size) - 1)
+        for start in range(local_size, remote_size, segment_size)
+    ]
+    part_filepaths = [f"{filepath}.part{start}-{end}" for start, end in ranges]
+    try:
+        with progress_bar(
             total=remote_size,
             initial=local_size,
             unit="B",
             unit_scale=True,
             unit_divisor=1024,
         ) as pbar:
-            for data in response.iter_content(chunk_size=1024):
-                f.write(data)
-                pbar.update(len(data))
+            with concurrent.futures.ThreadPoolExecutor(len(ranges)) as executor:
+                futures = [
+                    executor.submit(
+                        download_segment,
+                        url,
+                        part_filepath,
+                        start,
+                        end,
+                        session,
+                        chunk_size,
+                        semaphore,
+                        pbar,
+                    )
+                    for (start, end), part_filepath in zip(ranges, part_filepaths)
+                ]
+                with open(filepath, "ab") as f:
+                    for future, part_filepath in zip(futures, part_filepaths):
+                        future.result()
+                        with open(part_filepath, "rb") as part:
+                            shutil.copyfileobj(part, f, chunk_size)
+                        f.flush()
+                        delete_file(part_filepath)
+    finally:
+        for part_filepath in part_filepaths:
+            delete_file(part_filepath)
+
 
+@instrumented()
+def fetch_file(
+    url,
+    filepath,
+    session=None,
+    check_connection=True,
+    chunk_size=4 * 1024 * 1024,
+    num_segments=1,
+    min_segment_size=32 * 1024 * 1024,
+    semaphore=None,
+):
+    def download(remote_size, local_size):
+        if (
+            session is not None
+            and num_segments > 1
+            and remote_size - local_size >= 2 * min_segment_size
+        ):
+            used_segments = min(
+                num_segments, (remote_size - local_size) // min_segment_size
+            )
+            try:
+                download_file_in_segments(
+                    url,
+                    filepath,
+                    remote_size,
+                    local_size,
+                    session,
+                    used_segments,
+                    chunk_size,
+                    semaphore,
+                )
+                return
+            except requests.exceptions.RequestException as e:
+                print(
+                    f"Segmented download failed ({e}). Continuing with a single stream."
+                )
+                local_size = get_local_size(filepath)
+        download_file(
+            url, filepath, remote_size, local_size, session, chunk_size, semaphore
+        )
 
-def fetch_file(url, filepath):
-    remote_size = get_remote_size(url)
+    remote_size = get_remote_size(url, session, check_connection)
     local_size = get_local_size(filepath)
     if local_size == 0:
         print(f'Found no local copy of "{filepath}". Starting the download.')
-        download_file(url, filepath, remote_size, local_size)
+        download(remote_size, local_size)
     elif remote_size == 0:
         print(
             f"Found a local copy but couldn't determine the remote file size. Starting a fresh download to overwrite the possibly partial local file."
         )
         delete_file(filepath)
         local_size = 0
-        download_file(url, filepath, remote_size, local_size)
+        download(remote_size, local_size)
     else:
         if remote_size == local_size:
             print(f'Found a full local copy of "{filepath}".')
         elif remote_size > local_size:
             print(f'Found a partial local copy "{filepath}". Resuming the download.')
-            download_file(url, filepath, remote_size, local_size)
+            download(remote_size, local_size)
         else:
             print(
                 f"Found a local copy but it is larger than the remote file. Starting a fresh download to overwrite the local file."
             )
             delete_file(filepath)
             local_size = 0
-            download_file(url, filepath, remote_size, 0)
+            download(remote_size, 0)
+    current_stage().count(bytes_written=get_local_size(filepath) - local_size)
+
+
+@instrumented()
+def fetch_files(
+    download_specification,
+    download_dir,
+    max_workers=8,
+    max_connections_per_host=4,
+    chunk_size=4 * 1024 * 1024,
+    num_segments=4,
+    min_segment_size=32 * 1024 * 1024,
+    check_connection=True,
+):
+    # The connectivity check runs once for all files instead of once per file
+    if check_connection:
+        ensure_internet_connection()
+    hosts = {urllib.parse.urlsplit(url).netloc for _, url, _ in download_specification}
+    semaphores = {
+        host: threading.BoundedSemaphore(max_connections_per_host) for host in hosts
+    }
+    session = create_session(pool_size=max(max_workers, max_connections_per_host))
+    filepaths = []
+    with session:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for filename, url, md5 in download_specification:
+                filepath = os.path.join(download_dir, filename)
+                host = urllib.parse.urlsplit(url).netloc
+                future = executor.submit(
+                    fetch_file,
+                    url,
+                    filepath,
+                    session,
+                    False,
+                    chunk_size,
+                    num_segments,
+                    min_segment_size,
+                    semaphores[host],
+                )
+                futures.append(future)
+                filepaths.append(filepath)
+            for future in futures:
+                future.result()
+    return filepaths
+
+
+def calculate_md5(filepath, buffer_size=8 * 1024 * 1024):
+    md5 = hashlib.md5()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(filepath, "rb", buffering=0) as f:
+        while True:
+            num_bytes = f.readinto(buffer)
+            if not num_bytes:
+                break
+            md5.update(view[:num_bytes])
+    return md5.hexdigest()
+
+
+def get_md5_cache_filepath(filepath):
+    return f"{filepath}.md5.json"
+
+
+def read_md5_cache(filepath):
+    # The cached hash is only used if path, size and modification time of the file are unchanged
+    stat = os.stat(filepath)
+    try:
+        with open(get_md5_cache_filepath(filepath)) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        cache.get("path") == os.path.abspath(filepath)
+        and cache.get("size") == stat.st_size
+        and cache.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        return cache.get("md5")
+    return None
+
+
+def write_md5_cache(filepath, md5_hash):
+    stat = os.stat(filepath)
+    cache = {
+        "path": os.path.abspath(filepath),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "md5": md5_hash,
+    }
+    cache_filepath = get_md5_cache_filepath(filepath)
+    temp_filepath = f"{cache_filepath}.tmp{os.getpid()}"
+    try:
+        with open(temp_filepath, "w") as f:
+            json.dump(cache, f)
+        os.replace(temp_filepath, cache_filepath)
+    except OSError:
+        delete_file(temp_filepath)
 
 
-def validate_file(filepath, md5_hash):
-    with open(filepath, "rb") as f:
-        bytes = f.read()
-    md5_hash_calc = hashlib.md5(bytes).hexdigest()
+def validate_file(
+    filepath, md5_hash, buffer_size=8 * 1024 * 1024, use_cache=True, raise_error=False
+):
+    md5_hash_calc = read_md5_cache(filepath) if use_cache else None
+    if md5_hash_calc is None:
+        md5_hash_calc = calculate_md5(filepath, buffer_size)
+        if use_cache:
+            write_md5_cache(filepath, md5_hash_calc)
     if md5_hash == md5_hash_calc:
         print(f"MD5 checksum is correct.")
-    else:
-        print(
-            f"MD5 checksum deviates from the expected one. The file could be corrupted from an incomplete download."
-        )
+        return True
+    message = f"MD5 checksum deviates from the expected one. The file could be corrupted from an incomplete download."
+    if raise_error:
+        raise ValueError(f'{message} File: "{filepath}"')
+    print(message)
+    return False
+
+
+@instrumented(counter=count_validated_files)
+def validate_files(
+    download_specification,
+    download_dir,
+    buffer_size=8 * 1024 * 1024,
+    use_cache=True,
+    raise_error=False,
+    max_workers=None,
+):
+    # Hashing runs in threads because hashlib releases the GIL for large buffers
+    if max_workers is None:
+        max_workers = min(len(download_specification), os.cpu_count() or 1) or 1
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for filename, url, md5 in download_specification:
+            filepath = os.path.join(download_dir, filename)
+            future = executor.submit(
+                validate_file, filepath, md5, buffer_size, use_cache, raise_error
+            )
+            futures[future] = filepath
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
 
 
 def create_dir(dirpath):
@@ -160,40 +673,145 @@ def create_dir(dirpath):
 # Extraction
 
 
-def extract_tar_gz(filepath):
+@instrumented(counter=count_read_and_written_files)
+def extract_tar_gz(filepath, members=None, chunk_size=4 * 1024 * 1024):
     print(f'Starting to extract "{filepath}".')
-    directory = os.path.dirname(filepath)
+    directory = os.path.abspath(os.path.dirname(filepath))
+    wanted = None if members is None else {os.path.normpath(name) for name in members}
+    found = set()
+    extracted_filepaths = []
+    with tarfile.open(filepath, "r:gz") as tar:
+        for member in tar:
+            name = os.path.normpath(member.name)
+            if wanted is not None and name not in wanted:
+                continue
+            target_filepath = os.path.abspath(os.path.join(directory, member.name))
+            if os.path.commonpath([directory, target_filepath]) != directory:
+                raise ValueError(
+                    f'Archive member "{member.name}" is outside the target directory.'
+                )
+            if member.isdir():
+                os.makedirs(target_filepath, exist_ok=True)
+                found.add(name)
+                continue
+            if not member.isfile():
+                continue
+            found.add(name)
+            if (
+                os.path.isfile(target_filepath)
+                and get_local_size(target_filepath) == member.size
+                and int(os.path.getmtime(target_filepath)) == int(member.mtime)
+            ):
+                print(f'Found an existing extracted copy of "{member.name}".')
+                extracted_filepaths.append(target_filepath)
+                continue
+
+            # Written to a temporary file first so that a partial extraction is never
+            # mistaken for a complete one
+            os.makedirs(os.path.dirname(target_filepath), exist_ok=True)
+            temp_filepath = f"{target_filepath}.part"
+            source = tar.extractfile(member)
+            with open(temp_filepath, "wb") as f:
+                with progress_bar(
+                    total=member.size,
+                    desc=member.name,
+                    unit="B",
+                    unit_scale=True,
+                    unit_divisor=1024,
+                ) as pbar:
+                    while True:
+                        data = source.read(chunk_size)
+                        if not data:
+                            break
+                        f.write(data)
+                        pbar.update(len(data))
+            if get_local_size(temp_filepath) != member.size:
+                delete_file(temp_filepath)
+                raise OSError(f'Extraction of "{member.name}" is incomplete.')
+            # The modification time of the member marks the copy as extracted from it
+            os.utime(temp_filepath, (member.mtime, member.mtime))
+            os.replace(temp_filepath, target_filepath)
+            extracted_filepaths.append(target_filepath)
+    if wanted is not None:
+        missing = wanted - found
+        if missing:
+            raise KeyError(f"Members not found in the archive: {sorted(missing)}")
+    return extracted_filepaths
+
+
+def iter_tar_gz_members(filepath, members=None):
+    # Members are read sequentially from the compressed stream, nothing is written to disk
+    if members is not None:
+        members = {os.path.normpath(name) for name in members}
     with tarfile.open(filepath, "r:gz") as tar:
-        tar.extractall(path=directory)
+        for member in tar:
+            if not member.isfile():
+                continue
+            if members is not None and os.path.normpath(member.name) not in members:
+                continue
+            yield member.name, tar.extractfile(member)
+
+
+@instrumented(counter=count_read_bytes)
+def read_tsv_from_tar_gz(filepath, member, chunksize=None, **kwargs):
+    # With a chunksize, a generator of DataFrames is returned that keeps the archive open
+    def read_chunks():
+        for _, source in iter_tar_gz_members(filepath, [member]):
+            yield from pd.read_csv(source, sep="\t", chunksize=chunksize, **kwargs)
+            return
+        raise KeyError(f'Member "{member}" not found in "{filepath}".')
+
+    if chunksize is not None:
+        return read_chunks()
+    for _, source in iter_tar_gz_members(filepath, [member]):
+        return pd.read_csv(source, sep="\t", **kwargs)
+    raise KeyError(f'Member "{member}" not found in "{filepath}".')
 
 
 # File loading
 
 
+@instrumented(counter=count_read_rows)
 def read_csv_file(filepath):
     with open(filepath) as f:
         df = pd.read_csv(f, engine="pyarrow")  # optional engine that is faster
     return df
 
 
+@instrumented(counter=count_read_bytes)
 def read_json_file(filepath):
     with open(filepath) as f:
         data = json.load(f)
     return data
 
 
-def read_tsv_file(filepath):
+@instrumented(counter=count_read_rows)
+def read_tsv_file(filepath, header=0):
     with open(filepath) as f:
-        df = pd.read_csv(f, sep="\t")
+        df = pd.read_csv(f, sep="\t", low_memory=False, header=header)
     return df
 
 
-def read_tsv_file(filepath, header=0):
-    with open(filepath) as f:
-        df = pd.read_csv(f, sep="\t", low_memory=False, header=header)
+@instrumented(counter=count_read_rows)
+def read_parquet_file(filepath, columns=None, filters=None):
+    # Only the requested columns and matching row groups are read
+    df = pd.read_parquet(filepath, columns=columns, filters=filters)
     return df
 
 
+@instrumented(counter=count_read_rows)
+def read_arrow_file(filepath, columns=None):
+    import pyarrow as pa  # local import because it's not often needed
+
+    # The table's buffers point into the memory-mapped file instead of being copied
+    source = pa.memory_map(filepath)
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+@instrumented(counter=count_read_rows)
 def read_ttl_file(filepath):
     import rdflib  # local import because it's not often needed
 
@@ -202,298 +820,4040 @@ def read_ttl_file(filepath):
     return g
 
 
-# Graph construction
-# - [Graph](https://igraph.org/python/doc/api/igraph.Graph.html)
-# - [add_vertices](https://igraph.org/python/doc/api/igraph.Graph.html#add_vertices)
-# - [add_edges](https://igraph.org/python/doc/api/igraph.Graph.html#add_edges)
+# RDF loading
+# - Turtle and N-Triples are tokenized from a stream and parsed statement by statement
+# - Terms are stored in N-Triples notation (<iri>, _:label, "literal"@lang, "literal"^^<datatype>)
+#   and dictionary-encoded as integers that index into a shared term table
 
+RDF_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<ws>(?:\s+|\#[^\n\r]*)+)
+    |(?P<iri><[^<>"{}|^`\\\x00-\x20]*>)
+    |(?P<long_string>\"\"\"(?:[^"\\]|\\.|"(?!""))*\"\"\"|'''(?:[^'\\]|\\.|'(?!''))*''')
+    |(?P<string>"(?:[^"\\\n\r]|\\.)*"|'(?:[^'\\\n\r]|\\.)*')
+    |(?P<directive>@prefix|@base)\b
+    |(?P<langtag>@[a-zA-Z]+(?:-[a-zA-Z0-9]+)*)
+    |(?P<datatype>\^\^)
+    |(?P<blank>_:[\w](?:[\w.\-]*[\w\-])?)
+    |(?P<number>[+-]?(?:\d*\.\d+[eE][+-]?\d+|\d+\.?[eE][+-]?\d+|\d*\.\d+|\d+))
+    |(?P<pname>(?:[A-Za-z](?:[\w.\-]*[\w\-])?)?:(?:(?:[\w:%\-]|\\[^\s])(?:(?:[\w.:%\-]|\\[^\s])*(?:[\w:%\-]|\\[^\s]))?)?)
+    |(?P<keyword>[A-Za-z]+)
+    |(?P<punctuation>[.;,\[\]()])
+    """,
+    re.VERBOSE,
+)
+RDF_ESCAPES = {
+    "t": "\t",
+    "b": "\b",
+    "n": "\n",
+    "r": "\r",
+    "f": "\f",
+    '"': '"',
+    "'": "'",
+    "\\": "\\",
+}
+RDF_ESCAPE_PATTERN = re.compile(r"\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))")
+RDF_NS = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+XSD_NS = "http://www.w3.org/2001/XMLSchema#"
 
-def create_graph(nodes, edges):
-    # Graph
-    g = ig.Graph(directed=True)
 
-    # Nodes
-    ig_nodes = []
-    ig_node_attributes = {"type": []}
-    known_node_property_keys = set()
-    for i, (node_id, node_type, node_properties) in enumerate(nodes):
-        ig_nodes.append(node_id)
-        ig_node_attributes["type"].append(node_type)
-        known_node_property_keys.update(node_properties.keys())
-        for key in known_node_property_keys:
-            if key == "type":
-                used_key = "_type"  # "type" is already used (node_type from entry in column 1) and can't be used if present in a node property
-            elif key == "name":
-                used_key = "_name"  # "name" has special meaning in igraph (used for identifying nodes) and can't be used if present in a node property
-            else:
-                used_key = key
-            if used_key not in ig_node_attributes:
-                ig_node_attributes[used_key] = [None] * i
-            val = node_properties.get(key, None)
-            ig_node_attributes[used_key].append(val)
-    g.add_vertices(ig_nodes, ig_node_attributes)
+def iter_rdf_tokens(f, chunk_size=1024 * 1024):
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        match = RDF_TOKEN_PATTERN.match(buffer, pos)
+        if match is not None and match.lastgroup == "string":
+            # An unterminated long string must not be read as an empty string
+            if buffer.startswith(('"""', "'''"), pos):
+                match = None
+        # A token close to the end of the buffer may continue in the next chunk
+        if not eof and (match is None or match.end() + 3 > len(buffer)):
+            data = f.read(chunk_size)
+            buffer = buffer[pos:] + data
+            pos = 0
+            eof = not data
+            continue
+        if match is None:
+            if pos == len(buffer):
+                return
+            raise ValueError(f"Invalid RDF syntax near: {buffer[pos:pos + 50]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind != "ws":
+            yield kind, match.group(kind)
 
-    # Edges
-    ig_edges = []
-    ig_edge_attributes = {"type": []}
-    known_edge_property_keys = set()
-    for i, (source_id, target_id, edge_type, edge_properties) in enumerate(edges):
-        edge_id = (source_id, target_id)
-        ig_edges.append(edge_id)
-        ig_edge_attributes["type"].append(edge_type)
-        known_edge_property_keys.update(edge_properties.keys())
-        for key in known_edge_property_keys:
-            if key == "type":
-                used_key = "_type"  # "type" is already used (edge_type from entry in column 1) and can't be used if present in a edge property
-            elif key == "name":
-                used_key = "_name"  # "name" has special meaning in igraph and isn't used if present in a edge property to be sure it doesn't interfere
-            else:
-                used_key = key
-            if used_key not in ig_edge_attributes:
-                ig_edge_attributes[used_key] = [None] * i
-            val = edge_properties.get(key, None)
-            ig_edge_attributes[used_key].append(val)
-    g.add_edges(ig_edges, ig_edge_attributes)
-    return g
 
+def unescape_rdf_string(text):
+    def replace(match):
+        short, long, char = match.groups()
+        if char is None:
+            return chr(int(short or long, 16))
+        return RDF_ESCAPES.get(char, char)
 
-# Data export
+    return RDF_ESCAPE_PATTERN.sub(replace, text) if "\\" in text else text
 
 
-def export_nodes_as_csv(nodes, directory, basename, subgraph=None):
-    num_nodes = len(nodes) if subgraph is None else subgraph.vcount()
-    filename = f"{basename}_nodes_n{num_nodes}.csv"
-    filepath = os.path.join(directory, filename)
-    with open(filepath, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["id", "type", "properties"])
+def to_ntriples_literal(text):
+    text = (
+        text.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+    return f'"{text}"'
 
-        if subgraph is None:
-            used_nodes = nodes
-        else:
-            used_nodes = filter_nodes_by_subgraph(nodes, subgraph)
 
-        for node_id, node_type, node_properties in used_nodes:
-            writer.writerow([str(node_id), str(node_type), json.dumps(node_properties)])
-    return filepath
+def parse_rdf_statements(tokens, emit):
+    # Recursive descent parser for Turtle, which includes N-Triples as a subset.
+    # Triples are passed to emit and the generator yields after each statement.
+    tokens = iter(tokens)
+    prefixes = {}
+    base = [""]
+    blank_node_counter = [0]
+    current = [next(tokens, None)]
 
+    def peek():
+        return current[0]
 
-def export_edges_as_csv(edges, directory, basename, subgraph=None):
-    num_edges = len(edges) if subgraph is None else subgraph.ecount()
-    filename = f"{basename}_edges_e{num_edges}.csv"
-    filepath = os.path.join(directory, filename)
-    with open(filepath, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["source_id", "target_id", "type", "properties"])
+    def advance():
+        token = current[0]
+        current[0] = next(tokens, None)
+        return token
 
-        if subgraph is None:
-            used_edges = edges
+    def expect(value):
+        token = advance()
+        if token is None or token[1] != value:
+            raise ValueError(f"Expected {value!r} in RDF data but found {token!r}.")
+
+    def new_blank_node():
+        blank_node_counter[0] += 1
+        return f"_:genid{blank_node_counter[0]}"
+
+    def resolve_iri(value):
+        iri = unescape_rdf_string(value[1:-1])
+        if base[0] and not re.match(r"[A-Za-z][\w+.\-]*:", iri):
+            iri = urllib.parse.urljoin(base[0], iri)
+        return f"<{iri}>"
+
+    def expand_pname(value):
+        prefix, local = value.split(":", 1)
+        try:
+            namespace = prefixes[prefix]
+        except KeyError:
+            raise ValueError(f'Undefined prefix "{prefix}:" in RDF data.')
+        local = re.sub(r"\\(.)", r"\1", local)
+        return f"<{namespace}{local}>"
+
+    def parse_iri(token):
+        kind, value = token
+        if kind == "iri":
+            return resolve_iri(value)
+        if kind == "pname":
+            return expand_pname(value)
+        raise ValueError(f"Expected an IRI in RDF data but found {value!r}.")
+
+    def parse_literal(token):
+        kind, value = token
+        if kind == "long_string":
+            text = unescape_rdf_string(value[3:-3])
         else:
-            used_edges = filter_edges_by_subgraph(edges, subgraph)
+            text = unescape_rdf_string(value[1:-1])
+        literal = to_ntriples_literal(text)
+        following = peek()
+        if following is not None and following[0] == "langtag":
+            advance()
+            return f"{literal}{following[1]}"
+        if following is not None and following[0] == "datatype":
+            advance()
+            return f"{literal}^^{parse_iri(advance())}"
+        return literal
 
-        for source_id, target_id, edge_type, edge_properties in used_edges:
-            writer.writerow(
-                [source_id, target_id, edge_type, json.dumps(edge_properties)]
-            )
-    return filepath
+    def parse_term(token):
+        kind, value = token
+        if kind in ("iri", "pname"):
+            return parse_iri(token)
+        if kind == "blank":
+            return value
+        if kind in ("string", "long_string"):
+            return parse_literal(token)
+        if kind == "number":
+            if "e" in value or "E" in value:
+                datatype = "double"
+            elif "." in value:
+                datatype = "decimal"
+            else:
+                datatype = "integer"
+            return f'"{value}"^^<{XSD_NS}{datatype}>'
+        if kind == "keyword" and value in ("true", "false"):
+            return f'"{value}"^^<{XSD_NS}boolean>'
+        if value == "[":
+            node = new_blank_node()
+            if peek() is not None and peek()[1] != "]":
+                parse_predicate_object_list(node)
+            expect("]")
+            return node
+        if value == "(":
+            items = []
+            while peek() is not None and peek()[1] != ")":
+                items.append(parse_term(advance()))
+            expect(")")
+            if not items:
+                return f"<{RDF_NS}nil>"
+            nodes = [new_blank_node() for _ in items]
+            for i, (node, item) in enumerate(zip(nodes, items)):
+                emit(node, f"<{RDF_NS}first>", item)
+                rest = nodes[i + 1] if i + 1 < len(nodes) else f"<{RDF_NS}nil>"
+                emit(node, f"<{RDF_NS}rest>", rest)
+            return nodes[0]
+        raise ValueError(f"Unexpected token {value!r} in RDF data.")
 
+    def parse_predicate_object_list(subject):
+        while True:
+            token = advance()
+            if token[0] == "keyword" and token[1] == "a":
+                predicate = f"<{RDF_NS}type>"
+            else:
+                predicate = parse_iri(token)
+            while True:
+                emit(subject, predicate, parse_term(advance()))
+                if peek() is None or peek()[1] != ",":
+                    break
+                advance()
+            # Repeated and trailing semicolons are allowed
+            while peek() is not None and peek()[1] == ";":
+                advance()
+                if peek() is not None and peek()[1] not in (".", "]", ";"):
+                    break
+            else:
+                return
 
-def export_graph_as_graphml(graph, directory, basename):
-    n = graph.vcount()
-    m = graph.ecount()
-    filename = f"{basename}_graph_n{n}_e{m}.graphml"
-    filepath = os.path.join(directory, filename)
-    graph.write_graphml(filepath)
-    return filepath
+    while peek() is not None:
+        kind, value = advance()
+        if kind == "directive" or (
+            kind == "keyword" and value.upper() in ("PREFIX", "BASE")
+        ):
+            is_prefix = value.lower() in ("@prefix", "prefix")
+            if is_prefix:
+                name = advance()[1]
+                prefixes[name[:-1]] = resolve_iri(advance()[1])[1:-1]
+            else:
+                base[0] = resolve_iri(advance()[1])[1:-1]
+            if kind == "directive":
+                expect(".")
+            continue
+        subject = parse_term((kind, value))
+        if not (value == "[" and peek() is not None and peek()[1] == "."):
+            parse_predicate_object_list(subject)
+        expect(".")
+        yield
 
 
-# Data filtering
+def iter_rdf_triples(filepath, terms, predicates=None, batch_size=100_000):
+    # Yields batches of (subject, predicate, object) code arrays, terms maps term -> code
+    if predicates is not None:
+        predicates = {p if p.startswith("<") else f"<{p}>" for p in predicates}
+    subjects = []
+    used_predicates = []
+    objects = []
 
+    def encode(term):
+        code = terms.get(term)
+        if code is None:
+            code = terms[term] = len(terms)
+        return code
 
-def filter_nodes_by_subgraph(nodes, subgraph):
-    node_ids = set([vertex["name"] for vertex in subgraph.vs])
-    filtered_nodes = [node for node in nodes if node[0] in node_ids]
-    return filtered_nodes
+    def emit(s, p, o):
+        if predicates is not None and p not in predicates:
+            return
+        subjects.append(encode(s))
+        used_predicates.append(encode(p))
+        objects.append(encode(o))
 
+    def flush():
+        batch = (
+            np.array(subjects, dtype=np.int64),
+            np.array(used_predicates, dtype=np.int64),
+            np.array(objects, dtype=np.int64),
+        )
+        subjects.clear()
+        used_predicates.clear()
+        objects.clear()
+        return batch
 
-def filter_edges_by_subgraph(edges, subgraph):
-    edge_ids = set(
-        [
-            (subgraph.vs[e.source]["name"], subgraph.vs[e.target]["name"], e["type"])
-            for e in subgraph.es
-        ]
-    )
-    filtered_edges = [edge for edge in edges if edge[0:3] in edge_ids]
-    return filtered_edges
+    with open(filepath, encoding="utf-8") as f:
+        for _ in parse_rdf_statements(iter_rdf_tokens(f), emit):
+            if len(subjects) >= batch_size:
+                yield flush()
+    if subjects:
+        yield flush()
 
 
-# Graph operations
+@instrumented(counter=count_read_rows)
+def read_rdf_file(filepath, predicates=None, batch_size=100_000):
+    terms = {}
+    batches = list(iter_rdf_triples(filepath, terms, predicates, batch_size))
+    columns = ["subject", "predicate", "object"]
+    if batches:
+        arrays = [np.concatenate([batch[i] for batch in batches]) for i in range(3)]
+    else:
+        arrays = [np.zeros(0, dtype=np.int64) for _ in range(3)]
+    df = pd.DataFrame(dict(zip(columns, arrays)))
+    return df, list(terms)
 
 
-def report_graph_stats(graph):
-    n = graph.vcount()
-    m = graph.ecount()
-    density = graph.density(graph)
-    directed = "directed" if graph.is_directed() else "undirected"
-    multi = "multi" if graph.is_multiple() else ""
-    print(
-        f"{directed.title()} {multi}graph with {n} nodes, {m} edges and a density of {density:.4}."
+@instrumented(counter=count_read_and_written_files)
+def export_rdf_as_parquet(
+    filepath,
+    directory,
+    basename,
+    predicates=None,
+    batch_size=1_000_000,
+    compression="zstd",
+):
+    import pyarrow as pa  # local import because it's not often needed
+    import pyarrow.parquet as pq
+
+    terms = {}
+    triples_filepath = os.path.join(directory, f"{basename}_triples.parquet")
+    terms_filepath = os.path.join(directory, f"{basename}_terms.parquet")
+    schema = pa.schema(
+        [("subject", pa.int64()), ("predicate", pa.int64()), ("object", pa.int64())]
     )
+    with pq.ParquetWriter(triples_filepath, schema, compression=compression) as writer:
+        for batch in iter_rdf_triples(filepath, terms, predicates, batch_size):
+            writer.write_batch(pa.RecordBatch.from_arrays(list(batch), schema=schema))
+    term_table = pa.table({"term": pa.array(list(terms), type=pa.string())})
+    pq.write_table(term_table, terms_filepath, compression=compression)
+    return triples_filepath, terms_filepath
 
 
-def list_nodes_matching_substring(graph, substring, target=None):
-    substring = substring.lower()
-    sep = 4
+# Node and edge tables
+# - Column-oriented alternative to lists of (id, type, properties) and
+#   (source_id, target_id, type, properties) tuples with the same iteration protocol
+# - Types are categorical, sparse properties are stored per key as sorted row positions
+#   plus a value array, slices share the underlying arrays
 
-    if target is None:
-        data = []
-        id_max_len = type_max_len = 1
-        for v in graph.vs:
-            try:
-                if substring in str(v["name"]).lower():
-                    node_id = str(v["name"])
-                    node_type = str(v["type"])
-                    data.append((node_id, node_type))
-                    if len(node_id) > id_max_len:
-                        id_max_len = len(node_id)
-                    if len(node_type) > type_max_len:
-                        type_max_len = len(node_type)
-            except Exception:
-                pass
-        id_len = id_max_len + sep
-        type_len = type_max_len + sep
-        print(f"{'id':<{id_len}}{'type':<{type_len}}")
-        print("=" * (id_len + type_len))
-        for node_id, node_type in sorted(data):
-            print(f"{node_id:<{id_len}}{node_type:<{type_len}}")
-    else:
-        target = str(target)
-        data = []
-        id_max_len = type_max_len = property_max_len = 1
-        for v in graph.vs:
+
+def compact_values(values):
+    # Typed arrays where possible, but values must come back exactly as they went in
+    kinds = set()
+    missing = set()
+    for val in values:
+        if val is None:
+            missing.add("none")
+        elif type(val) is float and val != val:
+            missing.add("nan")
+        else:
+            kinds.add(type(val))
+    missing_value = float("nan") if missing == {"nan"} else None
+    if len(missing) <= 1:
+        if kinds == {str}:
+            array = pd.array(
+                [None if is_missing(val) else val for val in values], dtype="string"
+            )
+            return array, missing_value
+        if kinds <= {float} and "none" not in missing:
+            return np.array(values, dtype=np.float64), None
+        if not missing and kinds == {int}:
             try:
-                if substring in str(v[target]).lower():
-                    node_id = str(v["name"])
-                    node_type = str(v["type"])
-                    node_property = str(v[target])
-                    data.append((node_id, node_type, node_property))
-                    if len(node_id) > id_max_len:
-                        id_max_len = len(node_id)
-                    if len(node_type) > type_max_len:
-                        type_max_len = len(node_type)
-                    if len(node_property) > property_max_len:
-                        property_max_len = len(node_property)
-            except Exception:
+                return np.array(values, dtype=np.int64), None
+            except OverflowError:
                 pass
-        id_len = id_max_len + sep
-        type_len = type_max_len + sep
-        property_len = property_max_len + sep
-        print(f"{'id':<{id_len}}{'type':<{type_len}}{target:<{property_len}}")
-        print("=" * (id_len + type_len + property_len))
-        for node_id, node_type, node_property in sorted(data):
-            print(
-                f"{node_id:<{id_len}}{node_type:<{type_len}}{node_property:<{property_len}}"
+        if not missing and kinds == {bool}:
+            return np.array(values, dtype=bool), None
+    array = np.empty(len(values), dtype=object)
+    for i, val in enumerate(values):
+        array[i] = val
+    return array, None
+
+
+def values_to_list(array, missing_value):
+    if isinstance(array, np.ndarray):
+        return array.tolist()
+    return array.to_numpy(dtype=object, na_value=missing_value).tolist()
+
+
+def categorical_to_list(values):
+    # Missing values of a Categorical come back as NaN, the types they stand for were None
+    result = values.tolist()
+    for i in np.flatnonzero(values.codes < 0).tolist():
+        result[i] = None
+    return result
+
+
+def row_dtype(num_rows):
+    return np.int32 if num_rows < 2**31 else np.int64
+
+
+class ColumnTable:
+    chunk_size = 10_000
+
+    def __init__(self, types, properties, start=0, stop=None):
+        # properties: key -> (sorted row positions, values, value used for missing entries)
+        self._types = types
+        self._properties = properties
+        self._start = start
+        self._stop = len(types) if stop is None else stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __iter__(self):
+        for start in range(self._start, self._stop, self.chunk_size):
+            stop = min(start + self.chunk_size, self._stop)
+            yield from zip(
+                *self._key_columns(start, stop), self._properties_of(start, stop)
             )
 
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step == 1:
+                return self._window(self._start + start, self._start + max(start, stop))
+            item = np.arange(start, stop, step)
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += len(self)
+            if not 0 <= item < len(self):
+                raise IndexError("Row index out of range.")
+            row = self._start + item
+            return next(
+                zip(*self._key_columns(row, row + 1), self._properties_of(row, row + 1))
+            )
+        return self.take(item)
 
-def get_egocentric_subgraph(graph, node_id):
-    neighbors = graph.neighborhood(node_id)
-    subgraph = graph.induced_subgraph(neighbors).copy()
-    return subgraph
+    @property
+    def types(self):
+        return self._types[self._start : self._stop]
 
+    @property
+    def property_keys(self):
+        return list(self._properties)
 
-def get_paths_subgraph(graph, source, target):
-    shortest_paths = graph.get_all_shortest_paths(source, target)
-    edges = set()
-    for path in shortest_paths:
-        for i in range(len(path) - 1):
-            s = path[i]
-            t = path[i + 1]
-            edge = (s, t)
-            edges.add(edge)
-    subgraph = graph.subgraph_edges(edges)
-    return subgraph
+    def property_columns(self):
+        # Dense lists with None for missing keys, as used for igraph attributes
+        n = len(self)
+        columns = {}
+        for key in self._properties:
+            rows, values = self._property_window(key, self._start, self._stop)
+            column = [None] * n
+            for row, val in zip((rows - self._start).tolist(), values):
+                column[row] = val
+            columns[key] = column
+        return columns
 
+    def take(self, rows):
+        # Gathers rows into a new table, repeated and unordered rows are allowed
+        rows = np.asarray(rows, dtype=np.int64) + self._start
+        properties = {}
+        for key, (key_rows, values, missing_value) in self._properties.items():
+            indices = np.searchsorted(key_rows, rows)
+            found = indices < len(key_rows)
+            found[found] = key_rows[indices[found]] == rows[found]
+            new_rows = np.flatnonzero(found).astype(row_dtype(len(rows)))
+            properties[key] = (new_rows, values.take(indices[found]), missing_value)
+        return self._create(self._take_keys(rows), self._types.take(rows), properties)
 
-def visualize_graph(graph, node_type_to_color=None, source=None, target=None):
-    if node_type_to_color is None:
-        node_type_to_color = {}
+    def _window(self, start, stop):
+        return self._create(self._keys, self._types, self._properties, start, stop)
 
-    # Graph
-    g_vis = ig.Graph(directed=graph.is_directed())
+    def _property_window(self, key, start, stop):
+        rows, values, missing_value = self._properties[key]
+        lo, hi = np.searchsorted(rows, [start, stop])
+        return rows[lo:hi], values_to_list(values[lo:hi], missing_value)
 
-    # Nodes
-    def shorten(string, max_length):
-        if len(string) > max_length:
-            n = int(max_length / 2 - 3)
-            string = string[:n] + " ... " + string[-n:]
-        return string
+    def _properties_of(self, start, stop):
+        dicts = [{} for _ in range(stop - start)]
+        for key in self._properties:
+            rows, values = self._property_window(key, start, stop)
+            for row, val in zip((rows - start).tolist(), values):
+                dicts[row][key] = val
+        return dicts
 
-    for node in graph.vs:
-        node_id = node["name"]
-        node_type = node["type"]
-        node_properties = {
-            k: node[k]
-            for k in node.attribute_names()
-            if k not in ["name", "type"] and node[k] not in [None, "", []]
-        }
-        node_properties_str = "\n".join(
-            f" <b>{k}:</b> {shorten(str(v), 120)}"
-            for k, v in sorted(node_properties.items())
-        )
-        hover = f"<b>id:</b>{node_id}\n<b>type:</b>{node_type}\n<b>properties:</b>\n{node_properties_str}"
-        hover = shorten(hover, 1000)
-        coords = {}
-        size = None
-        try:
-            coords["x"] = node["x"]
-            coords["y"] = node["y"]
-        except Exception:
-            pass
-        if source is not None:
-            try:
-                if node.index == source or node["name"] == source:
-                    coords["x"] = 0 if target is None else -500
-                    coords["y"] = 0
-                    size = 20
-            except KeyError:
-                pass
-        if target is not None:
-            try:
-                if node.index == target or node["name"] == target:
-                    coords["x"] = 0 if source is None else +500
-                    coords["y"] = 0
-                    size = 20
-            except KeyError:
-                pass
+    @staticmethod
+    def _compact_properties(properties):
+        # One pass over all key-value pairs
+        num_rows = len(properties)
+        rows_per_key = {}
+        values_per_key = {}
+        for i, row_properties in enumerate(properties):
+            for key, val in row_properties.items():
+                rows = rows_per_key.get(key)
+                if rows is None:
+                    rows = rows_per_key[key] = []
+                    values_per_key[key] = []
+                rows.append(i)
+                values_per_key[key].append(val)
+        compacted = {}
+        for key, rows in rows_per_key.items():
+            values, missing_value = compact_values(values_per_key[key])
+            compacted[key] = (
+                np.array(rows, dtype=row_dtype(num_rows)),
+                values,
+                missing_value,
+            )
+        return compacted
+
+    @staticmethod
+    def _dense_properties(df, columns):
+        rows = np.arange(len(df), dtype=row_dtype(len(df)))
+        compacted = {}
+        for key in columns:
+            values, missing_value = compact_values(df[key].tolist())
+            compacted[key] = (rows, values, missing_value)
+        return compacted
+
+
+class NodeTable(ColumnTable):
+    def __init__(self, ids, types, properties, start=0, stop=None):
+        super().__init__(types, properties, start, stop)
+        self._ids = ids
+
+    @classmethod
+    def from_tuples(cls, nodes):
+        nodes = list(nodes)
+        ids, _ = compact_values([node[0] for node in nodes])
+        types = pd.Categorical([node[1] for node in nodes])
+        properties = cls._compact_properties([node[2] for node in nodes])
+        return cls(ids, types, properties)
 
-        g_vis.add_vertex(
-            name=node["name"],
-            hover=hover,
-            click="$hover",
-            color=node_type_to_color.get(node["type"], None),
-            size=size,
-            **coords,
+    @classmethod
+    def from_dataframe(cls, df, id_column="id", type_column="type"):
+        df = to_pandas_dataframe(df)
+        ids, _ = compact_values(df[id_column].tolist())
+        types = pd.Categorical(df[type_column])
+        columns = [key for key in df.columns if key not in (id_column, type_column)]
+        return cls(ids, types, cls._dense_properties(df, columns))
+
+    @property
+    def ids(self):
+        return self._ids[self._start : self._stop]
+
+    @property
+    def _keys(self):
+        return self._ids
+
+    def _create(self, keys, types, properties, start=0, stop=None):
+        return NodeTable(keys, types, properties, start, stop)
+
+    def _key_columns(self, start, stop):
+        ids = values_to_list(self._ids[start:stop], None)
+        types = categorical_to_list(self._types[start:stop])
+        return ids, types
+
+    def _take_keys(self, rows):
+        return self._ids.take(rows)
+
+
+class EdgeTable(ColumnTable):
+    def __init__(
+        self, node_ids, sources, targets, types, properties, start=0, stop=None
+    ):
+        # sources and targets are integer codes into node_ids
+        super().__init__(types, properties, start, stop)
+        self._node_ids = node_ids
+        self._sources = sources
+        self._targets = targets
+
+    @classmethod
+    def from_tuples(cls, edges, nodes=None):
+        edges = list(edges)
+        node_ids, sources, targets = cls._encode_ids(
+            [edge[0] for edge in edges], [edge[1] for edge in edges], nodes
         )
+        types = pd.Categorical([edge[2] for edge in edges])
+        properties = cls._compact_properties([edge[3] for edge in edges])
+        return cls(node_ids, sources, targets, types, properties)
 
-    # Edges
-    for edge in graph.es:
-        try:
-            hover = edge["type"]
-        except Exception:
-            hover = None
-        g_vis.add_edge(
-            edge.source,
-            edge.target,
-            hover=hover,
+    @classmethod
+    def from_dataframe(
+        cls,
+        df,
+        source_column="source_id",
+        target_column="target_id",
+        type_column="type",
+        nodes=None,
+    ):
+        df = to_pandas_dataframe(df)
+        node_ids, sources, targets = cls._encode_ids(
+            df[source_column].tolist(), df[target_column].tolist(), nodes
+        )
+        types = pd.Categorical(df[type_column])
+        columns = [
+            key
+            for key in df.columns
+            if key not in (source_column, target_column, type_column)
+        ]
+        return cls(
+            node_ids, sources, targets, types, cls._dense_properties(df, columns)
         )
 
-    # Visualization
-    fig = gv.d3(
-        g_vis,
-        node_label_data_source="name",
+    @staticmethod
+    def _encode_ids(source_ids, target_ids, nodes):
+        # Ids are shared with a node table if one is given, unknown ones are appended
+        all_ids = source_ids + target_ids
+        if nodes is None:
+            codes, uniques = pd.factorize(pd.Series(all_ids, dtype=object))
+            node_ids, _ = compact_values(list(uniques))
+        else:
+            known = pd.Index(values_to_list(nodes._ids, None))
+            codes = known.get_indexer(all_ids)
+            unknown = codes < 0
+            node_ids = nodes._ids
+            if unknown.any():
+                extra_codes, extra_ids = pd.factorize(
+                    pd.Series(all_ids, dtype=object)[unknown]
+                )
+                codes[unknown] = extra_codes + len(known)
+                node_ids, _ = compact_values(list(known) + list(extra_ids))
+        codes = codes.astype(row_dtype(len(node_ids)))
+        n = len(source_ids)
+        return node_ids, codes[:n], codes[n:]
+
+    @property
+    def source_codes(self):
+        return self._sources[self._start : self._stop]
+
+    @property
+    def target_codes(self):
+        return self._targets[self._start : self._stop]
+
+    @property
+    def node_ids(self):
+        return self._node_ids
+
+    @property
+    def _keys(self):
+        return self._node_ids, self._sources, self._targets
+
+    def _create(self, keys, types, properties, start=0, stop=None):
+        node_ids, sources, targets = keys
+        return EdgeTable(node_ids, sources, targets, types, properties, start, stop)
+
+    def _key_columns(self, start, stop):
+        sources = values_to_list(self._node_ids.take(self._sources[start:stop]), None)
+        targets = values_to_list(self._node_ids.take(self._targets[start:stop]), None)
+        types = categorical_to_list(self._types[start:stop])
+        return sources, targets, types
+
+    def _take_keys(self, rows):
+        return self._node_ids, self._sources[rows], self._targets[rows]
+
+
+# Identifier dictionary
+# - Node ids (CURIEs such as MONDO:0005148 or IRIs) are split into an interned prefix and a
+#   local part, local parts are stored in one contiguous byte buffer
+# - Lookup from id to integer code goes through a sorted array of stable 64-bit FNV-1a
+#   hashes, so the whole dictionary consists of NumPy arrays that can be memory-mapped
+
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def split_identifier(node_id):
+    if "://" in node_id:
+        position = max(node_id.rfind("/"), node_id.rfind("#")) + 1
+    else:
+        position = node_id.find(":") + 1
+    return node_id[:position], node_id[position:]
+
+
+def fnv1a_hashes(buffer, offsets, initial):
+    # Vectorized over all strings, processing the longest ones first so that each step
+    # touches only the strings that are still active
+    hashes = initial.astype(np.uint64).copy()
+    lengths = np.diff(offsets)
+    order = np.argsort(-lengths, kind="stable")
+    sorted_lengths = lengths[order]
+    starts = offsets[:-1][order]
+    with np.errstate(over="ignore"):
+        for k in range(int(sorted_lengths[0]) if len(lengths) else 0):
+            active = order[: np.searchsorted(-sorted_lengths, -k, side="left")]
+            positions = starts[: len(active)] + k
+            hashes[active] = (hashes[active] ^ buffer[positions]) * FNV_PRIME
+    return hashes
+
+
+def encode_strings(strings):
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(val) for val in encoded], out=offsets[1:])
+    buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return buffer, offsets
+
+
+def gather_segments(buffer, starts, lengths):
+    # Concatenation of buffer[starts[i]:starts[i] + lengths[i]] for all i
+    total = int(lengths.sum())
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+    within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return buffer[starts[segments] + within]
+
+
+def segments_equal(buffer_a, starts_a, buffer_b, starts_b, lengths):
+    # Compares buffer_a[starts_a[i]:starts_a[i] + lengths[i]] with the same slice of buffer_b
+    total = int(lengths.sum())
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+    within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    differs = (
+        buffer_a[starts_a[segments] + within] != buffer_b[starts_b[segments] + within]
+    )
+    equal = np.ones(len(lengths), dtype=bool)
+    equal[segments[differs]] = False
+    return equal
+
+
+class IdentifierDictionary:
+    array_names = ["prefix_codes", "buffer", "offsets", "hashes", "hash_order"]
+
+    def __init__(self, prefixes, prefix_codes, buffer, offsets, hashes, hash_order):
+        self.prefixes = prefixes
+        self.prefix_codes = prefix_codes
+        self.buffer = buffer
+        self.offsets = offsets
+        self.hashes = hashes  # sorted
+        self.hash_order = hash_order  # code of the id with the i-th smallest hash
+        self._prefix_to_code = {prefix: i for i, prefix in enumerate(prefixes)}
+        self._prefix_buffer, self._prefix_offsets = encode_strings(prefixes)
+
+    @classmethod
+    def from_ids(cls, ids, chunk_size=1_000_000):
+        # Codes follow the order of the given ids, duplicates keep their first code
+        # - Ids are added in chunks, so only one chunk is held as Python strings at a time
+        dictionary = cls.empty()
+        chunk = []
+        for node_id in ids:
+            chunk.append(node_id)
+            if len(chunk) == chunk_size:
+                dictionary = dictionary.extend(chunk)
+                chunk = []
+        return dictionary.extend(chunk)
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            [],
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.uint8),
+            np.zeros(1, dtype=np.int64),
+            np.zeros(0, dtype=np.uint64),
+            np.zeros(0, dtype=np.int64),
+        )
+
+    def extend(self, ids):
+        # New dictionary with the ids that are not contained yet appended in order of first
+        # occurrence, ids of earlier chunks are recognized by their hashes via encode
+        ids = list(dict.fromkeys(str(node_id) for node_id in ids))
+        ids = [node_id for node_id, code in zip(ids, self.encode(ids)) if code < 0]
+        prefix_to_code = dict(self._prefix_to_code)
+        prefix_codes = []
+        local_parts = []
+        for node_id in ids:
+            prefix, local = split_identifier(node_id)
+            code = prefix_to_code.get(prefix)
+            if code is None:
+                code = prefix_to_code[prefix] = len(prefix_to_code)
+            prefix_codes.append(code)
+            local_parts.append(local)
+        del ids
+        prefixes = list(prefix_to_code)
+        prefix_codes = np.array(prefix_codes, dtype=np.int32)
+        buffer, offsets = encode_strings(local_parts)
+        del local_parts
+        prefix_buffer, prefix_offsets = encode_strings(prefixes)
+        prefix_hashes = fnv1a_hashes(
+            prefix_buffer, prefix_offsets, np.full(len(prefixes), FNV_OFFSET)
+        )
+        hashes = np.empty(len(self) + len(prefix_codes), dtype=np.uint64)
+        hashes[self.hash_order] = self.hashes
+        hashes[len(self) :] = fnv1a_hashes(buffer, offsets, prefix_hashes[prefix_codes])
+        hash_order = np.argsort(hashes, kind="stable").astype(np.int64)
+        return IdentifierDictionary(
+            prefixes,
+            np.concatenate([self.prefix_codes, prefix_codes]),
+            np.concatenate([self.buffer, buffer]),
+            np.concatenate([self.offsets, offsets[1:] + self.offsets[-1]]),
+            hashes[hash_order],
+            hash_order,
+        )
+
+    def __len__(self):
+        return len(self.prefix_codes)
+
+    def __getitem__(self, code):
+        local = self.buffer[self.offsets[code] : self.offsets[code + 1]].tobytes()
+        return self.prefixes[self.prefix_codes[code]] + local.decode()
+
+    def __iter__(self):
+        for code in range(len(self)):
+            yield self[code]
+
+    def __contains__(self, node_id):
+        return self.encode([node_id])[0] >= 0
+
+    def encode(self, ids):
+        # Integer code per id, -1 for unknown ids
+        ids = [str(node_id) for node_id in ids]
+        buffer, offsets = encode_strings(ids)
+        hashes = fnv1a_hashes(buffer, offsets, np.full(len(ids), FNV_OFFSET))
+        codes = np.full(len(ids), -1, dtype=np.int64)
+        if len(self.hashes) == 0:
+            return codes
+        positions = np.searchsorted(self.hashes, hashes)
+        positions = np.minimum(positions, len(self.hashes) - 1)
+        candidates = np.flatnonzero(self.hashes[positions] == hashes)
+
+        # Verification that prefix and local part match byte by byte
+        candidate_codes = self.hash_order[positions[candidates]]
+        prefix_codes = self.prefix_codes[candidate_codes]
+        prefix_lengths = np.diff(self._prefix_offsets)[prefix_codes]
+        local_lengths = np.diff(self.offsets)[candidate_codes]
+        starts = offsets[candidates]
+        valid = np.diff(offsets)[candidates] == prefix_lengths + local_lengths
+        valid &= segments_equal(
+            buffer,
+            starts,
+            self._prefix_buffer,
+            self._prefix_offsets[prefix_codes],
+            np.where(valid, prefix_lengths, 0),
+        )
+        valid &= segments_equal(
+            buffer,
+            starts + prefix_lengths,
+            self.buffer,
+            self.offsets[candidate_codes],
+            np.where(valid, local_lengths, 0),
+        )
+        codes[candidates[valid]] = candidate_codes[valid]
+
+        # Hash collisions, which are extremely rare, are resolved one by one
+        for i in candidates[~valid].tolist():
+            position = positions[i] + 1
+            while position < len(self.hashes) and self.hashes[position] == hashes[i]:
+                code = int(self.hash_order[position])
+                if self[code] == ids[i]:
+                    codes[i] = code
+                    break
+                position += 1
+        return codes
+
+    def decode(self, codes):
+        return [self[code] for code in np.asarray(codes).tolist()]
+
+    def to_lowercase_strings(self, chunk_size=1_000_000):
+        # Lowercased UTF-8 bytes of all ids as buffer and offsets, assembled from the prefix and
+        # local buffers without creating Python strings unless an id contains non-ASCII bytes
+        prefix_lengths = np.diff(self._prefix_offsets)[self.prefix_codes]
+        local_lengths = np.diff(self.offsets)
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(prefix_lengths + local_lengths, out=offsets[1:])
+        source = np.concatenate([self._prefix_buffer, self.buffer])
+        chunks = []
+        for begin in range(0, len(self), chunk_size):
+            end = min(begin + chunk_size, len(self))
+            starts = np.stack(
+                [
+                    self._prefix_offsets[self.prefix_codes[begin:end]],
+                    len(self._prefix_buffer) + self.offsets[begin:end],
+                ],
+                axis=1,
+            ).ravel()
+            lengths = np.stack(
+                [prefix_lengths[begin:end], local_lengths[begin:end]], axis=1
+            ).ravel()
+            chunk = gather_segments(source, starts, lengths)
+            if (chunk >= 128).any():
+                chunk = np.frombuffer(
+                    b"".join(self[code].lower().encode() for code in range(begin, end)),
+                    dtype=np.uint8,
+                )
+            else:
+                chunk = chunk + 32 * ((chunk >= 65) & (chunk <= 90)).astype(np.uint8)
+            chunks.append(chunk)
+        buffer = np.concatenate([np.zeros(0, dtype=np.uint8)] + chunks)
+        if len(buffer) != offsets[-1]:
+            # Lowercasing changed the length of some non-ASCII ids
+            return encode_strings(node_id.lower() for node_id in self)
+        return buffer, offsets
+
+    def codes_with_prefix(self, prefix):
+        # All ids of one namespace, e.g. "MONDO:" or "http://purl.obolibrary.org/obo/"
+        code = self._prefix_to_code.get(prefix)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.prefix_codes == code)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in self.array_names:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "prefixes.json"), "w") as f:
+            json.dump(self.prefixes, f)
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mmap_mode = "r" if mmap else None
+        arrays = [
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in cls.array_names
+        ]
+        with open(os.path.join(directory, "prefixes.json")) as f:
+            prefixes = json.load(f)
+        return cls(prefixes, *arrays)
+
+
+# Graph construction
+# - [Graph](https://igraph.org/python/doc/api/igraph.Graph.html)
+# - [add_vertices](https://igraph.org/python/doc/api/igraph.Graph.html#add_vertices)
+# - [add_edges](https://igraph.org/python/doc/api/igraph.Graph.html#add_edges)
+
+
+@instrumented(counter=count_graph)
+def create_graph(
+    nodes,
+    edges,
+    node_id_column="id",
+    node_type_column="type",
+    source_column="source_id",
+    target_column="target_id",
+    edge_type_column="type",
+    id_dictionary=None,
+):
+    # Graph
+    g = ig.Graph(directed=True)
+
+    # Nodes
+    if is_dataframe(nodes):
+        df = to_pandas_dataframe(nodes)
+        ig_nodes = df[node_id_column].tolist()
+        node_types = column_to_list(df[node_type_column])
+        node_property_columns = {
+            key: column_to_list(df[key])
+            for key in df.columns
+            if key not in (node_id_column, node_type_column)
+        }
+    elif isinstance(nodes, NodeTable):
+        ig_nodes = values_to_list(nodes.ids, None)
+        node_types = categorical_to_list(nodes.types)
+        node_property_columns = nodes.property_columns()
+    else:
+        ig_nodes = [node[0] for node in nodes]
+        node_types = [node[1] for node in nodes]
+        node_property_columns = properties_to_columns([node[2] for node in nodes])
+    ig_node_attributes = {"type": node_types}
+    for key, column in node_property_columns.items():
+        if key == "type":
+            used_key = "_type"  # "type" is already used (node_type from entry in column 1) and can't be used if present in a node property
+        elif key == "name":
+            used_key = "_name"  # "name" has special meaning in igraph (used for identifying nodes) and can't be used if present in a node property
+        else:
+            used_key = key
+        ig_node_attributes[used_key] = column
+    # Position in the input, used to look up the rows of subgraphs
+    ig_node_attributes["_row"] = list(range(len(ig_nodes)))
+    g.add_vertices(ig_nodes, ig_node_attributes)
+
+    # Edges
+    if is_dataframe(edges):
+        df = to_pandas_dataframe(edges)
+        source_ids = df[source_column]
+        target_ids = df[target_column]
+        edge_types = column_to_list(df[edge_type_column])
+        edge_property_columns = {
+            key: column_to_list(df[key])
+            for key in df.columns
+            if key not in (source_column, target_column, edge_type_column)
+        }
+    elif isinstance(edges, EdgeTable):
+        source_ids = values_to_list(edges.node_ids.take(edges.source_codes), None)
+        target_ids = values_to_list(edges.node_ids.take(edges.target_codes), None)
+        edge_types = categorical_to_list(edges.types)
+        edge_property_columns = edges.property_columns()
+    else:
+        source_ids = [edge[0] for edge in edges]
+        target_ids = [edge[1] for edge in edges]
+        edge_types = [edge[2] for edge in edges]
+        edge_property_columns = properties_to_columns([edge[3] for edge in edges])
+    if id_dictionary is None:
+        ig_edges = ids_to_vertex_indices(ig_nodes, source_ids, target_ids)
+    else:
+        # The dictionary only encodes the edge endpoints, vertex names stay the full ids
+        ig_edges = id_codes_to_vertex_indices(
+            id_dictionary, source_ids, target_ids, ig_nodes
+        )
+    ig_edge_attributes = {"type": edge_types}
+    for key, column in edge_property_columns.items():
+        if key == "type":
+            used_key = "_type"  # "type" is already used (edge_type from entry in column 1) and can't be used if present in a edge property
+        elif key == "name":
+            used_key = "_name"  # "name" has special meaning in igraph and isn't used if present in a edge property to be sure it doesn't interfere
+        else:
+            used_key = key
+        ig_edge_attributes[used_key] = column
+    # Position in the input, used to look up the rows of subgraphs
+    ig_edge_attributes["_row"] = list(range(len(ig_edges)))
+    g.add_edges(ig_edges, ig_edge_attributes)
+    # Number of input rows, kept by subgraphs to check that rows are looked up in the same data
+    g["_num_node_rows"] = len(ig_nodes)
+    g["_num_edge_rows"] = len(ig_edges)
+    return g
+
+
+def is_dataframe(data):
+    return hasattr(data, "columns") or hasattr(data, "column_names")
+
+
+def column_to_list(series):
+    # Missing values become None like for keys that are absent in the properties of tuples
+    values = series.tolist()
+    for i in np.flatnonzero(series.isna().to_numpy()).tolist():
+        values[i] = None
+    return values
+
+
+def to_pandas_dataframe(data):
+    if isinstance(data, pd.DataFrame):
+        return data
+    if hasattr(data, "compute"):
+        # Dask dataframe
+        return data.compute()
+    if hasattr(data, "to_pandas"):
+        # Arrow table
+        return data.to_pandas()
+    return pd.DataFrame(data)
+
+
+def properties_to_columns(properties):
+    # One pass over all key-value pairs, each column padded with None where a key is missing
+    n = len(properties)
+    columns = {}
+    for i, row_properties in enumerate(properties):
+        for key, val in row_properties.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * n
+            column[i] = val
+    return columns
+
+
+def ids_to_vertex_indices(node_ids, source_ids, target_ids):
+    source_ids = pd.Series(source_ids)
+    target_ids = pd.Series(target_ids)
+    if pd.api.types.is_integer_dtype(source_ids) and pd.api.types.is_integer_dtype(
+        target_ids
+    ):
+        # Integers are interpreted by igraph as vertex indices, not as vertex names
+        source_indices = source_ids.to_numpy()
+        target_indices = target_ids.to_numpy()
+    else:
+        # Vertex names are looked up like igraph does, i.e. the first vertex with a name wins
+        index = pd.Index(node_ids)
+        first = ~index.duplicated()
+        positions = np.flatnonzero(first)
+        index = index[first]
+        source_indices = index.get_indexer(source_ids)
+        target_indices = index.get_indexer(target_ids)
+        if (source_indices < 0).any() or (target_indices < 0).any():
+            raise ValueError("Edge endpoint does not refer to a known node id.")
+        source_indices = positions[source_indices]
+        target_indices = positions[target_indices]
+    return list(zip(source_indices.tolist(), target_indices.tolist()))
+
+
+def id_codes_to_vertex_indices(id_dictionary, source_ids, target_ids, node_ids):
+    # The dictionary is built from the node ids in order, so codes are vertex indices unless
+    # duplicate ids shifted them, then each code is mapped to the first vertex with its id
+    source_indices = id_dictionary.encode(source_ids)
+    target_indices = id_dictionary.encode(target_ids)
+    if (source_indices < 0).any() or (target_indices < 0).any():
+        raise ValueError("Edge endpoint does not refer to a known node id.")
+    if len(id_dictionary) != len(node_ids):
+        codes = id_dictionary.encode(node_ids)
+        if (codes < 0).any():
+            raise ValueError("The id dictionary was not built from the node ids.")
+        _, first_positions = np.unique(codes, return_index=True)
+        vertex_indices = np.full(len(id_dictionary), -1, dtype=np.int64)
+        vertex_indices[codes[first_positions]] = first_positions
+        source_indices = vertex_indices[source_indices]
+        target_indices = vertex_indices[target_indices]
+        if (source_indices < 0).any() or (target_indices < 0).any():
+            raise ValueError("Edge endpoint does not refer to a known node id.")
+    return list(zip(source_indices.tolist(), target_indices.tolist()))
+
+
+# Schema extraction
+
+
+@instrumented()
+def compute_schema(
+    edges,
+    source_column,
+    target_column,
+    edge_type_column,
+    nodes=None,
+    node_id_column="id",
+    node_type_column="type",
+    source_type_column=None,
+    target_type_column=None,
+):
+    # Works on pandas and Dask dataframes, the latter partition-parallel until .compute()
+    found_columns = []
+    if source_type_column is None or target_type_column is None:
+        # The last row of a node id wins like in a dict, a flag marks edges whose endpoint was found
+        node_types = nodes[[node_id_column, node_type_column]]
+        node_types = node_types.drop_duplicates(subset=node_id_column, keep="last")
+        node_types = node_types.assign(_found=True)
+        edges = edges[[source_column, target_column, edge_type_column]]
+        for column, prefix in ((source_column, "source"), (target_column, "target")):
+            edges = edges.merge(
+                node_types.rename(
+                    columns={
+                        node_id_column: column,
+                        node_type_column: f"{prefix}_type",
+                        "_found": f"_{prefix}_found",
+                    }
+                ),
+                on=column,
+                how="left",
+            )
+            found_columns.append(f"_{prefix}_found")
+        source_type_column = "source_type"
+        target_type_column = "target_type"
+    columns = [source_type_column, edge_type_column, target_type_column]
+    schema = (
+        edges[columns + found_columns]
+        .groupby(columns + found_columns, dropna=False)
+        .size()
+    )
+    if hasattr(schema, "compute"):
+        schema = schema.compute()
+    schema = schema.reset_index()
+    if found_columns:
+        if schema[found_columns].isna().any(axis=None):
+            raise ValueError("Edge endpoint does not refer to a known node id.")
+        schema = schema.drop(columns=found_columns)
+    schema.columns = ["source_type", "edge_type", "target_type", "count"]
+    schema = schema.sort_values(
+        ["count", "source_type", "edge_type", "target_type"],
+        ascending=[False, True, True, True],
+        ignore_index=True,
+    )
+    return schema
+
+
+def create_schema_graph(
+    schema, node_type_counts, edge_type_counts, node_type_to_color=None
+):
+    if node_type_to_color is None:
+        node_type_to_color = {}
+
+    # Graph
+    gs = ig.Graph(directed=True)
+
+    # Nodes
+    node_types = pd.unique(
+        pd.concat([schema["source_type"], schema["target_type"]], ignore_index=True)
+    ).tolist()
+    colors = [node_type_to_color.get(node, "") for node in node_types]
+    gs.add_vertices(
+        node_types,
+        {
+            "size": [int(node_type_counts.get(node, 0)) for node in node_types],
+            "color": colors,
+            "label_color": colors,
+            "hover": [
+                f"{node}\n\n{node_type_counts.get(node, 0)} nodes of this type are contained in the knowledge graph."
+                for node in node_types
+            ],
+        },
+    )
+
+    # Edges
+    positions = {node: i for i, node in enumerate(node_types)}
+    ig_edges = [
+        (positions[s], positions[o])
+        for s, o in zip(schema["source_type"], schema["target_type"])
+    ]
+    predicates = schema["edge_type"].tolist()
+    gs.add_edges(
+        ig_edges,
+        {
+            "size": [int(edge_type_counts[p]) for p in predicates],
+            "color": [node_type_to_color.get(s, "") for s in schema["source_type"]],
+            "hover": [
+                f"{p}\n\n{edge_type_counts[p]} edges of this type are contained in the knowledge graph."
+                for p in predicates
+            ],
+            "label": predicates,
+            "label_color": ["gray"] * len(predicates),
+            "label_size": [5] * len(predicates),
+            "count": schema["count"].tolist(),
+        },
+    )
+    return gs
+
+
+# Graph caching
+
+
+def get_graph_builder_version():
+    # Changes to the code that builds a graph invalidate all cached graphs
+    functions = [
+        create_graph,
+        is_dataframe,
+        to_pandas_dataframe,
+        column_to_list,
+        properties_to_columns,
+        ids_to_vertex_indices,
+        id_codes_to_vertex_indices,
+        values_to_list,
+        categorical_to_list,
+        ColumnTable,
+        NodeTable,
+        EdgeTable,
+    ]
+    source = "".join(inspect.getsource(function) for function in functions)
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+def get_graph_cache_key(download_specification, extra=None):
+    md5_hashes = sorted(md5 for _, _, md5 in download_specification)
+    parts = md5_hashes + [get_graph_builder_version(), ig.__version__]
+    if extra is not None:
+        parts.append(json.dumps(extra, sort_keys=True, default=str))
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def save_graph_to_cache(cache_dir, key, graph, nodes=None, edges=None):
+    # Rows are stored as NodeTable/EdgeTable and the graph as an edge array plus compacted
+    # attribute columns, so loading mostly copies arrays instead of creating Python objects
+    entry_dir = os.path.join(cache_dir, key)
+    temp_dir = f"{entry_dir}.tmp{os.getpid()}"
+    old_dir = f"{entry_dir}.old{os.getpid()}"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    try:
+        save_graph_arrays(graph, temp_dir)
+        nodes, edges = to_row_tables(nodes, edges)
+        with open(os.path.join(temp_dir, "rows.pickle"), "wb") as f:
+            pickle.dump((nodes, edges), f, protocol=pickle.HIGHEST_PROTOCOL)
+        meta = {
+            "key": key,
+            "created": time.time(),
+            "builder": get_graph_builder_version(),
+        }
+        with open(os.path.join(temp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        # A previous entry is renamed aside first, so it is never deleted while in place
+        try:
+            os.replace(entry_dir, old_dir)
+        except FileNotFoundError:
+            pass
+        os.replace(temp_dir, entry_dir)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return entry_dir
+
+
+def to_row_tables(nodes, edges):
+    if nodes is not None and not isinstance(nodes, ColumnTable):
+        if is_dataframe(nodes):
+            nodes = NodeTable.from_dataframe(nodes)
+        else:
+            nodes = NodeTable.from_tuples(nodes)
+    if edges is not None and not isinstance(edges, ColumnTable):
+        node_table = nodes if isinstance(nodes, NodeTable) else None
+        if is_dataframe(edges):
+            edges = EdgeTable.from_dataframe(edges, nodes=node_table)
+        else:
+            edges = EdgeTable.from_tuples(edges, node_table)
+    return nodes, edges
+
+
+def compact_attributes(sequence):
+    columns = {}
+    for key in sequence.attributes():
+        values = sequence[key]
+        if key == "_row" and values == list(range(len(values))):
+            columns[key] = None  # recreated as range on loading
+        else:
+            columns[key] = compact_values(values)
+    return columns
+
+
+def save_graph_arrays(graph, directory):
+    edge_list = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    np.save(os.path.join(directory, "graph_edges.npy"), edge_list)
+    data = {
+        "num_vertices": graph.vcount(),
+        "directed": graph.is_directed(),
+        "graph_attributes": {key: graph[key] for key in graph.attributes()},
+        "vertex_attributes": compact_attributes(graph.vs),
+        "edge_attributes": compact_attributes(graph.es),
+    }
+    with open(os.path.join(directory, "graph.pickle"), "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_graph_arrays(directory):
+    with open(os.path.join(directory, "graph.pickle"), "rb") as f:
+        data = pickle.load(f)
+    graph = ig.Graph(n=data["num_vertices"], directed=data["directed"])
+    graph.add_edges(np.load(os.path.join(directory, "graph_edges.npy")))
+    for key, value in data["graph_attributes"].items():
+        graph[key] = value
+    for sequence, columns in (
+        (graph.vs, data["vertex_attributes"]),
+        (graph.es, data["edge_attributes"]),
+    ):
+        for key, column in columns.items():
+            if column is None:
+                sequence[key] = list(range(len(sequence)))
+            else:
+                sequence[key] = values_to_list(*column)
+    return graph
+
+
+def load_graph_from_cache(cache_dir, key):
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isfile(os.path.join(entry_dir, "meta.json")):
+        return None
+    try:
+        graph = load_graph_arrays(entry_dir)
+        with open(os.path.join(entry_dir, "rows.pickle"), "rb") as f:
+            nodes, edges = pickle.load(f)
+        # The access time is used for eviction of least recently used entries
+        os.utime(os.path.join(entry_dir, "meta.json"))
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        # Entries that are replaced or evicted by another process count as missing
+        return None
+    return graph, nodes, edges
+
+
+@instrumented()
+def load_or_create_graph(cache_dir, key, create_nodes_and_edges):
+    # Rows are returned as NodeTable/EdgeTable, both when loaded and when newly created
+    cached = load_graph_from_cache(cache_dir, key)
+    if cached is not None:
+        print(f"Loaded graph from cache entry {key[:12]}.")
+        return cached
+    nodes, edges = create_nodes_and_edges()
+    graph = create_graph(nodes, edges)
+    nodes, edges = to_row_tables(nodes, edges)
+    save_graph_to_cache(cache_dir, key, graph, nodes, edges)
+    print(f"Stored graph in cache entry {key[:12]}.")
+    return graph, nodes, edges
+
+
+def list_graph_cache_entries(cache_dir):
+    entries = []
+    try:
+        names = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return entries
+    for name in names:
+        entry_dir = os.path.join(cache_dir, name)
+        meta_filepath = os.path.join(entry_dir, "meta.json")
+        if not os.path.isfile(meta_filepath):
+            continue
+        size = sum(
+            os.path.getsize(os.path.join(entry_dir, filename))
+            for filename in os.listdir(entry_dir)
+        )
+        last_used = os.path.getmtime(meta_filepath)
+        entries.append((name, size, last_used))
+    return entries
+
+
+def invalidate_graph_cache(cache_dir, key=None):
+    if key is None:
+        keys = [name for name, _, _ in list_graph_cache_entries(cache_dir)]
+    else:
+        keys = [key]
+    for key in keys:
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+    return keys
+
+
+def evict_graph_cache(cache_dir, max_size=None, max_age=None):
+    # max_size in bytes, max_age in seconds since last use
+    entries = sorted(list_graph_cache_entries(cache_dir), key=lambda e: e[2])
+    now = time.time()
+    evicted = []
+    if max_age is not None:
+        for entry in entries:
+            if now - entry[2] > max_age:
+                evicted.append(entry)
+    remaining = [entry for entry in entries if entry not in evicted]
+    if max_size is not None:
+        total_size = sum(size for _, size, _ in remaining)
+        for entry in remaining:
+            if total_size <= max_size:
+                break
+            evicted.append(entry)
+            total_size -= entry[1]
+    for name, _, _ in evicted:
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+    return [name for name, _, _ in evicted]
+
+
+# Data export
+
+
+@instrumented(counter=count_written_files)
+def export_nodes_as_csv(nodes, directory, basename, subgraph=None):
+    num_nodes = len(nodes) if subgraph is None else subgraph.vcount()
+    filename = f"{basename}_nodes_n{num_nodes}.csv"
+    filepath = os.path.join(directory, filename)
+    with open(filepath, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "type", "properties"])
+
+        if subgraph is None:
+            used_nodes = nodes
+        else:
+            used_nodes = filter_nodes_by_subgraph(nodes, subgraph)
+
+        for node_id, node_type, node_properties in used_nodes:
+            writer.writerow([str(node_id), str(node_type), json.dumps(node_properties)])
+    return filepath
+
+
+@instrumented(counter=count_written_files)
+def export_edges_as_csv(edges, directory, basename, subgraph=None):
+    num_edges = len(edges) if subgraph is None else subgraph.ecount()
+    filename = f"{basename}_edges_e{num_edges}.csv"
+    filepath = os.path.join(directory, filename)
+    with open(filepath, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["source_id", "target_id", "type", "properties"])
+
+        if subgraph is None:
+            used_edges = edges
+        else:
+            used_edges = filter_edges_by_subgraph(edges, subgraph)
+
+        for source_id, target_id, edge_type, edge_properties in used_edges:
+            writer.writerow(
+                [source_id, target_id, edge_type, json.dumps(edge_properties)]
+            )
+    return filepath
+
+
+@instrumented(counter=count_written_files)
+def export_nodes_as_parquet(
+    nodes,
+    directory,
+    basename,
+    subgraph=None,
+    compression="zstd",
+    row_group_size=100_000,
+):
+    num_nodes = len(nodes) if subgraph is None else subgraph.vcount()
+    filename = f"{basename}_nodes_n{num_nodes}.parquet"
+    filepath = os.path.join(directory, filename)
+    used_nodes = (
+        nodes if subgraph is None else filter_nodes_by_subgraph(nodes, subgraph)
+    )
+    column_names = ["id", "type"]
+    write_rows_as_columnar(
+        used_nodes, filepath, column_names, "parquet", compression, row_group_size
+    )
+    return filepath
+
+
+@instrumented(counter=count_written_files)
+def export_edges_as_parquet(
+    edges,
+    directory,
+    basename,
+    subgraph=None,
+    compression="zstd",
+    row_group_size=100_000,
+):
+    num_edges = len(edges) if subgraph is None else subgraph.ecount()
+    filename = f"{basename}_edges_e{num_edges}.parquet"
+    filepath = os.path.join(directory, filename)
+    used_edges = (
+        edges if subgraph is None else filter_edges_by_subgraph(edges, subgraph)
+    )
+    column_names = ["source_id", "target_id", "type"]
+    write_rows_as_columnar(
+        used_edges, filepath, column_names, "parquet", compression, row_group_size
+    )
+    return filepath
+
+
+@instrumented(counter=count_written_files)
+def export_nodes_as_arrow(
+    nodes, directory, basename, subgraph=None, compression=None, row_group_size=100_000
+):
+    # Uncompressed Arrow IPC files can be memory-mapped without copying
+    num_nodes = len(nodes) if subgraph is None else subgraph.vcount()
+    filename = f"{basename}_nodes_n{num_nodes}.arrow"
+    filepath = os.path.join(directory, filename)
+    used_nodes = (
+        nodes if subgraph is None else filter_nodes_by_subgraph(nodes, subgraph)
+    )
+    column_names = ["id", "type"]
+    write_rows_as_columnar(
+        used_nodes, filepath, column_names, "arrow", compression, row_group_size
+    )
+    return filepath
+
+
+@instrumented(counter=count_written_files)
+def export_edges_as_arrow(
+    edges, directory, basename, subgraph=None, compression=None, row_group_size=100_000
+):
+    # Uncompressed Arrow IPC files can be memory-mapped without copying
+    num_edges = len(edges) if subgraph is None else subgraph.ecount()
+    filename = f"{basename}_edges_e{num_edges}.arrow"
+    filepath = os.path.join(directory, filename)
+    used_edges = (
+        edges if subgraph is None else filter_edges_by_subgraph(edges, subgraph)
+    )
+    column_names = ["source_id", "target_id", "type"]
+    write_rows_as_columnar(
+        used_edges, filepath, column_names, "arrow", compression, row_group_size
+    )
+    return filepath
+
+
+def is_missing(val):
+    return val is None or val is pd.NA or (isinstance(val, float) and val != val)
+
+
+def infer_arrow_type(python_types, element_types):
+    import pyarrow as pa  # local import because it's not often needed
+
+    if not python_types:
+        return pa.null()
+    if python_types <= {bool}:
+        return pa.bool_()
+    if python_types <= {int}:
+        return pa.int64()
+    if python_types <= {int, float}:
+        return pa.float64()
+    if python_types <= {str}:
+        return pa.string()
+    if python_types <= {list, tuple}:
+        value_type = infer_arrow_type(element_types, set())
+        if value_type is not None and value_type != pa.null():
+            return pa.list_(value_type)
+    # Anything else is stored as text with a type tag column, see to_arrow_values
+    return None
+
+
+def scan_column_types(rows, num_fixed_columns):
+    # First pass: the keys and Python types per column, so that the schema of all
+    # row groups is known before the first one is written
+    fixed_types = [set() for _ in range(num_fixed_columns)]
+    property_types = {}
+    property_element_types = {}
+    for row in rows:
+        for i in range(num_fixed_columns):
+            val = row[i]
+            if not is_missing(val):
+                fixed_types[i].add(type(val))
+        for key, val in row[num_fixed_columns].items():
+            types = property_types.get(key)
+            if types is None:
+                types = property_types[key] = set()
+                property_element_types[key] = set()
+            if is_missing(val):
+                continue
+            types.add(type(val))
+            if isinstance(val, (list, tuple)):
+                property_element_types[key].update(
+                    type(item) for item in val if not is_missing(item)
+                )
+    return fixed_types, property_types, property_element_types
+
+
+def to_arrow_values(values, arrow_type):
+    import pyarrow as pa  # local import because it's not often needed
+
+    if arrow_type is None:
+        # Strings as they are and other values as JSON, like in the CSV export
+        return [
+            (
+                None
+                if is_missing(val)
+                else val if isinstance(val, str) else json.dumps(val)
+            )
+            for val in values
+        ]
+    if pa.types.is_list(arrow_type):
+        return [
+            (
+                None
+                if is_missing(val)
+                else [None if is_missing(item) else item for item in val]
+            )
+            for val in values
+        ]
+    return [None if is_missing(val) else val for val in values]
+
+
+def to_type_tags(values):
+    return [None if is_missing(val) else type(val).__name__ for val in values]
+
+
+def get_unused_name(name, used_names):
+    while name in used_names:
+        name = f"_{name}"
+    used_names.add(name)
+    return name
+
+
+def write_rows_as_columnar(
+    rows, filepath, column_names, file_format, compression, row_group_size
+):
+    import pyarrow as pa  # local import because it's not often needed
+    import pyarrow.parquet as pq
+
+    num_fixed_columns = len(column_names)
+    fixed_types, property_types, property_element_types = scan_column_types(
+        rows, num_fixed_columns
+    )
+
+    # Schema with typed columns, sparse property keys become nullable columns
+    # - A property named like a fixed column gets a "_" prefix, more of them if that name is taken
+    # - Columns that mix strings with other types get a "<name>_type" column with the Python
+    #   type of each value, so that e.g. "1" and 1 can be told apart
+    property_keys = list(property_types)
+    used_names = set(column_names) | set(property_keys)
+    names = list(column_names)
+    arrow_types = [infer_arrow_type(types, set()) for types in fixed_types]
+    for key in property_keys:
+        names.append(
+            key if key not in column_names else get_unused_name(key, used_names)
+        )
+        arrow_types.append(
+            infer_arrow_type(property_types[key], property_element_types[key])
+        )
+    fields = [
+        pa.field(name, pa.string() if arrow_type is None else arrow_type)
+        for name, arrow_type in zip(names, arrow_types)
+    ]
+    column_types = fixed_types + [property_types[key] for key in property_keys]
+    tagged = [
+        i
+        for i, (types, arrow_type) in enumerate(zip(column_types, arrow_types))
+        if arrow_type is None and str in types and len(types) > 1
+    ]
+    for i in tagged:
+        fields.append(
+            pa.field(get_unused_name(f"{names[i]}_type", used_names), pa.string())
+        )
+    schema = pa.schema(fields)
+
+    # Second pass: one bounded batch of rows at a time
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(filepath, schema, compression=compression)
+    elif file_format == "arrow":
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        writer = pa.ipc.new_file(filepath, schema, options=options)
+    else:
+        raise ValueError(
+            f'Unknown file format "{file_format}". Use "parquet" or "arrow".'
+        )
+    with writer:
+        for start in range(0, len(rows), row_group_size):
+            batch_rows = rows[start : start + row_group_size]
+            columns = [[row[i] for row in batch_rows] for i in range(num_fixed_columns)]
+            property_columns = properties_to_columns(
+                [row[num_fixed_columns] for row in batch_rows]
+            )
+            columns += [
+                property_columns.get(key, [None] * len(batch_rows))
+                for key in property_keys
+            ]
+            arrays = [
+                pa.array(to_arrow_values(values, arrow_type), type=field.type)
+                for values, arrow_type, field in zip(columns, arrow_types, schema)
+            ]
+            arrays += [pa.array(to_type_tags(columns[i]), pa.string()) for i in tagged]
+            batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+            if file_format == "parquet":
+                writer.write_batch(batch, row_group_size=row_group_size)
+            else:
+                writer.write_batch(batch)
+    return filepath
+
+
+@instrumented(counter=count_written_files)
+def export_graph_as_graphml(graph, directory, basename):
+    n = graph.vcount()
+    m = graph.ecount()
+    filename = f"{basename}_graph_n{n}_e{m}.graphml"
+    filepath = os.path.join(directory, filename)
+    # Row positions are only kept for subgraph exports and not part of the file format,
+    # so they are removed while writing and restored afterwards instead of copying the graph
+    removed = []
+    for sequence, keys in (
+        (graph, ("_num_node_rows", "_num_edge_rows")),
+        (graph.vs, ("_row",)),
+        (graph.es, ("_row",)),
+    ):
+        for key in keys:
+            if key in sequence.attributes():
+                removed.append((sequence, key, sequence[key]))
+                del sequence[key]
+    try:
+        graph.write_graphml(filepath)
+    finally:
+        for sequence, key, values in removed:
+            sequence[key] = values
+    return filepath
+
+
+# Streaming GraphML export
+# - Written straight from node and edge rows (lists, NodeTable/EdgeTable or dataframes), so neither
+#   an igraph object nor a full copy of the data is needed
+# - A first pass counts the rows and collects the keys that occur with a value and their types,
+#   so only used keys are declared and missing values are left out instead of written as empty data
+# - If node_attributes and edge_attributes are dicts from key to GraphML type, there is no first
+#   pass and rows are read only once, so they can also come from iterators
+# - XML is produced in bounded buffers that a background thread compresses and writes
+
+
+GRAPHML_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<graphml xmlns="http://graphml.graphdrawing.org/xmlns"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+    ' xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns'
+    ' http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n'
+)
+
+GRAPHML_TYPES = {"boolean": {bool}, "long": {int}, "double": {float}, "string": {str}}
+
+XML_SPECIAL_CHARS_PATTERN = re.compile('[&<>"\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+# Markup characters are replaced by entities, characters that XML forbids are dropped
+XML_ESCAPE_TABLE = str.maketrans(
+    {
+        "&": "&amp;",
+        "<": "&lt;",
+        ">": "&gt;",
+        '"': "&quot;",
+        **{chr(c): None for c in [*range(0x09), 0x0B, 0x0C, *range(0x0E, 0x20)]},
+        "\ufffe": None,
+        "\uffff": None,
+    }
+)
+
+
+class ThreadedWriter:
+    # Writes chunks on a background thread, at most max_chunks are waiting at any time
+    def __init__(self, file, max_chunks=8):
+        self._file = file
+        self._queue = queue.Queue(max_chunks)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            if self._error is None:
+                try:
+                    self._file.write(chunk)
+                except Exception as e:
+                    self._error = e
+
+    def write(self, chunk):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(chunk)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
+
+
+def open_compressed_file(filepath, compression, compression_level=None):
+    if compression == "gzip":
+        level = 6 if compression_level is None else compression_level
+        return gzip.open(filepath, "wb", compresslevel=level)
+    if compression == "zstd":
+        import zstandard  # local import because it's not often needed
+
+        level = 3 if compression_level is None else compression_level
+        compressor = zstandard.ZstdCompressor(level=level)
+        return compressor.stream_writer(open(filepath, "wb"))
+    if compression is None:
+        return open(filepath, "wb")
+    raise ValueError(
+        f'Unknown compression "{compression}". Use "gzip", "zstd" or None.'
+    )
+
+
+def iter_dataframe_chunks(data, chunk_size):
+    if hasattr(data, "partitions"):
+        # Dask dataframe, one partition in memory at a time
+        for partition in data.partitions:
+            yield partition.compute()
+    elif hasattr(data, "to_batches"):
+        # Arrow table
+        for batch in data.to_batches(chunk_size):
+            yield batch.to_pandas()
+    else:
+        df = to_pandas_dataframe(data)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start : start + chunk_size]
+
+
+def iter_rows(data, fixed_columns, chunk_size=100_000):
+    # Rows in the default format, dataframe columns that are not fixed become sparse properties
+    if not is_dataframe(data):
+        yield from data
+        return
+    num_fixed_columns = len(fixed_columns)
+    for df in iter_dataframe_chunks(data, chunk_size):
+        property_keys = [key for key in df.columns if key not in fixed_columns]
+        columns = [df[key].tolist() for key in list(fixed_columns) + property_keys]
+        for values in zip(*columns):
+            properties = {
+                key: val
+                for key, val in zip(property_keys, values[num_fixed_columns:])
+                if not is_missing(val)
+            }
+            yield (*values[:num_fixed_columns], properties)
+
+
+def get_given_graphml_types(attributes, num_fixed_columns):
+    # Types of the fixed columns and properties without a first pass, fixed columns are text
+    if not isinstance(attributes, dict):
+        return None
+    for name, attr_type in attributes.items():
+        if attr_type not in GRAPHML_TYPES:
+            raise ValueError(
+                f'Unknown GraphML type "{attr_type}" of attribute "{name}". '
+                f"Use one of {', '.join(GRAPHML_TYPES)}."
+            )
+    fixed_types = [{str} for _ in range(num_fixed_columns)]
+    property_types = {name: GRAPHML_TYPES[t] for name, t in attributes.items()}
+    return fixed_types, property_types
+
+
+def scan_graphml_rows(rows, num_fixed_columns):
+    num_rows = 0
+    fixed_types = [set() for _ in range(num_fixed_columns)]
+    property_types = {}
+    for row in rows:
+        num_rows += 1
+        for i in range(num_fixed_columns):
+            if not is_missing(row[i]):
+                fixed_types[i].add(type(row[i]))
+        for key, val in row[num_fixed_columns].items():
+            if not is_missing(val):
+                types = property_types.get(key)
+                if types is None:
+                    types = property_types[key] = set()
+                types.add(type(val))
+    return num_rows, fixed_types, property_types
+
+
+def infer_graphml_type(python_types):
+    if python_types <= {bool}:
+        return "boolean"
+    if python_types <= {int}:
+        return "long"
+    if python_types <= {int, float}:
+        return "double"
+    # Anything else is written as text, other objects as JSON like in the CSV export
+    return "string"
+
+
+def create_graphml_keys(
+    domain, prefix, fixed_names, fixed_types, property_types, attributes
+):
+    # fixed_names holds the attribute name of each fixed column, None if it is not stored as data
+    fixed_keys = []
+    property_keys = []
+    declarations = []
+    for i, (name, types) in enumerate(zip(fixed_names, fixed_types)):
+        if name is not None and types:
+            key_id = f"{prefix}{len(declarations)}"
+            attr_type = infer_graphml_type(types)
+            fixed_keys.append((i, f'<data key="{key_id}">', attr_type))
+            declarations.append((key_id, name, attr_type))
+    for name, types in property_types.items():
+        if attributes is None or name in attributes:
+            key_id = f"{prefix}{len(declarations)}"
+            attr_type = infer_graphml_type(types)
+            property_keys.append((name, f'<data key="{key_id}">', attr_type))
+            used_name = f"_{name}" if name in fixed_names else name
+            declarations.append((key_id, used_name, attr_type))
+    lines = [
+        f'  <key id="{key_id}" for="{domain}" attr.name="{escape_xml(name)}" attr.type="{attr_type}"/>\n'
+        for key_id, name, attr_type in declarations
+    ]
+    return fixed_keys, property_keys, lines
+
+
+def escape_xml(text):
+    # Most values contain nothing to escape and a search is faster than translating them
+    if XML_SPECIAL_CHARS_PATTERN.search(text) is None:
+        return text
+    return text.translate(XML_ESCAPE_TABLE)
+
+
+def format_graphml_value(val, attr_type):
+    if attr_type == "string":
+        return escape_xml(val if isinstance(val, str) else json.dumps(val))
+    if attr_type == "long":
+        return str(val)
+    if attr_type == "double":
+        return repr(float(val))
+    return "true" if val else "false"
+
+
+def format_graphml_data(row, fixed_keys, property_keys):
+    # Keys hold the opening tag of their data element instead of only the key id
+    parts = []
+    for i, tag, attr_type in fixed_keys:
+        val = row[i]
+        if not is_missing(val):
+            parts += [tag, format_graphml_value(val, attr_type), "</data>"]
+    properties = row[-1]
+    for name, tag, attr_type in property_keys:
+        val = properties.get(name)
+        if not is_missing(val):
+            parts += [tag, format_graphml_value(val, attr_type), "</data>"]
+    return "".join(parts)
+
+
+@instrumented(counter=count_written_files)
+def export_nodes_and_edges_as_graphml(
+    nodes,
+    edges,
+    directory,
+    basename,
+    compression="gzip",
+    node_attributes=None,
+    edge_attributes=None,
+    directed=True,
+    compression_level=None,
+    chunk_size=100_000,
+    buffer_size=1024 * 1024,
+):
+    node_columns = ["id", "type"]
+    edge_columns = ["source_id", "target_id", "type"]
+
+    # First pass unless the types are given: the keys that occur with a value and their types
+    given_node_types = get_given_graphml_types(node_attributes, 2)
+    given_edge_types = get_given_graphml_types(edge_attributes, 3)
+    if given_node_types is None or given_edge_types is None:
+        for data in (nodes, edges):
+            if not is_dataframe(data) and iter(data) is data:
+                raise TypeError(
+                    "Rows are read twice, pass a list or table instead of an iterator, "
+                    "or give node_attributes and edge_attributes with their types."
+                )
+    if given_node_types is None:
+        _, fixed_types, property_types = scan_graphml_rows(
+            iter_rows(nodes, node_columns, chunk_size), 2
+        )
+    else:
+        fixed_types, property_types = given_node_types
+    node_fixed_keys, node_property_keys, node_key_lines = create_graphml_keys(
+        "node", "v", ["name", "type"], fixed_types, property_types, node_attributes
+    )
+    if given_edge_types is None:
+        _, fixed_types, property_types = scan_graphml_rows(
+            iter_rows(edges, edge_columns, chunk_size), 3
+        )
+    else:
+        fixed_types, property_types = given_edge_types
+    edge_fixed_keys, edge_property_keys, edge_key_lines = create_graphml_keys(
+        "edge", "e", [None, None, "type"], fixed_types, property_types, edge_attributes
+    )
+
+    # The numbers of rows in the filename are only known after writing
+    extension = {"gzip": ".gz", "zstd": ".zst"}.get(compression, "")
+    temp_filepath = os.path.join(
+        directory, f"{basename}_graph.graphml{extension}.{os.getpid()}.part"
+    )
+    writer = ThreadedWriter(
+        open_compressed_file(temp_filepath, compression, compression_level)
+    )
+    buffer = []
+    buffer_length = 0
+
+    def write(text):
+        nonlocal buffer_length
+        buffer.append(text)
+        buffer_length += len(text)
+        if buffer_length >= buffer_size:
+            writer.write("".join(buffer).encode())
+            buffer.clear()
+            buffer_length = 0
+
+    # Second pass: elements in the order of the rows
+    try:
+        write(GRAPHML_HEADER)
+        for line in node_key_lines + edge_key_lines:
+            write(line)
+        edgedefault = "directed" if directed else "undirected"
+        write(f'  <graph id="G" edgedefault="{edgedefault}">\n')
+        num_nodes = 0
+        for row in iter_rows(nodes, node_columns, chunk_size):
+            num_nodes += 1
+            node_id = escape_xml(str(row[0]))
+            data = format_graphml_data(row, node_fixed_keys, node_property_keys)
+            write(f'    <node id="{node_id}">{data}</node>\n')
+        num_edges = 0
+        for row in iter_rows(edges, edge_columns, chunk_size):
+            num_edges += 1
+            source_id = escape_xml(str(row[0]))
+            target_id = escape_xml(str(row[1]))
+            data = format_graphml_data(row, edge_fixed_keys, edge_property_keys)
+            write(
+                f'    <edge source="{source_id}" target="{target_id}">{data}</edge>\n'
+            )
+        write("  </graph>\n</graphml>\n")
+        writer.write("".join(buffer).encode())
+    except BaseException:
+        with contextlib.suppress(Exception):
+            writer.close()
+        delete_file(temp_filepath)
+        raise
+    writer.close()
+    filename = f"{basename}_graph_n{num_nodes}_e{num_edges}.graphml{extension}"
+    filepath = os.path.join(directory, filename)
+    os.replace(temp_filepath, filepath)
+    return filepath
+
+
+# Data filtering
+
+
+def gather_rows(data, rows, num_rows=None):
+    # Rows are positions in the nodes or edges given to create_graph, so data has to be that same
+    # list, NodeTable/EdgeTable or dataframe and not a filtered or reordered copy of it
+    if (num_rows is not None and len(data) != num_rows) or (
+        rows and rows[-1] >= len(data)
+    ):
+        raise ValueError(
+            "Subgraph rows do not match the data, pass the nodes and edges the graph was created from."
+        )
+    if isinstance(data, ColumnTable):
+        return data.take(rows)
+    if is_dataframe(data):
+        return to_pandas_dataframe(data).iloc[rows]
+    return [data[i] for i in rows]
+
+
+def get_graph_attribute(graph, key):
+    return graph[key] if key in graph.attributes() else None
+
+
+def filter_nodes_by_subgraph(nodes, subgraph):
+    if "_row" in subgraph.vs.attributes():
+        # Gather rows directly by their original position instead of scanning all nodes
+        num_rows = get_graph_attribute(subgraph, "_num_node_rows")
+        return gather_rows(nodes, sorted(subgraph.vs["_row"]), num_rows)
+
+    node_ids = set(subgraph.vs["name"])
+    filtered_nodes = [node for node in nodes if node[0] in node_ids]
+    return filtered_nodes
+
+
+def filter_edges_by_subgraph(edges, subgraph):
+    if "_row" in subgraph.es.attributes():
+        # Gather rows directly by their original position instead of scanning all edges
+        num_rows = get_graph_attribute(subgraph, "_num_edge_rows")
+        return gather_rows(edges, sorted(subgraph.es["_row"]), num_rows)
+
+    names = subgraph.vs["name"]
+    edge_ids = set(
+        (names[s], names[t], edge_type)
+        for (s, t), edge_type in zip(subgraph.get_edgelist(), subgraph.es["type"])
+    )
+    filtered_edges = [edge for edge in edges if edge[0:3] in edge_ids]
+    return filtered_edges
+
+
+# Node search
+# - Trigram index over the lowercased UTF-8 bytes of a node attribute
+# - Posting lists are stored in CSR layout: trigram_offsets[k]:trigram_offsets[k+1] are the postings of trigrams[k]
+# - Adjacency indexes can be searched like graphs, their node ids are read from the id dictionary
+#   without creating Python strings
+
+
+def create_search_index(graph, target=None):
+    attribute = "name" if target is None else str(target)
+    if isinstance(graph, dict) and attribute == "name":
+        values, offsets = graph["id_dictionary"].to_lowercase_strings()
+    else:
+        if has_node_attribute(graph, attribute):
+            column = get_node_values(graph, attribute)
+        else:
+            column = [""] * get_node_count(graph)
+        values, offsets = encode_strings(str(val).lower() for val in column)
+    lengths = np.diff(offsets)
+
+    # All trigrams of all values in one vectorized pass, without those spanning two values
+    owners = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+    if len(values) >= 3:
+        codes = trigram_codes(values)
+        valid = owners[:-2] == owners[2:]
+        pairs = np.unique(codes[valid] << 32 | owners[:-2][valid])
+    else:
+        pairs = np.zeros(0, dtype=np.int64)
+    trigrams, counts = np.unique(pairs >> 32, return_counts=True)
+    trigram_offsets = np.zeros(len(trigrams) + 1, dtype=np.int64)
+    np.cumsum(counts, out=trigram_offsets[1:])
+
+    index = {
+        "target": attribute,
+        "values": values,
+        "offsets": offsets,
+        "trigrams": trigrams.astype(np.int32),
+        "trigram_offsets": trigram_offsets,
+        "postings": (pairs & 0xFFFFFFFF).astype(np.int32),
+    }
+    return index
+
+
+def trigram_codes(values):
+    values = values.astype(np.int64)
+    return values[:-2] << 16 | values[1:-1] << 8 | values[2:]
+
+
+def get_search_index(graph, target=None):
+    # Built lazily on the first query and kept on the graph object for later ones, together with
+    # the indexed column so that reassigned values are noticed (a fast comparison, because igraph
+    # returns the same value objects as long as the attribute is unchanged)
+    attribute = "name" if target is None else str(target)
+    indexes = get_search_index_cache(graph)
+    column = get_search_column(graph, attribute)
+    cached = indexes.get(attribute)
+    if cached is None or cached[0] != column:
+        cached = (column, create_search_index(graph, target))
+        indexes[attribute] = cached
+    return cached[1]
+
+
+def get_search_index_cache(graph):
+    if isinstance(graph, dict):
+        return graph.setdefault("search_indexes", {})
+    return graph.__dict__.setdefault("_search_indexes", {})
+
+
+def get_search_column(graph, attribute):
+    if isinstance(graph, dict):
+        return None  # adjacency indexes don't change
+    if attribute in graph.vs.attributes():
+        return graph.vs[attribute]
+    return graph.vcount()
+
+
+def get_node_count(graph):
+    if isinstance(graph, dict):
+        return graph["num_nodes"]
+    return graph.vcount()
+
+
+def has_node_attribute(graph, key):
+    if isinstance(graph, dict):
+        return (
+            key in ("name", "type") or get_index_node_attribute(graph, key) is not None
+        )
+    return key in graph.vs.attributes()
+
+
+def get_node_values(graph, key, codes=None):
+    # Values of all nodes or of the nodes with the given codes (vertex indices)
+    if codes is not None and len(codes) == 0:
+        return []
+    if not isinstance(graph, dict):
+        if codes is None:
+            return graph.vs[key]
+        return graph.vs.select(codes)[key]
+    if codes is None:
+        codes = np.arange(graph["num_nodes"])
+    if key == "name":
+        return graph["id_dictionary"].decode(codes)
+    if key == "type":
+        node_types = graph["node_types"]
+        return [node_types[code] for code in graph["node_type_codes"][codes].tolist()]
+    return get_index_node_attribute(graph, key).take(codes)
+
+
+def get_index_node_attribute(index, key):
+    # Columns are looked up by the names they get in create_graph_from_adjacency_index
+    for original_key, column in index["node_attributes"].items():
+        if {"type": "_type", "name": "_name"}.get(original_key, original_key) == key:
+            return column
+    return None
+
+
+def save_search_index(index, filepath):
+    arrays = {key: val for key, val in index.items() if key != "target"}
+    np.savez(filepath, target=np.array(index["target"]), **arrays)
+    return filepath
+
+
+def load_search_index(filepath, graph=None):
+    with np.load(filepath) as data:
+        index = {key: data[key] for key in data.files}
+    index["target"] = str(index["target"])
+    if graph is not None:
+        column = get_search_column(graph, index["target"])
+        get_search_index_cache(graph)[index["target"]] = (column, index)
+    return index
+
+
+def search_index(index, query, mode="substring", limit=None):
+    if mode not in ("substring", "prefix", "exact"):
+        raise ValueError(
+            f'Unknown search mode "{mode}". Use "substring", "prefix" or "exact".'
+        )
+    query = query.lower().encode()
+    values = index["values"]
+    offsets = index["offsets"]
+    if not query and mode != "exact":
+        # Every value contains and starts with the empty string
+        return list(range(len(offsets) - 1))[:limit]
+
+    if len(query) >= 3:
+        # Candidates from the intersection of posting lists, shortest list first
+        codes = np.unique(trigram_codes(np.frombuffer(query, dtype=np.uint8)))
+        trigrams = index["trigrams"]
+        positions = np.searchsorted(trigrams, codes)
+        if np.any(positions >= len(trigrams)) or np.any(trigrams[positions] != codes):
+            return []
+        starts = index["trigram_offsets"][positions]
+        ends = index["trigram_offsets"][positions + 1]
+        order = np.argsort(ends - starts)
+        candidates = index["postings"][starts[order[0]] : ends[order[0]]]
+        for k in order[1:]:
+            candidates = np.intersect1d(
+                candidates, index["postings"][starts[k] : ends[k]], assume_unique=True
+            )
+    elif mode == "substring":
+        # Too short for trigrams, so all occurrences are found in the contiguous buffer
+        buffer = values.tobytes()
+        starts = []
+        start = buffer.find(query)
+        while start != -1:
+            starts.append(start)
+            start = buffer.find(query, start + 1)
+        starts = np.array(starts, dtype=np.int64)
+        owners = np.searchsorted(offsets, starts, side="right") - 1
+        within = starts + len(query) <= offsets[owners + 1]
+        candidates = np.unique(owners[within])
+    else:
+        candidates = np.arange(len(offsets) - 1)
+
+    # Verification of candidates against their full value
+    matches = []
+    for i in candidates.tolist():
+        value = values[offsets[i] : offsets[i + 1]].tobytes()
+        if mode == "substring":
+            found = query in value
+        elif mode == "prefix":
+            found = value.startswith(query)
+        else:
+            found = value == query
+        if found:
+            matches.append(i)
+            if limit is not None and len(matches) >= limit:
+                break
+    return matches
+
+
+# Adjacency indexes
+# - For each direction, edges are stored in CSR layout grouped by the node they leave from
+# - "all" covers every edge with dense offsets: offsets[v]:offsets[v+1] are the edges of node v
+# - "by_type" holds one compressed CSR per edge type code over only the nodes that have such edges
+# - Undirected graphs store each edge in both orientations and use "out" for every direction
+
+
+def create_adjacency_index(graph, edge_type_attribute="type"):
+    n = graph.vcount()
+    edge_list = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    edge_ids = np.arange(len(edge_list), dtype=np.int64)
+    if edge_type_attribute in graph.es.attributes():
+        type_codes, edge_types = pd.factorize(
+            pd.Series(graph.es[edge_type_attribute], dtype=object),
+            use_na_sentinel=False,
+        )
+        type_codes = np.asarray(type_codes, dtype=np.int64)
+    else:
+        type_codes, edge_types = np.zeros(len(edge_list), dtype=np.int64), [None]
+    sources, targets = edge_list[:, 0], edge_list[:, 1]
+    if not graph.is_directed():
+        sources, targets = (
+            np.concatenate([sources, targets]),
+            np.concatenate([targets, sources]),
+        )
+        edge_ids = np.concatenate([edge_ids, edge_ids])
+        type_codes = np.concatenate([type_codes, type_codes])
+
+    def build_direction(starts, ends):
+        direction = {"all": build_csr(starts, ends, edge_ids, n), "by_type": {}}
+        order = np.argsort(type_codes, kind="stable")
+        codes, firsts = np.unique(type_codes[order], return_index=True)
+        for code, first, last in zip(codes, firsts, list(firsts[1:]) + [len(order)]):
+            selection = order[first:last]
+            direction["by_type"][int(code)] = build_csr(
+                starts[selection], ends[selection], edge_ids[selection]
+            )
+        return direction
+
+    index = {
+        "directed": graph.is_directed(),
+        "num_nodes": n,
+        "num_edges": graph.ecount(),
+        "edge_type_attribute": edge_type_attribute,
+        "edge_types": list(edge_types),
+        "edge_type_codes": type_codes[: graph.ecount()],
+        "out": build_direction(sources, targets),
+    }
+    if graph.is_directed():
+        index["in"] = build_direction(targets, sources)
+    return index
+
+
+def build_csr(starts, ends, edge_ids, num_nodes=None):
+    order = np.lexsort((edge_ids, starts))
+    starts = starts[order]
+    if num_nodes is None:
+        nodes, firsts = np.unique(starts, return_index=True)
+        offsets = np.append(firsts, len(starts)).astype(np.int64)
+    else:
+        nodes = None
+        offsets = np.searchsorted(starts, np.arange(num_nodes + 1)).astype(np.int64)
+    csr = {
+        "nodes": nodes,
+        "offsets": offsets,
+        "neighbors": ends[order],
+        "edge_ids": edge_ids[order],
+    }
+    return csr
+
+
+def get_adjacency_index(graph, edge_type_attribute="type"):
+    # Built lazily on the first query and kept on the graph object for later ones
+    if isinstance(graph, dict):
+        # Index from load_adjacency_index used in place of a graph
+        return graph
+    indexes = graph.__dict__.setdefault("_adjacency_indexes", {})
+    index = indexes.get(edge_type_attribute)
+    if (
+        index is None
+        or index["num_nodes"] != graph.vcount()
+        or index["num_edges"] != graph.ecount()
+    ):
+        index = create_adjacency_index(graph, edge_type_attribute)
+        indexes[edge_type_attribute] = index
+    return index
+
+
+def get_node_degrees(index):
+    degrees = np.diff(index["out"]["all"]["offsets"])
+    if index["directed"]:
+        degrees = degrees + np.diff(index["in"]["all"]["offsets"])
+    return degrees
+
+
+def get_edge_type_codes(index, edge_types):
+    if edge_types is None:
+        return None
+    if isinstance(edge_types, str):
+        edge_types = [edge_types]
+    wanted = set(edge_types)
+    return [code for code, val in enumerate(index["edge_types"]) if val in wanted]
+
+
+def get_node_mask(graph, node_types, node_type_attribute="type"):
+    if isinstance(graph, dict):
+        num_nodes = graph["num_nodes"]
+    else:
+        num_nodes = graph.vcount()
+    if node_types is None:
+        return np.ones(num_nodes, dtype=bool)
+    if isinstance(node_types, str):
+        node_types = [node_types]
+    if isinstance(graph, dict):
+        codes = [
+            code
+            for code, node_type in enumerate(graph["node_types"])
+            if node_type in node_types
+        ]
+        return np.isin(graph["node_type_codes"], codes)
+    if node_type_attribute not in graph.vs.attributes():
+        return np.zeros(graph.vcount(), dtype=bool)
+    values = pd.Series(graph.vs[node_type_attribute], dtype=object)
+    return values.isin(list(node_types)).to_numpy(copy=True)
+
+
+def expand_csr(csr, frontier):
+    if csr["nodes"] is not None:
+        positions = np.searchsorted(csr["nodes"], frontier)
+        positions = np.minimum(positions, max(len(csr["nodes"]) - 1, 0))
+        found = csr["nodes"][positions] == frontier if len(csr["nodes"]) else []
+        frontier, positions = frontier[found], positions[found]
+    else:
+        positions = frontier
+    begins = csr["offsets"][positions]
+    counts = csr["offsets"][positions + 1] - begins
+    total = int(counts.sum())
+    shifts = np.repeat(begins - (np.cumsum(counts) - counts), counts)
+    selection = shifts + np.arange(total, dtype=np.int64)
+    return (
+        np.repeat(frontier, counts),
+        csr["neighbors"][selection],
+        csr["edge_ids"][selection],
+    )
+
+
+def expand_frontier(index, frontier, direction="out", edge_type_codes=None):
+    # Returns (from, to, edge id) for every edge leaving the frontier in the given direction
+    frontier = np.asarray(frontier, dtype=np.int64)
+    if not index["directed"]:
+        directions = ["out"]
+    elif direction == "all":
+        directions = ["out", "in"]
+    elif direction in ("out", "in"):
+        directions = [direction]
+    else:
+        raise ValueError(f'direction must be "out", "in" or "all", not {direction!r}')
+    parts = []
+    for name in directions:
+        if edge_type_codes is None:
+            parts.append(expand_csr(index[name]["all"], frontier))
+        else:
+            for code in edge_type_codes:
+                parts.append(expand_csr(index[name]["by_type"][code], frontier))
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+def resolve_vertex(graph, node):
+    if isinstance(graph, dict):
+        num_nodes = graph["num_nodes"]
+    else:
+        num_nodes = graph.vcount()
+    if isinstance(node, (int, np.integer)):
+        if not 0 <= node < num_nodes:
+            raise ValueError(f"Node index {node} is out of range.")
+        return int(node)
+    if isinstance(graph, dict):
+        code = int(graph["id_dictionary"].encode([node])[0])
+        if code < 0:
+            raise ValueError(f"Node id {node!r} is not in the index.")
+        return code
+    return graph.vs.find(name=node).index
+
+
+# Out-of-core adjacency indexes
+# - Built straight from node and edge frames that come in partitions (Dask, Arrow batches or
+#   slices of a pandas dataframe), so neither an igraph object nor all edges are held in memory
+# - Partitions are read in threads with only the needed columns, node ids get integer codes from
+#   one IdentifierDictionary and edge partitions are encoded against it and spilled to disk
+# - The CSR arrays have the layout of create_adjacency_index but are written to files in a
+#   directory and memory-mapped, along with the edge list, node types and the id dictionary
+# - Node and edge attributes are only materialized for the columns that are asked for, each
+#   column is written to files and values are decoded when they are accessed
+# - The index can be passed instead of a graph to the path search, or be turned into an igraph
+#   object with create_graph_from_adjacency_index
+
+
+def get_partition_loaders(data, columns, chunk_size=1_000_000):
+    # One function per partition that returns it as pandas dataframe with only the given columns
+    if hasattr(data, "to_delayed"):
+        return [
+            functools.partial(part.compute, scheduler="synchronous")
+            for part in data[columns].to_delayed()
+        ]
+    if hasattr(data, "to_batches"):
+        batches = data.select(columns).to_batches(max_chunksize=chunk_size)
+        return [batch.to_pandas for batch in batches]
+    data = to_pandas_dataframe(data)[columns]
+    return [
+        functools.partial(data.iloc.__getitem__, slice(start, start + chunk_size))
+        for start in range(0, max(len(data), 1), chunk_size)
+    ]
+
+
+def map_partitions(function, loaders, max_workers=None):
+    # Results come in partition order, at most max_workers partitions are loaded at the same time
+    max_workers = max_workers or os.cpu_count() or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        pending = []
+        for load in loaders:
+            pending.append(executor.submit(lambda load: function(load()), load))
+            if len(pending) >= max_workers:
+                yield pending.pop(0).result()
+        while pending:
+            yield pending.pop(0).result()
+
+
+def merge_categories(local_codes, local_categories, categories):
+    # Maps the codes of one partition to codes of all categories seen so far, new ones are appended
+    lookup = [
+        categories.setdefault(None if is_missing(val) else val, len(categories))
+        for val in pd.Index(local_categories).tolist()
+    ]
+    return np.array(lookup, dtype=np.int32)[local_codes]
+
+
+def create_array_file(directory, arrays, name, dtype, length):
+    arrays[name] = [np.dtype(dtype).name, int(length)]
+    filepath = os.path.join(directory, f"{name}.bin")
+    if length == 0:
+        open(filepath, "wb").close()
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(filepath, dtype=dtype, mode="w+", shape=(int(length),))
+
+
+def load_array_file(directory, name, dtype, length):
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    filepath = os.path.join(directory, f"{name}.bin")
+    return np.memmap(filepath, dtype=dtype, mode="r", shape=(length,))
+
+
+class AttributeColumn:
+    # Values of one attribute: a tag per value (0 missing, 1 text, 2 JSON of any other value)
+    # and the UTF-8 bytes of the texts in one buffer, like the local parts of an id dictionary
+    parts = ["tags", "buffer", "offsets"]
+
+    def __init__(self, tags, buffer, offsets):
+        self.tags = tags
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.tags)
+
+    def take(self, codes):
+        codes = np.asarray(codes, dtype=np.int64)
+        starts = self.offsets[codes].tolist()
+        ends = self.offsets[codes + 1].tolist()
+        return [
+            decode_attribute_value(tag, self.buffer[start:end].tobytes())
+            for tag, start, end in zip(self.tags[codes].tolist(), starts, ends)
+        ]
+
+    def tolist(self, chunk_size=1_000_000):
+        values = []
+        for begin in range(0, len(self), chunk_size):
+            end = min(begin + chunk_size, len(self))
+            base = int(self.offsets[begin])
+            data = self.buffer[base : int(self.offsets[end])].tobytes()
+            offsets = (self.offsets[begin : end + 1] - base).tolist()
+            for i, tag in enumerate(self.tags[begin:end].tolist()):
+                text = data[offsets[i] : offsets[i + 1]]
+                values.append(decode_attribute_value(tag, text))
+        return values
+
+
+class AttributeColumnWriter:
+    # Appends the values of one attribute partition by partition to the files of an AttributeColumn
+    def __init__(self, directory, name):
+        self.name = name
+        self.files = {
+            part: open(os.path.join(directory, f"{name}_{part}.bin"), "wb")
+            for part in AttributeColumn.parts
+        }
+        np.zeros(1, dtype=np.int64).tofile(self.files["offsets"])
+        self.num_values = 0
+        self.num_bytes = 0
+
+    def append(self, values):
+        tags, buffer, offsets = encode_attribute_values(values)
+        tags.tofile(self.files["tags"])
+        buffer.tofile(self.files["buffer"])
+        (offsets[1:] + self.num_bytes).tofile(self.files["offsets"])
+        self.num_values += len(tags)
+        self.num_bytes += len(buffer)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def add_to(self, arrays):
+        arrays[f"{self.name}_tags"] = ["uint8", self.num_values]
+        arrays[f"{self.name}_buffer"] = ["uint8", self.num_bytes]
+        arrays[f"{self.name}_offsets"] = ["int64", self.num_values + 1]
+
+
+def encode_attribute_values(values):
+    # Missing values of any kind (None, NaN, pd.NA) become None when decoded
+    tags = np.zeros(len(values), dtype=np.uint8)
+    texts = []
+    for i, val in enumerate(values):
+        if is_missing(val):
+            texts.append("")
+        elif isinstance(val, str):
+            tags[i] = 1
+            texts.append(val)
+        else:
+            tags[i] = 2
+            texts.append(json.dumps(val, default=str))
+    buffer, offsets = encode_strings(texts)
+    return tags, buffer, offsets
+
+
+def decode_attribute_value(tag, data):
+    if tag == 0:
+        return None
+    text = data.decode()
+    return text if tag == 1 else json.loads(text)
+
+
+def load_attribute_columns(directory, arrays, prefix, keys):
+    return {
+        key: AttributeColumn(
+            *[
+                load_array_file(
+                    directory, f"{prefix}{i}_{part}", *arrays[f"{prefix}{i}_{part}"]
+                )
+                for part in AttributeColumn.parts
+            ]
+        )
+        for i, key in enumerate(keys)
+    }
+
+
+def write_csr_files(
+    directory, arrays, prefix, orientations, type_codes, n, num_types, chunk_size
+):
+    # Edges are scattered chunk by chunk into their slots, so they end up grouped by node and
+    # ordered by edge id within a node like in build_csr
+    m = len(type_codes)
+    degrees = np.zeros(n, dtype=np.int64)
+    for begin in range(0, m, chunk_size):
+        for starts, _ in orientations:
+            degrees += np.bincount(starts[begin : begin + chunk_size], minlength=n)
+    offsets = create_array_file(
+        directory, arrays, f"{prefix}_all_offsets", np.int64, n + 1
+    )
+    offsets[0] = 0
+    np.cumsum(degrees, out=offsets[1:])
+    total = int(offsets[-1])
+    neighbors = create_array_file(
+        directory, arrays, f"{prefix}_all_neighbors", np.int64, total
+    )
+    edge_ids = create_array_file(
+        directory, arrays, f"{prefix}_all_edge_ids", np.int64, total
+    )
+    slot_types = create_array_file(
+        directory, {}, f"{prefix}_slot_types", np.int32, total
+    )
+    cursor = np.array(offsets[:-1])
+    for begin in range(0, m, chunk_size):
+        chunk_ids = np.arange(begin, min(begin + chunk_size, m), dtype=np.int64)
+        starts = np.concatenate([starts[chunk_ids] for starts, _ in orientations])
+        ends = np.concatenate([ends[chunk_ids] for _, ends in orientations])
+        chunk_ids = np.tile(chunk_ids, len(orientations))
+        order = np.lexsort((chunk_ids, starts))
+        nodes, firsts, counts = np.unique(
+            starts[order], return_index=True, return_counts=True
+        )
+        positions = np.repeat(cursor[nodes] - firsts, counts) + np.arange(len(order))
+        cursor[nodes] += counts
+        neighbors[positions] = ends[order]
+        edge_ids[positions] = chunk_ids[order]
+        slot_types[positions] = type_codes[chunk_ids[order]]
+
+    # One compressed CSR per edge type, filled from ranges of nodes with about chunk_size slots
+    nodes_by_type = [[] for _ in range(num_types)]
+    counts_by_type = [[] for _ in range(num_types)]
+    for code in range(num_types):
+        for key in ("neighbors", "edge_ids"):
+            open(
+                os.path.join(directory, f"{prefix}_type{code}_{key}.bin"), "wb"
+            ).close()
+    bounds = np.searchsorted(offsets, np.arange(chunk_size, total, chunk_size))
+    bounds = np.unique(np.concatenate([[0], bounds, [n]]))
+    for v0, v1 in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        a, b = int(offsets[v0]), int(offsets[v1])
+        slot_nodes = np.repeat(np.arange(v0, v1, dtype=np.int64), degrees[v0:v1])
+        order = np.argsort(slot_types[a:b], kind="stable")
+        codes, firsts = np.unique(slot_types[a:b][order], return_index=True)
+        for code, first, last in zip(codes, firsts, list(firsts[1:]) + [len(order)]):
+            selection = order[first:last]
+            nodes, counts = np.unique(slot_nodes[selection], return_counts=True)
+            nodes_by_type[code].append(nodes)
+            counts_by_type[code].append(counts)
+            for key, values in (("neighbors", neighbors), ("edge_ids", edge_ids)):
+                name = f"{prefix}_type{code}_{key}"
+                with open(os.path.join(directory, f"{name}.bin"), "ab") as f:
+                    np.asarray(values[a + selection], dtype=np.int64).tofile(f)
+    for code in range(num_types):
+        nodes = np.concatenate([np.zeros(0, dtype=np.int64)] + nodes_by_type[code])
+        counts = np.concatenate([np.zeros(0, dtype=np.int64)] + counts_by_type[code])
+        type_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=type_offsets[1:])
+        for key, values in (("nodes", nodes), ("offsets", type_offsets)):
+            array = create_array_file(
+                directory, arrays, f"{prefix}_type{code}_{key}", np.int64, len(values)
+            )
+            array[:] = values
+            del array
+        for key in ("neighbors", "edge_ids"):
+            arrays[f"{prefix}_type{code}_{key}"] = ["int64", int(type_offsets[-1])]
+    del neighbors, edge_ids, slot_types
+    os.remove(os.path.join(directory, f"{prefix}_slot_types.bin"))
+
+
+@instrumented()
+def create_adjacency_index_from_partitions(
+    nodes,
+    edges,
+    directory,
+    node_id_column="id",
+    node_type_column="type",
+    source_column="source_id",
+    target_column="target_id",
+    edge_type_column="type",
+    directed=True,
+    node_attributes=None,
+    edge_attributes=None,
+    chunk_size=1_000_000,
+    max_workers=None,
+):
+    node_attributes = list(node_attributes or [])
+    edge_attributes = list(edge_attributes or [])
+    os.makedirs(directory, exist_ok=True)
+    arrays = {}
+
+    # Nodes: codes follow the order of the partitions, the first row of a node id wins
+    # - The id dictionary is extended partition by partition, and the rows, types and attribute
+    #   values of the ids that are new in a partition are appended to files
+    def read_nodes(df):
+        type_codes, types = pd.factorize(df[node_type_column], use_na_sentinel=False)
+        values = [df[key].tolist() for key in node_attributes]
+        return df[node_id_column].tolist(), type_codes, types, values
+
+    columns = list(dict.fromkeys([node_id_column, node_type_column] + node_attributes))
+    loaders = get_partition_loaders(nodes, columns, chunk_size)
+    id_dictionary = IdentifierDictionary.empty()
+    node_types = {}
+    num_node_rows = 0
+    with contextlib.ExitStack() as stack:
+        files = [
+            stack.enter_context(open(os.path.join(directory, f"{name}.bin"), "wb"))
+            for name in ("node_rows", "node_type_codes")
+        ]
+        node_writers = []
+        for i in range(len(node_attributes)):
+            node_writers.append(AttributeColumnWriter(directory, f"node_attribute{i}"))
+            stack.callback(node_writers[-1].close)
+        for ids, type_codes, types, values in map_partitions(
+            read_nodes, loaders, max_workers
+        ):
+            num_known = len(id_dictionary)
+            id_dictionary = id_dictionary.extend(ids)
+            codes = id_dictionary.encode(ids)
+            del ids
+            new_positions = np.flatnonzero(codes >= num_known)
+            _, first = np.unique(codes[new_positions], return_index=True)
+            rows = new_positions[first]
+            type_codes = merge_categories(type_codes, types, node_types)
+            (num_node_rows + rows).astype(np.int64).tofile(files[0])
+            type_codes[rows].tofile(files[1])
+            for writer, column in zip(node_writers, values):
+                writer.append([column[i] for i in rows.tolist()])
+            num_node_rows += len(codes)
+    n = len(id_dictionary)
+    arrays["node_rows"] = ["int64", n]
+    arrays["node_type_codes"] = ["int32", n]
+    for writer in node_writers:
+        writer.add_to(arrays)
+    id_dictionary.save(os.path.join(directory, "ids"))
+
+    # Edges: endpoints become node codes, partitions are appended to files in edge id order
+    def read_edges(df):
+        sources = id_dictionary.encode(df[source_column].tolist())
+        targets = id_dictionary.encode(df[target_column].tolist())
+        if (sources < 0).any() or (targets < 0).any():
+            raise ValueError("Edge endpoint does not refer to a known node id.")
+        type_codes, types = pd.factorize(df[edge_type_column], use_na_sentinel=False)
+        values = [df[key].tolist() for key in edge_attributes]
+        return sources, targets, type_codes, types, values
+
+    columns = [source_column, target_column, edge_type_column] + edge_attributes
+    loaders = get_partition_loaders(edges, list(dict.fromkeys(columns)), chunk_size)
+    edge_types = {}
+    m = 0
+    with contextlib.ExitStack() as stack:
+        files = [
+            stack.enter_context(open(os.path.join(directory, f"{name}.bin"), "wb"))
+            for name in ("sources", "targets", "edge_type_codes")
+        ]
+        edge_writers = []
+        for i in range(len(edge_attributes)):
+            edge_writers.append(AttributeColumnWriter(directory, f"edge_attribute{i}"))
+            stack.callback(edge_writers[-1].close)
+        for sources, targets, type_codes, types, values in map_partitions(
+            read_edges, loaders, max_workers
+        ):
+            type_codes = merge_categories(type_codes, types, edge_types)
+            for f, array in zip(files, (sources, targets, type_codes)):
+                array.tofile(f)
+            for writer, column in zip(edge_writers, values):
+                writer.append(column)
+            m += len(sources)
+    for name, dtype in (
+        ("sources", "int64"),
+        ("targets", "int64"),
+        ("edge_type_codes", "int32"),
+    ):
+        arrays[name] = [dtype, m]
+    for writer in edge_writers:
+        writer.add_to(arrays)
+
+    # CSR files per direction, undirected graphs store both orientations under "out"
+    sources, targets, type_codes = (
+        load_array_file(directory, name, *arrays[name])
+        for name in ("sources", "targets", "edge_type_codes")
+    )
+    if directed:
+        directions = {"out": [(sources, targets)], "in": [(targets, sources)]}
+    else:
+        directions = {"out": [(sources, targets), (targets, sources)]}
+    for prefix, orientations in directions.items():
+        write_csr_files(
+            directory,
+            arrays,
+            prefix,
+            orientations,
+            type_codes,
+            n,
+            len(edge_types),
+            chunk_size,
+        )
+    del sources, targets, type_codes
+
+    metadata = {
+        "directed": directed,
+        "num_nodes": n,
+        "num_edges": m,
+        "num_node_rows": num_node_rows,
+        "edge_type_attribute": "type",
+        "edge_types": list(edge_types),
+        "node_types": list(node_types),
+        "node_attributes": node_attributes,
+        "edge_attributes": edge_attributes,
+        "arrays": arrays,
+    }
+    with open(os.path.join(directory, "index.json"), "w") as f:
+        json.dump(metadata, f)
+    return load_adjacency_index(directory)
+
+
+def load_adjacency_index(directory):
+    with open(os.path.join(directory, "index.json")) as f:
+        metadata = json.load(f)
+    array_shapes = metadata.pop("arrays")
+    arrays = {
+        name: load_array_file(directory, name, dtype, length)
+        for name, (dtype, length) in array_shapes.items()
+    }
+
+    def load_direction(prefix):
+        keys = ("offsets", "neighbors", "edge_ids")
+        direction = {
+            "all": {"nodes": None, **{k: arrays[f"{prefix}_all_{k}"] for k in keys}},
+            "by_type": {},
+        }
+        for code in range(len(metadata["edge_types"])):
+            direction["by_type"][code] = {
+                key: arrays[f"{prefix}_type{code}_{key}"] for key in ("nodes",) + keys
+            }
+        return direction
+
+    index = dict(metadata)
+    index["edge_type_codes"] = arrays["edge_type_codes"]
+    index["out"] = load_direction("out")
+    if index["directed"]:
+        index["in"] = load_direction("in")
+    for name in ("sources", "targets", "node_rows", "node_type_codes"):
+        index[name] = arrays[name]
+    for prefix in ("node", "edge"):
+        index[f"{prefix}_attributes"] = load_attribute_columns(
+            directory,
+            array_shapes,
+            f"{prefix}_attribute",
+            metadata[f"{prefix}_attributes"],
+        )
+    index["id_dictionary"] = IdentifierDictionary.load(os.path.join(directory, "ids"))
+    return index
+
+
+@instrumented(counter=count_graph)
+def create_graph_from_adjacency_index(index, chunk_size=1_000_000):
+    # Same attributes as create_graph for the materialized columns, vertex names are the ids as strings
+    node_types = np.array(index["node_types"], dtype=object)
+    edge_types = np.array(index["edge_types"], dtype=object)
+    node_attributes = {
+        "name": list(index["id_dictionary"]),
+        "type": node_types[index["node_type_codes"]].tolist(),
+    }
+    edge_attributes = {"type": edge_types[index["edge_type_codes"]].tolist()}
+    for attributes, values in (
+        (node_attributes, index["node_attributes"]),
+        (edge_attributes, index["edge_attributes"]),
+    ):
+        for key, column in values.items():
+            used_key = {"type": "_type", "name": "_name"}.get(key, key)
+            attributes[used_key] = column.tolist()
+    node_attributes["_row"] = np.asarray(index["node_rows"]).tolist()
+    edge_attributes["_row"] = list(range(index["num_edges"]))
+    g = ig.Graph(n=index["num_nodes"], directed=index["directed"])
+    for begin in range(0, index["num_edges"], chunk_size):
+        end = begin + chunk_size
+        g.add_edges(
+            zip(
+                index["sources"][begin:end].tolist(),
+                index["targets"][begin:end].tolist(),
+            )
+        )
+    for key, column in node_attributes.items():
+        g.vs[key] = column
+    for key, column in edge_attributes.items():
+        g.es[key] = column
+    g["_num_node_rows"] = index["num_node_rows"]
+    g["_num_edge_rows"] = index["num_edges"]
+
+    # The file-backed index is reused by the queries on the graph instead of being rebuilt
+    g.__dict__.setdefault("_adjacency_indexes", {})[
+        index["edge_type_attribute"]
+    ] = index
+    return g
+
+
+# Path search
+# - Shortest paths are never enumerated but kept as a predecessor DAG found by bidirectional BFS
+# - DAG edges are arrays from/to/edge_ids/steps, where steps[i] is the position of from[i] on every path using it
+# - Node type restrictions apply to intermediate nodes, the source and target are always allowed
+
+
+def find_shortest_path_dag(
+    graph,
+    source,
+    target,
+    max_length=None,
+    node_types=None,
+    edge_types=None,
+    direction="out",
+    allowed_nodes=None,
+    allowed_edges=None,
+):
+    index = get_adjacency_index(graph)
+    codes = get_edge_type_codes(index, edge_types)
+    s = resolve_vertex(graph, source)
+    t = resolve_vertex(graph, target)
+    allowed = get_node_mask(graph, node_types)
+    if allowed_nodes is not None:
+        allowed &= allowed_nodes
+    allowed[[s, t]] = True
+    backward = {"out": "in", "in": "out", "all": "all"}[direction]
+    empty = np.zeros(0, dtype=np.int64)
+    dag = {"source": s, "target": t, "length": 0}
+    dag.update({"from": empty, "to": empty, "edge_ids": empty, "steps": empty})
+    if s == t:
+        return dag
+
+    def expand(frontier, frontier_direction):
+        starts, ends, edge_ids = expand_frontier(
+            index, frontier, frontier_direction, codes
+        )
+        if allowed_edges is not None:
+            keep = allowed_edges[edge_ids]
+            starts, ends, edge_ids = starts[keep], ends[keep], edge_ids[keep]
+        return starts, ends, edge_ids
+
+    # Bidirectional BFS, always growing the smaller frontier by one full layer
+    n = index["num_nodes"]
+    dist_f = np.full(n, -1, dtype=np.int64)
+    dist_b = np.full(n, -1, dtype=np.int64)
+    dist_f[s] = 0
+    dist_b[t] = 0
+    frontier_f = np.array([s], dtype=np.int64)
+    frontier_b = np.array([t], dtype=np.int64)
+    depth_f = depth_b = 0
+    while len(frontier_f) and len(frontier_b):
+        if max_length is not None and depth_f + depth_b >= max_length:
+            return None
+        if len(frontier_f) <= len(frontier_b):
+            _, ends, _ = expand(frontier_f, direction)
+            ends = np.unique(ends)
+            frontier_f = ends[(dist_f[ends] < 0) & allowed[ends]]
+            depth_f += 1
+            dist_f[frontier_f] = depth_f
+            met = frontier_f[dist_b[frontier_f] >= 0]
+        else:
+            _, ends, _ = expand(frontier_b, backward)
+            ends = np.unique(ends)
+            frontier_b = ends[(dist_b[ends] < 0) & allowed[ends]]
+            depth_b += 1
+            dist_b[frontier_b] = depth_b
+            met = frontier_b[dist_f[frontier_b] >= 0]
+        if len(met):
+            break
+    else:
+        return None
+
+    # Trace the DAG back from the meeting layer towards both ends
+    length = depth_f + depth_b
+    parts = []
+    layer = met
+    for step in range(depth_f - 1, -1, -1):
+        starts, ends, edge_ids = expand(layer, backward)
+        keep = dist_f[ends] == step
+        parts.append((ends[keep], starts[keep], edge_ids[keep], step))
+        layer = np.unique(ends[keep])
+    layer = met
+    for step in range(depth_b - 1, -1, -1):
+        starts, ends, edge_ids = expand(layer, direction)
+        keep = dist_b[ends] == step
+        parts.append((starts[keep], ends[keep], edge_ids[keep], length - step - 1))
+        layer = np.unique(ends[keep])
+    dag["length"] = length
+    dag["from"] = np.concatenate([part[0] for part in parts])
+    dag["to"] = np.concatenate([part[1] for part in parts])
+    dag["edge_ids"] = np.concatenate([part[2] for part in parts])
+    dag["steps"] = np.concatenate(
+        [np.full(len(part[0]), part[3], dtype=np.int64) for part in parts]
+    )
+    return dag
+
+
+def count_dag_paths(dag):
+    # Counts distinct node sequences, parallel edges between two nodes are not counted twice
+    if dag["length"] == 0:
+        return 1
+    pairs = np.unique(np.stack([dag["from"], dag["to"], dag["steps"]], axis=1), axis=0)
+    counts = {dag["source"]: 1}
+    for step in range(dag["length"]):
+        layer = pairs[pairs[:, 2] == step]
+        next_counts = {}
+        for u, v in layer[:, :2].tolist():
+            next_counts[v] = next_counts.get(v, 0) + counts.get(u, 0)
+        counts = next_counts
+    return counts.get(dag["target"], 0)
+
+
+def iter_dag_paths(dag, limit=None):
+    # Depth-first enumeration in node index order, yields lists of vertex indices
+    successors = {}
+    for u, v in sorted(set(zip(dag["from"].tolist(), dag["to"].tolist()))):
+        successors.setdefault(u, []).append(v)
+    num_paths = 0
+    path = [dag["source"]]
+    stack = [iter(successors.get(dag["source"], []))]
+    if dag["length"] == 0:
+        yield list(path)
+        return
+    while stack:
+        if limit is not None and num_paths >= limit:
+            return
+        v = next(stack[-1], None)
+        if v is None:
+            stack.pop()
+            path.pop()
+        elif v == dag["target"]:
+            num_paths += 1
+            yield path + [v]
+        else:
+            path.append(v)
+            stack.append(iter(successors.get(v, [])))
+
+
+def find_k_shortest_paths(
+    graph,
+    source,
+    target,
+    k,
+    max_length=None,
+    node_types=None,
+    edge_types=None,
+    direction="out",
+):
+    # Yen's algorithm on top of the DAG search, returns up to k simple paths as lists of vertex indices
+    index = get_adjacency_index(graph)
+    codes = get_edge_type_codes(index, edge_types)
+    dag = find_shortest_path_dag(
+        graph, source, target, max_length, node_types, edge_types, direction
+    )
+    if dag is None or k < 1:
+        return []
+    paths = [tuple(next(iter_dag_paths(dag)))]
+    seen = set(paths)
+    candidates = []
+    while len(paths) < k:
+        last = paths[-1]
+        for i in range(len(last) - 1):
+            root = last[: i + 1]
+            allowed_edges = np.ones(index["num_edges"], dtype=bool)
+            for path in paths:
+                if path[: i + 1] == root:
+                    allowed_edges[
+                        get_edge_ids_between(
+                            index, path[i], path[i + 1], direction, codes
+                        )
+                    ] = False
+            allowed_nodes = np.ones(index["num_nodes"], dtype=bool)
+            allowed_nodes[list(root[:-1])] = False
+            spur_dag = find_shortest_path_dag(
+                graph,
+                root[-1],
+                dag["target"],
+                None if max_length is None else max_length - i,
+                node_types,
+                edge_types,
+                direction,
+                allowed_nodes,
+                allowed_edges,
+            )
+            if spur_dag is None:
+                continue
+            candidate = root[:-1] + tuple(next(iter_dag_paths(spur_dag)))
+            if candidate not in seen:
+                seen.add(candidate)
+                heapq.heappush(candidates, (len(candidate), candidate))
+        if not candidates:
+            break
+        paths.append(heapq.heappop(candidates)[1])
+    return [list(path) for path in paths]
+
+
+def get_edge_ids_between(index, u, v, direction="out", edge_type_codes=None):
+    _, ends, edge_ids = expand_frontier(index, [u], direction, edge_type_codes)
+    return edge_ids[ends == v].tolist()
+
+
+# Graph operations
+
+
+def report_graph_stats(graph):
+    n = graph.vcount()
+    m = graph.ecount()
+    density = graph.density()
+    directed = "directed" if graph.is_directed() else "undirected"
+    multi = "multi" if graph.has_multiple() else ""
+    print(
+        f"{directed.title()} {multi}graph with {n} nodes, {m} edges and a density of {density:.4}."
+    )
+
+
+@instrumented()
+def profile_graph(graph, num_hubs=10):
+    # All statistics are computed on NumPy arrays of the edge list, not on vertex proxies
+    n = graph.vcount()
+    m = graph.ecount()
+    edge_list = np.array(graph.get_edgelist(), dtype=np.int64).reshape(m, 2)
+    sources = edge_list[:, 0]
+    targets = edge_list[:, 1]
+    out_degrees = np.bincount(sources, minlength=n)
+    in_degrees = np.bincount(targets, minlength=n)
+    degrees = out_degrees + in_degrees
+
+    profile = {
+        "num_nodes": n,
+        "num_edges": m,
+        "directed": graph.is_directed(),
+        "density": graph.density() if n > 1 else 0.0,
+        "num_self_loops": int(np.count_nonzero(sources == targets)),
+        "num_multi_edges": int(m - len(np.unique(sources * n + targets))),
+        "num_isolated_nodes": int(np.count_nonzero(degrees == 0)),
+    }
+
+    # Connected components
+    membership = np.array(graph.connected_components(mode="weak").membership)
+    component_sizes = np.bincount(membership) if n > 0 else np.zeros(0, np.int64)
+    sizes, counts = np.unique(component_sizes, return_counts=True)
+    profile["num_components"] = len(component_sizes)
+    profile["largest_component_size"] = int(component_sizes.max(initial=0))
+    profile["component_size_counts"] = {
+        int(size): int(count) for size, count in zip(sizes, counts)
+    }
+
+    # Edge types
+    if "type" in graph.es.attributes() and m > 0:
+        edge_type_codes, edge_types = pd.factorize(pd.Series(graph.es["type"]))
+        edge_type_counts = np.bincount(edge_type_codes[edge_type_codes >= 0])
+        profile["edge_type_counts"] = {
+            str(edge_type): int(count)
+            for edge_type, count in sorted(
+                zip(edge_types, edge_type_counts), key=lambda item: -item[1]
+            )
+        }
+    else:
+        profile["edge_type_counts"] = {}
+
+    # Degree distributions and hubs per node type
+    if "type" in graph.vs.attributes() and n > 0:
+        node_type_codes, node_types = pd.factorize(pd.Series(graph.vs["type"]))
+    else:
+        node_type_codes = np.zeros(n, dtype=np.int64)
+        node_types = ["all"] if n > 0 else []
+    names = graph.vs["name"] if "name" in graph.vs.attributes() else list(range(n))
+    profile["node_types"] = {}
+    for code, node_type in enumerate(node_types):
+        members = np.flatnonzero(node_type_codes == code)
+        type_degrees = degrees[members]
+        bins = np.floor(np.log2(type_degrees[type_degrees > 0])).astype(np.int64)
+        bin_counts = np.bincount(bins) if len(bins) > 0 else []
+        hubs = members[np.argsort(-type_degrees, kind="stable")[:num_hubs]]
+        profile["node_types"][str(node_type)] = {
+            "num_nodes": int(len(members)),
+            "num_isolated_nodes": int(np.count_nonzero(type_degrees == 0)),
+            "degree_min": int(type_degrees.min()),
+            "degree_max": int(type_degrees.max()),
+            "degree_mean": float(type_degrees.mean()),
+            "degree_median": float(np.median(type_degrees)),
+            "degree_p99": float(np.percentile(type_degrees, 99)),
+            # Number of nodes with a degree in [2^k, 2^(k+1)) for k = 0, 1, ...
+            "degree_log2_histogram": [int(count) for count in bin_counts],
+            "top_hubs": [
+                {
+                    "id": (
+                        names[i] if isinstance(names[i], (int, str)) else str(names[i])
+                    ),
+                    "degree": int(degrees[i]),
+                    "in_degree": int(in_degrees[i]),
+                    "out_degree": int(out_degrees[i]),
+                }
+                for i in hubs.tolist()
+            ],
+        }
+    return profile
+
+
+@instrumented(counter=count_written_files)
+def export_graph_profile_as_json(profile, directory, basename):
+    n = profile["num_nodes"]
+    m = profile["num_edges"]
+    filename = f"{basename}_profile_n{n}_e{m}.json"
+    filepath = os.path.join(directory, filename)
+    with open(filepath, "w") as f:
+        json.dump(profile, f, indent=2)
+    return filepath
+
+
+def list_nodes_matching_substring(
+    graph, substring, target=None, mode="substring", limit=None, verbose=True
+):
+    # graph can also be an adjacency index, e.g. from create_adjacency_index_from_partitions
+    sep = 4
+    if target is None or has_node_attribute(graph, str(target)):
+        index = get_search_index(graph, target)
+        matches = search_index(index, substring, mode, limit)
+    else:
+        matches = []
+    node_ids = [str(val) for val in get_node_values(graph, "name", matches)]
+    node_types = [str(val) for val in get_node_values(graph, "type", matches)]
+
+    if target is None:
+        data = sorted(zip(node_ids, node_types))
+        if verbose:
+            id_len = max([1] + [len(node_id) for node_id in node_ids]) + sep
+            type_len = max([1] + [len(node_type) for node_type in node_types]) + sep
+            print(f"{'id':<{id_len}}{'type':<{type_len}}")
+            print("=" * (id_len + type_len))
+            for node_id, node_type in data:
+                print(f"{node_id:<{id_len}}{node_type:<{type_len}}")
+    else:
+        target = str(target)
+        node_properties = [str(val) for val in get_node_values(graph, target, matches)]
+        data = sorted(zip(node_ids, node_types, node_properties))
+        if verbose:
+            id_len = max([1] + [len(node_id) for node_id in node_ids]) + sep
+            type_len = max([1] + [len(node_type) for node_type in node_types]) + sep
+            property_len = max([1] + [len(val) for val in node_properties]) + sep
+            print(f"{'id':<{id_len}}{'type':<{type_len}}{target:<{property_len}}")
+            print("=" * (id_len + type_len + property_len))
+            for node_id, node_type, node_property in data:
+                print(
+                    f"{node_id:<{id_len}}{node_type:<{type_len}}{node_property:<{property_len}}"
+                )
+    return data
+
+
+def get_egocentric_subgraph(
+    graph,
+    node_id,
+    order=1,
+    direction="all",
+    edge_types=None,
+    node_types=None,
+    max_degree=None,
+    merge=True,
+):
+    # node_id can also be a list of seeds, which gives one merged subgraph or one per seed
+    index = get_adjacency_index(graph)
+    codes = get_edge_type_codes(index, edge_types)
+    allowed = get_node_mask(graph, node_types)
+    is_batch = isinstance(node_id, (list, tuple, set, np.ndarray, pd.Index))
+    seeds = [resolve_vertex(graph, val) for val in (node_id if is_batch else [node_id])]
+    groups = [seeds] if merge else [[seed] for seed in seeds]
+    subgraphs = []
+    for group in groups:
+        vertices = find_neighborhood(
+            index, group, order, direction, codes, allowed, max_degree
+        )
+        subgraph = graph.induced_subgraph(vertices)
+        if codes is not None and subgraph.ecount():
+            wanted = set(index["edge_types"][code] for code in codes)
+            values = subgraph.es[index["edge_type_attribute"]]
+            subgraph.delete_edges(
+                [i for i, val in enumerate(values) if val not in wanted]
+            )
+        subgraphs.append(subgraph)
+    if is_batch and not merge:
+        return subgraphs
+    return subgraphs[0]
+
+
+def find_neighborhood(
+    index,
+    seeds,
+    order=1,
+    direction="all",
+    edge_type_codes=None,
+    allowed_nodes=None,
+    max_degree=None,
+):
+    # Breadth-first expansion one full layer at a time, nodes above max_degree
+    # are included but not expanded further unless they are seeds
+    n = index["num_nodes"]
+    visited = np.zeros(n, dtype=bool)
+    frontier = np.unique(np.asarray(seeds, dtype=np.int64))
+    visited[frontier] = True
+    if max_degree is not None:
+        degrees = get_node_degrees(index)
+    for _ in range(order):
+        if not len(frontier):
+            break
+        _, ends, _ = expand_frontier(index, frontier, direction, edge_type_codes)
+        ends = np.unique(ends)
+        ends = ends[~visited[ends]]
+        if allowed_nodes is not None:
+            ends = ends[allowed_nodes[ends]]
+        visited[ends] = True
+        frontier = ends
+        if max_degree is not None:
+            frontier = frontier[degrees[frontier] <= max_degree]
+    return np.flatnonzero(visited).tolist()
+
+
+def get_paths_subgraph(
+    graph,
+    source,
+    target,
+    max_length=None,
+    max_paths=None,
+    node_types=None,
+    edge_types=None,
+    k_shortest=None,
+    direction="out",
+):
+    index = get_adjacency_index(graph)
+    if k_shortest is not None:
+        paths = find_k_shortest_paths(
+            graph,
+            source,
+            target,
+            k_shortest,
+            max_length,
+            node_types,
+            edge_types,
+            direction,
+        )
+        codes = get_edge_type_codes(index, edge_types)
+        edge_ids = [
+            eid
+            for path in paths
+            for u, v in zip(path[:-1], path[1:])
+            for eid in get_edge_ids_between(index, u, v, direction, codes)
+        ]
+    else:
+        dag = find_shortest_path_dag(
+            graph, source, target, max_length, node_types, edge_types, direction
+        )
+        if dag is None:
+            edge_ids = []
+        elif max_paths is not None and count_dag_paths(dag) > max_paths:
+            # Only keep the edges of the first max_paths paths instead of the whole DAG
+            pairs = set()
+            for path in iter_dag_paths(dag, limit=max_paths):
+                pairs.update(zip(path[:-1], path[1:]))
+            edge_ids = [
+                eid
+                for u, v, eid in zip(
+                    dag["from"].tolist(), dag["to"].tolist(), dag["edge_ids"].tolist()
+                )
+                if (u, v) in pairs
+            ]
+        else:
+            edge_ids = dag["edge_ids"].tolist()
+    subgraph = graph.subgraph_edges(sorted(set(edge_ids)))
+    return subgraph
+
+
+def visualize_graph(
+    graph,
+    node_type_to_color=None,
+    source=None,
+    target=None,
+    max_nodes=None,
+    elide="sample",
+    max_hover_length=1000,
+    verbose=True,
+):
+    if node_type_to_color is None:
+        node_type_to_color = {}
+    if elide not in ("sample", "aggregate"):
+        raise ValueError(f'elide must be "sample" or "aggregate", not {elide!r}')
+
+    # Node columns
+    n = graph.vcount()
+    attributes = graph.vs.attribute_names()
+    names = graph.vs["name"] if "name" in attributes else [None] * n
+    types = graph.vs["type"] if "type" in attributes else [None] * n
+    property_keys = sorted(k for k in attributes if k not in ["name", "type", "_row"])
+    property_columns = [graph.vs[k] for k in property_keys]
+    is_source = find_vis_node(names, source)
+    is_target = find_vis_node(names, target)
+
+    # Render budget
+    kept = np.arange(n)
+    elided = {}
+    if max_nodes is not None and n > max_nodes:
+        kept, elided = select_nodes_for_rendering(
+            graph, types, is_source | is_target, max_nodes
+        )
+    mapping = np.full(n, -1, dtype=np.int64)
+    mapping[kept] = np.arange(len(kept))
+    aggregate_types = []
+    if elided and elide == "aggregate":
+        aggregate_types = list(elided)
+        aggregate_index = {t: len(kept) + i for i, t in enumerate(aggregate_types)}
+        dropped = np.flatnonzero(mapping < 0)
+        mapping[dropped] = [aggregate_index[types[i]] for i in dropped]
+
+    # Nodes
+    def shorten(string, max_length):
+        if len(string) > max_length:
+            n = int(max_length / 2 - 3)
+            string = string[:n] + " ... " + string[-n:]
+        return string
+
+    vis_names = []
+    vis_hovers = []
+    vis_colors = []
+    vis_sizes = []
+    vis_x = []
+    vis_y = []
+    has_coords = "x" in attributes and "y" in attributes
+    x_column = graph.vs["x"] if has_coords else None
+    y_column = graph.vs["y"] if has_coords else None
+    for i in kept.tolist():
+        node_properties_str = "\n".join(
+            f" <b>{k}:</b> {shorten(str(column[i]), 120)}"
+            for k, column in zip(property_keys, property_columns)
+            if column[i] not in [None, "", []]
+        )
+        hover = f"<b>id:</b>{names[i]}\n<b>type:</b>{types[i]}\n<b>properties:</b>\n{node_properties_str}"
+        x = x_column[i] if has_coords else None
+        y = y_column[i] if has_coords else None
+        size = None
+        if is_source[i]:
+            x, y, size = (0 if target is None else -500), 0, 20
+        if is_target[i]:
+            x, y, size = (0 if source is None else +500), 0, 20
+        vis_names.append(names[i])
+        vis_hovers.append(shorten(hover, max_hover_length))
+        vis_colors.append(node_type_to_color.get(types[i], None))
+        vis_sizes.append(size)
+        vis_x.append(x)
+        vis_y.append(y)
+    for node_type in aggregate_types:
+        count = elided[node_type]
+        vis_names.append(f"{count} more {node_type}")
+        vis_hovers.append(
+            f"<b>type:</b>{node_type}\n<b>elided nodes:</b> {count}\n"
+            "Increase max_nodes to show them individually."
+        )
+        vis_colors.append(node_type_to_color.get(node_type, None))
+        vis_sizes.append(20)
+        vis_x.append(None)
+        vis_y.append(None)
+
+    # Edges
+    edge_list = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    edge_types = (
+        np.array(graph.es["type"], dtype=object)
+        if "type" in graph.es.attribute_names()
+        else np.full(len(edge_list), None, dtype=object)
+    )
+    pairs = mapping[edge_list] if len(edge_list) else edge_list
+    keep_edges = (pairs >= 0).all(axis=1)
+    pairs = pairs[keep_edges]
+    edge_hovers = edge_types[keep_edges]
+    if aggregate_types:
+        # Collapse parallel edges to and from aggregate nodes into one edge each
+        to_aggregate = (pairs >= len(kept)).any(axis=1)
+        collapsed, counts = np.unique(pairs[to_aggregate], axis=0, return_counts=True)
+        pairs = np.concatenate([pairs[~to_aggregate], collapsed])
+        edge_hovers = np.concatenate(
+            [edge_hovers[~to_aggregate], [f"{c} elided edges" for c in counts]]
+        )
+
+    # Graph
+    g_vis = ig.Graph(
+        n=len(vis_names), edges=pairs.tolist(), directed=graph.is_directed()
+    )
+    g_vis.vs["name"] = vis_names
+    g_vis.vs["hover"] = vis_hovers
+    g_vis.vs["click"] = ["$hover"] * len(vis_names)
+    g_vis.vs["color"] = vis_colors
+    g_vis.vs["size"] = vis_sizes
+    if has_coords or is_source.any() or is_target.any():
+        g_vis.vs["x"] = vis_x
+        g_vis.vs["y"] = vis_y
+    g_vis.es["hover"] = edge_hovers.tolist()
+
+    if elided and verbose:
+        num_elided = sum(elided.values())
+        action = "Aggregated" if elide == "aggregate" else "Elided"
+        print(
+            f"{action} {num_elided} of {n} nodes to stay within max_nodes={max_nodes}:"
+        )
+        for node_type, count in sorted(elided.items(), key=lambda x: -x[1]):
+            print(f"- {node_type}: {count}")
+
+    # Visualization
+    fig = gv.d3(
+        g_vis,
+        node_label_data_source="name",
         many_body_force_strength=-1500,
         edge_curvature=0.1,
         node_hover_neighborhood=True,
     )
     return fig
+
+
+def find_vis_node(names, node):
+    mask = np.zeros(len(names), dtype=bool)
+    if node is None:
+        return mask
+    if isinstance(node, (int, np.integer)) and 0 <= node < len(names):
+        mask[node] = True
+    mask |= np.array([name == node for name in names], dtype=bool)
+    return mask
+
+
+def select_nodes_for_rendering(graph, types, required, max_nodes):
+    # Keep required nodes, then the highest-degree nodes of each type,
+    # with slots shared between types in proportion to their size
+    type_codes, type_names = pd.factorize(
+        pd.Series(types, dtype=object), use_na_sentinel=False
+    )
+    degrees = np.asarray(graph.degree(), dtype=np.int64)
+    selected = required.copy()
+    budget = max(max_nodes - int(selected.sum()), 0)
+    candidates = np.flatnonzero(~selected)
+    if budget and len(candidates):
+        counts = np.bincount(type_codes[candidates], minlength=len(type_names))
+        quotas = np.floor(counts * budget / len(candidates)).astype(np.int64)
+        remainder = budget - int(quotas.sum())
+        if remainder > 0:
+            order = np.argsort(
+                -(counts * budget / len(candidates) - quotas), kind="stable"
+            )
+            quotas[order[:remainder]] += 1
+        quotas = np.minimum(quotas, counts)
+        order = np.lexsort((candidates, -degrees[candidates], type_codes[candidates]))
+        ranked = candidates[order]
+        ranked_codes = type_codes[ranked]
+        starts = np.searchsorted(ranked_codes, ranked_codes)
+        rank_in_type = np.arange(len(ranked)) - starts
+        selected[ranked[rank_in_type < quotas[ranked_codes]]] = True
+    kept = np.flatnonzero(selected)
+    elided = {}
+    for i in np.flatnonzero(~selected).tolist():
+        elided[types[i]] = elided.get(types[i], 0) + 1
+    return kept, elided
+
+
+# Batch queries
+# - A query spec is a dict with "query" (a key of QUERY_FUNCTIONS), the keyword arguments of that
+#   function and optionally "export": {"directory": ..., "basename": ..., "formats": [...]}
+# - Worker processes are forked after the graph and its indexes are built, so they read them
+#   copy-on-write instead of receiving a pickled copy
+# - Each batch passes its state to the initializer of its own workers, so concurrent batches
+#   don't share any module-level state
+
+
+QUERY_FUNCTIONS = {
+    "search": list_nodes_matching_substring,
+    "neighborhood": get_egocentric_subgraph,
+    "paths": get_paths_subgraph,
+}
+
+WORKER_QUERY_STATE = {}
+
+
+def run_graph_queries(
+    graph, queries, nodes=None, edges=None, max_workers=None, return_graphs=False
+):
+    # Yields (position, result) pairs in order of completion
+    queries = list(queries)
+    get_adjacency_index(graph)
+    for spec in queries:
+        if spec["query"] == "search":
+            target = spec.get("target")
+            if target is None or str(target) in graph.vs.attributes():
+                get_search_index(graph, target)
+    state = {
+        "graph": graph,
+        "nodes": nodes,
+        "edges": edges,
+        "return_graphs": return_graphs,
+    }
+    if max_workers is None:
+        max_workers = min(len(queries), os.cpu_count() or 1)
+    if max_workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        for position, spec in enumerate(queries):
+            yield run_graph_query(position, spec, state)
+        return
+    # With fork, the initializer arguments are inherited by the workers and not pickled
+    context = multiprocessing.get_context("fork")
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=context,
+        initializer=init_graph_query_worker,
+        initargs=(state,),
+    )
+    try:
+        futures = [
+            executor.submit(run_graph_query, position, spec)
+            for position, spec in enumerate(queries)
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def init_graph_query_worker(state):
+    # Runs once in every worker process, which only ever serves one batch
+    WORKER_QUERY_STATE.update(state)
+
+
+def run_graph_query(position, spec, state=None):
+    state = WORKER_QUERY_STATE if state is None else state
+    kwargs = {key: val for key, val in spec.items() if key not in ["query", "export"]}
+    if spec["query"] == "search":
+        kwargs.setdefault("verbose", False)
+    output = QUERY_FUNCTIONS[spec["query"]](state["graph"], **kwargs)
+    result = {"query": spec["query"]}
+    if spec["query"] == "search":
+        result["data"] = output
+        return position, result
+
+    # Neighborhood queries with several seeds and merge=False return one subgraph per seed
+    subgraphs = output if isinstance(output, list) else [output]
+    result["subgraphs"] = []
+    for i, subgraph in enumerate(subgraphs):
+        entry = {"num_nodes": subgraph.vcount(), "num_edges": subgraph.ecount()}
+        if "export" in spec:
+            export = dict(spec["export"])
+            if len(subgraphs) > 1:
+                export["basename"] = f"{export['basename']}_{i}"
+            entry["files"] = export_subgraph(
+                subgraph, state["nodes"], state["edges"], **export
+            )
+        if state["return_graphs"]:
+            entry["graph"] = subgraph
+        result["subgraphs"].append(entry)
+    return position, result
+
+
+@instrumented()
+def export_subgraph(subgraph, nodes, edges, directory, basename, formats=("csv",)):
+    exporters = {
+        "csv": (export_nodes_as_csv, export_edges_as_csv),
+        "parquet": (export_nodes_as_parquet, export_edges_as_parquet),
+        "arrow": (export_nodes_as_arrow, export_edges_as_arrow),
+    }
+    if isinstance(formats, str):
+        formats = [formats]
+    filepaths = []
+    for file_format in formats:
+        if file_format == "graphml":
+            filepaths.append(export_graph_as_graphml(subgraph, directory, basename))
+            continue
+        export_nodes, export_edges = exporters[file_format]
+        if nodes is not None:
+            filepaths.append(export_nodes(nodes, directory, basename, subgraph))
+        if edges is not None:
+            filepaths.append(export_edges(edges, directory, basename, subgraph))
+    return filepaths
+
+
+# Pipelines
+# - A pipeline is a list of stages created by create_pipeline_stage, each stage calls its function
+#   with the results of the stages it requires (in order) followed by its params as keyword arguments
+# - Stages with cache=True must return a filepath or a list of filepaths: their result is stored
+#   in the state directory together with a fingerprint and the size and modification time of the
+#   returned files, and they are skipped while all of these are unchanged
+# - A fingerprint covers the stage's code, params and the fingerprints of the stages it requires,
+#   a stage that has to run invalidates every cached stage that depends on it
+# - The code of a stage is the source of its function and of the functions, classes and constants
+#   it references in its own module or in this one, directly or through the functions it calls,
+#   so edits elsewhere in these modules don't invalidate it
+# - Uncached stages (e.g. reading files into memory) only run when a stage that needs their result
+#   runs, and their result is released once all of its consumers are finished
+# - Independent stages run concurrently in threads, the number of running stages per "pool" can be
+#   limited, e.g. to run memory-heavy stages one after another
+
+
+def create_pipeline_stage(
+    name, function, requires=(), params=None, cache=False, pool=None
+):
+    return {
+        "name": name,
+        "function": function,
+        "requires": list(requires),
+        "params": {} if params is None else dict(params),
+        "cache": cache,
+        "pool": pool,
+    }
+
+
+def sort_pipeline_stages(stages):
+    # Topological order that keeps the given order where possible
+    stage_map = {}
+    for s in stages:
+        if s["name"] in stage_map:
+            raise ValueError(f'Duplicate stage name "{s["name"]}".')
+        stage_map[s["name"]] = s
+    for s in stages:
+        for name in s["requires"]:
+            if name not in stage_map:
+                raise KeyError(f'Stage "{s["name"]}" requires unknown stage "{name}".')
+    ordered = []
+    visited = {}
+
+    def visit(s):
+        state = visited.get(s["name"])
+        if state == "done":
+            return
+        if state == "active":
+            raise ValueError(f'Pipeline contains a cycle through stage "{s["name"]}".')
+        visited[s["name"]] = "active"
+        for name in s["requires"]:
+            visit(stage_map[name])
+        visited[s["name"]] = "done"
+        ordered.append(s)
+
+    for s in stages:
+        visit(s)
+    return ordered
+
+
+def get_function_fingerprint(function):
+    if isinstance(function, functools.partial):
+        # The wrapped function together with the bound arguments
+        bound = repr((function.args, sorted(function.keywords.items())))
+        return get_function_fingerprint(function.func) + bound
+    modules = [sys.modules[__name__]]
+    module = sys.modules.get(getattr(function, "__module__", None))
+    if module is not None and module not in modules:
+        modules.append(module)
+    sources = {}
+    collect_code_sources(function, modules, sources)
+    serialized = json.dumps(sources, sort_keys=True)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def collect_code_sources(function, modules, sources):
+    function = inspect.unwrap(function)
+    name = getattr(function, "__qualname__", repr(function))
+    key = f"{getattr(function, '__module__', None)}.{name}"
+    if key in sources:
+        return
+    sources[key] = get_code_source(function)
+    if inspect.isclass(function):
+        members = [
+            inspect.unwrap(getattr(m, "__func__", m)) for m in vars(function).values()
+        ]
+        codes = [m.__code__ for m in members if inspect.isfunction(m)]
+    elif inspect.isfunction(function):
+        codes = [function.__code__]
+    else:
+        return
+    module_names = {module.__name__ for module in modules}
+    namespace = sys.modules[function.__module__].__dict__
+    for name in get_code_names(codes):
+        values = [namespace.get(name)] + [getattr(m, name, None) for m in modules]
+        for value in values:
+            if isinstance(value, functools.partial):
+                value = value.func
+            if inspect.isfunction(value) or inspect.isclass(value):
+                if value.__module__ in module_names:
+                    collect_code_sources(value, modules, sources)
+            elif value is not None and not inspect.ismodule(value):
+                # Constants such as lists of columns, skipped if they hold runtime state
+                try:
+                    sources[f"{function.__module__}.{name}"] = json.dumps(
+                        value, sort_keys=True
+                    )
+                except (TypeError, ValueError):
+                    pass
+
+
+def get_code_names(codes):
+    # Global and attribute names used by code objects, including nested functions and lambdas
+    names = set()
+    codes = list(codes)
+    while codes:
+        code = codes.pop()
+        names.update(code.co_names)
+        codes.extend(c for c in code.co_consts if inspect.iscode(c))
+    return sorted(names)
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_source(function):
+    try:
+        return inspect.getsource(function)
+    except (OSError, TypeError):
+        return f"{getattr(function, '__module__', None)}.{function.__qualname__}"
+
+
+def compute_stage_fingerprint(s, required_fingerprints):
+    data = {
+        "name": s["name"],
+        "function": get_function_fingerprint(s["function"]),
+        "params": s["params"],
+        "requires": required_fingerprints,
+    }
+    serialized = json.dumps(data, sort_keys=True, default=repr)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def get_result_filepaths(result):
+    filepaths = [result] if isinstance(result, str) else result
+    if not isinstance(filepaths, (list, tuple)) or not all(
+        isinstance(filepath, str) for filepath in filepaths
+    ):
+        raise TypeError("A cached stage must return a filepath or a list of filepaths.")
+    return list(filepaths)
+
+
+def get_file_stats(filepaths):
+    stats = []
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return None
+        stats.append([os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns])
+    return stats
+
+
+def get_stage_state_filepath(state_dir, name):
+    return os.path.join(state_dir, *name.split("/")) + ".pickle"
+
+
+def read_stage_state(state_dir, name):
+    try:
+        with open(get_stage_state_filepath(state_dir, name), "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def write_stage_state(state_dir, name, fingerprint, result):
+    state = {
+        "fingerprint": fingerprint,
+        "files": get_file_stats(get_result_filepaths(result)),
+        "result": result,
+    }
+    filepath = get_stage_state_filepath(state_dir, name)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    temp_filepath = f"{filepath}.tmp{os.getpid()}"
+    with open(temp_filepath, "wb") as f:
+        pickle.dump(state, f)
+    os.replace(temp_filepath, filepath)
+
+
+def plan_pipeline(stages, state_dir, force=False):
+    # Decides without running anything which stages run, which are skipped and which are unused
+    ordered = sort_pipeline_stages(stages)
+    fingerprints = {}
+    stale = {}
+    stored = {}
+    for s in ordered:
+        name = s["name"]
+        fingerprints[name] = compute_stage_fingerprint(
+            s, [fingerprints[r] for r in s["requires"]]
+        )
+        stale[name] = force or any(stale[r] for r in s["requires"])
+        if s["cache"] and not stale[name]:
+            state = read_stage_state(state_dir, name)
+            if (
+                state is None
+                or state["fingerprint"] != fingerprints[name]
+                or state["files"] is None
+                or get_file_stats(get_result_filepaths(state["result"]))
+                != state["files"]
+            ):
+                stale[name] = True
+            else:
+                stored[name] = state["result"]
+
+    # Cached stages that are stale run, together with all uncached stages they depend on
+    stage_map = {s["name"]: s for s in ordered}
+    to_run = set()
+    pending = [s["name"] for s in ordered if s["cache"] and stale[s["name"]]]
+    while pending:
+        name = pending.pop()
+        if name in to_run:
+            continue
+        to_run.add(name)
+        pending.extend(r for r in stage_map[name]["requires"] if r not in stored)
+    statuses = {}
+    for s in ordered:
+        name = s["name"]
+        if name in to_run:
+            statuses[name] = "run"
+        elif name in stored:
+            statuses[name] = "skip"
+        else:
+            statuses[name] = "unused"
+    return {
+        "stages": ordered,
+        "fingerprints": fingerprints,
+        "statuses": statuses,
+        "stored": stored,
+    }
+
+
+def run_stage(s, args, state_dir, fingerprint):
+    with stage(s["name"]):
+        start = time.perf_counter()
+        result = s["function"](*args, **s["params"])
+        if s["cache"]:
+            write_stage_state(state_dir, s["name"], fingerprint, result)
+        return result, time.perf_counter() - start
+
+
+def run_pipeline(
+    stages,
+    state_dir,
+    max_workers=4,
+    pool_sizes=None,
+    force=False,
+    dry_run=False,
+    verbose=True,
+):
+    plan = plan_pipeline(stages, state_dir, force)
+    statuses = plan["statuses"]
+    if verbose:
+        counts = {key: list(statuses.values()).count(key) for key in ["run", "skip"]}
+        print(
+            f"Pipeline with {len(statuses)} stages: {counts['run']} to run, "
+            f"{counts['skip']} up to date."
+        )
+    if dry_run:
+        return {name: {"status": status} for name, status in statuses.items()}
+
+    to_run = [s for s in plan["stages"] if statuses[s["name"]] == "run"]
+    results = dict(plan["stored"])
+    summary = {name: {"status": status} for name, status in statuses.items()}
+    waiting_for = {s["name"]: set(s["requires"]) - set(results) for s in to_run}
+    consumers = {s["name"]: 0 for s in plan["stages"]}
+    for s in to_run:
+        for name in s["requires"]:
+            consumers[name] += 1
+    pool_sizes = {} if pool_sizes is None else pool_sizes
+    pool_usage = {}
+    queue = list(to_run)
+    running = {}
+    stage_map = {s["name"]: s for s in plan["stages"]}
+
+    def release(name):
+        # Results of uncached stages can be large and are dropped once all consumers are finished
+        consumers[name] -= 1
+        if consumers[name] == 0 and not stage_map[name]["cache"]:
+            results.pop(name, None)
+
+    def block_dependents(name):
+        for s in queue[:]:
+            if name in s["requires"]:
+                queue.remove(s)
+                summary[s["name"]]["status"] = "blocked"
+                for required_name in s["requires"]:
+                    release(required_name)
+                block_dependents(s["name"])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while queue or running:
+            for s in queue[:]:
+                pool = s["pool"]
+                if waiting_for[s["name"]] or len(running) >= max_workers:
+                    continue
+                if pool is not None and pool_usage.get(pool, 0) >= pool_sizes.get(
+                    pool, max_workers
+                ):
+                    continue
+                queue.remove(s)
+                pool_usage[pool] = pool_usage.get(pool, 0) + 1
+                args = [results[name] for name in s["requires"]]
+                if verbose:
+                    print(f'Starting stage "{s["name"]}".')
+                fingerprint = plan["fingerprints"][s["name"]]
+                future = executor.submit(run_stage, s, args, state_dir, fingerprint)
+                running[future] = s
+            if not running:
+                raise ValueError("No stage can start, check the pool sizes.")
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                s = running.pop(future)
+                name = s["name"]
+                pool_usage[s["pool"]] -= 1
+                for required_name in s["requires"]:
+                    release(required_name)
+                try:
+                    result, duration = future.result()
+                except Exception as e:
+                    summary[name].update(status="failed", error=repr(e))
+                    if verbose:
+                        print(f'Stage "{name}" failed: {e!r}')
+                    block_dependents(name)
+                    continue
+                summary[name].update(status="ran", time=duration)
+                if verbose:
+                    print(f'Finished stage "{name}" in {duration:.1f} s.')
+                if consumers[name] > 0 or s["cache"]:
+                    results[name] = result
+                for other in waiting_for.values():
+                    other.discard(name)
+    return summary